@@ -0,0 +1,94 @@
+"""
+Throughput of the heart-rate alert batch processing (Kafka.process_batch) on synthetic telemetry.
+Kafka, SES and the database are not used: the messages are built in memory and alerts are counted.
+
+    python benchmarks/hr_alert_batch_benchmark.py --messages 200000 --bikes 50 --abnormal 0.01
+"""
+import argparse
+import builtins
+import json
+import os
+import random
+import sys
+import time
+from datetime import date, datetime, timezone
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [os.path.join(root, 'hr_alerts'), root]
+for name, value in {'DB_HOST': 'localhost', 'DB_PORT': '5432', 'DB_USER': 'bench', 'DB_PASSWORD': 'bench', 'DB_NAME': 'bench'}.items():
+    os.environ.setdefault(name, value)
+
+import confluent_kafka
+
+from hr_alert_helpers import Kafka, RiderProfiles, Sessions
+
+
+class CountingDispatcher():
+
+    def __init__(self):
+        self.submitted = 0
+
+    def submit(self, recipient, age, heart_rate, name, log_time) -> bool:
+        self.submitted += 1
+        return True
+
+
+def make_messages(count: int, bikes: int, abnormal: float, rides_every: int) -> list:
+    """
+    A SYSTEM log per bike then telemetry and ride logs round robin across the bikes. Riders are 40 or 41,
+    so their healthy range tops out at 179 or 180 BPM; abnormal is the share of telemetry readings above it.
+    Every rides_every messages one bike ends its ride and starts a new one
+    """
+    random.seed(1)
+    date_of_birth = int(datetime(date.today().year - 41, 1, 1, tzinfo=timezone.utc).timestamp() * 1000)
+    log_time = '2022-10-13 10:00:00.000000'
+    def message(bike: int, log: str) -> confluent_kafka.Message:
+        return confluent_kafka.Message(topic='rides', partition=bike % 6, key=f'SN{bike:04d}'.encode(),
+            value=json.dumps({'log': log}).encode(), timestamp=(confluent_kafka.TIMESTAMP_CREATE_TIME, 1665655200000))
+    def system_log(bike: int) -> str:
+        user = {'user_id': bike, 'name': f'Rider {bike}', 'gender': 'female', 'address': '1 Road,London,N1 1AA',
+            'date_of_birth': date_of_birth, 'email_address': f'rider{bike}@example.com', 'height_cm': 170, 'weight_kg': 60,
+            'account_create_date': 1600000000000, 'bike_serial': f'SN{bike:04d}', 'original_source': 'offline'}
+        return f'{log_time} mendoza v9: [SYSTEM] data = {json.dumps(user)}'
+
+    messages = [message(bike, system_log(bike)) for bike in range(bikes)]
+    for i in range(count):
+        bike = i % bikes
+        if rides_every and i % rides_every == rides_every - 1:
+            messages.append(message(bike, '--------- beginning of main'))
+            messages.append(message(bike, system_log(bike)))
+        elif i % 2 == 0:
+            messages.append(message(bike, f'{log_time} mendoza v9: [INFO]: Ride - duration = {i // 2}.0; resistance = 40'))
+        else:
+            heart_rate = random.randint(185, 200) if random.random() < abnormal else random.randint(60, 170)
+            messages.append(message(bike, f'{log_time} mendoza v9: [INFO]: Telemetry - hrt = {heart_rate}; rpm = 50; power = 12.34567890'))
+    return messages
+
+
+def run(messages: list, batch_size: int) -> tuple:
+    sessions, profiles, dispatcher = Sessions(), RiderProfiles(), CountingDispatcher()
+    start = time.perf_counter()
+    for i in range(0, len(messages), batch_size):
+        Kafka.process_batch(messages[i:i + batch_size], sessions, profiles, dispatcher, 1000.0)
+    return time.perf_counter() - start, dispatcher.submitted
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--messages', type=int, default=200000)
+    parser.add_argument('--bikes', type=int, default=50)
+    parser.add_argument('--batch-size', type=int, default=500)
+    parser.add_argument('--abnormal', type=float, default=0.01, help='share of abnormal telemetry readings')
+    parser.add_argument('--rides-every', type=int, default=5000, help='messages between two ride changes, 0 for none')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    messages = make_messages(args.messages, args.bikes, args.abnormal, args.rides_every)
+    # the alert pipeline logs every alert decision and SLA breach
+    print_ = builtins.print
+    builtins.print = lambda *a, **k: None
+    timings = [run(messages, args.batch_size) for _ in range(args.repeat)]
+    builtins.print = print_
+    best, alerts = min(timings)
+    print(f'{len(messages)} messages, {args.bikes} bikes, batches of {args.batch_size}, {args.abnormal:.0%} abnormal: '
+        f'best of {args.repeat} {best:.3f}s, {len(messages) / best:,.0f} msgs/s, {best / len(messages) * 1e6:.2f} us/msg, {alerts} alerts')
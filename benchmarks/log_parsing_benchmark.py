@@ -0,0 +1,68 @@
+"""
+Micro-benchmarks of the shared bike log parser (shared/log_parsing.py), per log line, on a synthetic stream
+with the usual mix of lines: a SYSTEM log per ride, then a ride and a telemetry log every half second.
+
+    python benchmarks/log_parsing_benchmark.py --lines 100000 --ride-seconds 600
+"""
+import argparse
+import json
+import os
+import sys
+import timeit
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [root]
+
+from shared.log_parsing import BikeKeys, LogParser
+
+
+def make_logs(count: int, ride_seconds: int) -> tuple:
+    """
+    Log lines of back to back rides of ride_seconds on one bike each, with their message keys and partitions
+    """
+    user = {'user_id': 3962, 'name': 'Katherine Goodwin', 'gender': 'female', 'address': 'Flat 27,Burke ports,Eastport,SO1 6XB',
+        'date_of_birth': -208310400000, 'email_address': 'katherine.goodwin@hotmail.com', 'height_cm': 168, 'weight_kg': 68,
+        'account_create_date': 1660521600000, 'bike_serial': 'SN0000', 'original_source': 'offline'}
+    logs, keys = [], []
+    ride = 0
+    while len(logs) < count:
+        key = f'SN{ride % 1000:04d}'.encode()
+        logs += ['--------- beginning of a new ride',
+            f'2022-10-13 10:07:41.705773 mendoza v9: [SYSTEM] data = {json.dumps({**user, "user_id": ride})}']
+        for second in range(ride_seconds):
+            log_time = f'2022-10-13 {10 + second // 3600:02d}:{second // 60 % 60:02d}:{second % 60:02d}'
+            logs += [f'{log_time}.207362 mendoza v9: [INFO]: Ride - duration = {second}.0; resistance = 30',
+                f'{log_time}.707362 mendoza v9: [INFO]: Telemetry - hrt = {60 + second % 120}; rpm = 49; power = 11.639964517']
+        logs.append('--------- beginning of main')
+        keys += [key] * (ride_seconds * 2 + 3)
+        ride += 1
+    return logs[:count], keys[:count], [int(key[2:]) % 6 for key in keys[:count]]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--lines', type=int, default=100000)
+    parser.add_argument('--ride-seconds', type=int, default=600)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    logs, keys, partitions = make_logs(args.lines, args.ride_seconds)
+    records = LogParser.parse_many(logs)
+    log_times = [record.time for record in records]
+    cases = {
+        'classify': lambda: [LogParser.classify(log) for log in logs],
+        'parse': lambda: [LogParser.parse(log) for log in logs],
+        'parse_many': lambda: LogParser.parse_many(logs),
+        'to_columns': lambda: LogParser.to_columns(records, ['user_id', 'bike_serial']),
+        'find_heart_rates': lambda: LogParser.find_heart_rates(logs),
+        'find_session_markers': lambda: LogParser.find_session_markers(logs),
+        'get_log_time': lambda: [LogParser.get_log_time(log) for log in logs],
+        'get_timestamp': lambda: [LogParser.get_timestamp(log_time) for log_time in log_times],
+        'get_timestamps': lambda: LogParser.get_timestamps(log_times),
+        'get_bike_key': lambda: [BikeKeys.get_bike_key(key, partition) for key, partition in zip(keys, partitions)],
+        'get_bike_keys': lambda: BikeKeys.get_bike_keys(keys, partitions),
+    }
+    print(f'{len(logs)} lines, rides of {args.ride_seconds}s, best of {args.repeat}')
+    for name, case in cases.items():
+        best = min(timeit.repeat(case, number=1, repeat=args.repeat))
+        print(f'{name:<22}{best * 1e3:9.2f} ms {best / len(logs) * 1e9:9.0f} ns/line')
@@ -1,17 +1,22 @@
-from daily_report_helper import Convert, Email, Graph
+from daily_report_helper import Convert, Email, Graph, Period
+from shared.database import Database
 
 
 def handler(event, context):
+    start_date, end_date, granularity = Period.get_report_period(event)
+    recipients = Email.get_recipients(event)
     con = Graph.create_connection()
-    # Graph.create_directory_for_images()
-    graphs = Graph.get_graphs(con)
-    graph_names = Graph.get_graph_names()
-    Convert.output_graphs_to_png(graphs, graph_names)
-    number_of_rides = Graph.get_number_of_rides(con)
-    number_of_unique_riders = Graph.get_unique_riders(con)
-    report = Convert.get_report(graph_names, number_of_rides, number_of_unique_riders)
-    Convert.convert_html_to_pdf(report, '/tmp/report.pdf')
-    Email.send_report()
-
-
-
+    rollup = Graph.get_rollup(con, start_date, end_date)
+    riders = Graph.get_riders(con, start_date, end_date)
+    rollup_trend = Graph.get_rollup_trend(con, start_date, end_date, granularity)
+    con.close()
+    Database.print_stats()
+    graphs = Graph.get_graphs(rollup, riders, rollup_trend)
+    graph_names = Graph.get_graph_names(rollup_trend)
+    graph_images = Convert.render_graphs_to_png(graphs, graph_names)
+    number_of_rides = Graph.get_number_of_rides(rollup)
+    number_of_unique_riders = Graph.get_unique_riders(riders)
+    report_name = Period.get_report_name(start_date, end_date)
+    report = Convert.get_report(graph_images, number_of_rides, number_of_unique_riders, report_name, Period.get_period_label(start_date, end_date))
+    report_pdf = Convert.convert_html_to_pdf(report)
+    Email.send_report(report_pdf, recipients, report_name)
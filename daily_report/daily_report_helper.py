@@ -1,162 +1,298 @@
+import base64
+import multiprocessing
 import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from email.mime.application import MIMEApplication
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
+from datetime import date, timedelta
+from io import BytesIO
 from os import getenv
 
 import boto3
 import numpy as np
 import pandas as pd
 import plotly.express as px
+import plotly.graph_objects as go
+import plotly.io as pio
+from plotly.subplots import make_subplots
 import sqlalchemy
 from botocore.exceptions import ClientError
 from dotenv import load_dotenv
-from sqlalchemy import create_engine
+from sqlalchemy import text
 from xhtml2pdf import pisa
 
+from shared.database import Database
+
+
+class Period():
+
+    granularities = ('day', 'week', 'month')
+
+    @staticmethod
+    def get_report_period(event: dict) -> tuple:
+        """
+        Reads the report period from the triggering event:
+        granularity - trend bucket size, one of day, week or month (default day)
+        end_date - last day of the report, YYYY-MM-DD (default today)
+        start_date - first day of the report, YYYY-MM-DD (default the start of the
+        period covering the last `periods` buckets up to end_date, `periods` default 1)
+        Returns (start_date, end_date, granularity)
+        """
+        event = event or {}
+        granularity = event.get('granularity', 'day')
+        if granularity not in Period.granularities:
+            raise ValueError(f'granularity must be one of {Period.granularities}, got {granularity}')
+
+        end_date = date.fromisoformat(event['end_date']) if event.get('end_date') else date.today()
+        if event.get('start_date'):
+            start_date = date.fromisoformat(event['start_date'])
+        else:
+            start_date = Period.get_period_start(end_date, granularity, int(event.get('periods', 1)) - 1)
+        if start_date > end_date:
+            raise ValueError(f'start_date {start_date} is after end_date {end_date}')
+        return start_date, end_date, granularity
+
+    @staticmethod
+    def get_period_start(day: date, granularity: str, periods_back: int=0) -> date:
+        """
+        Returns the first day of the day, week (Monday) or month containing the given day,
+        stepped back by periods_back periods
+        """
+        if granularity == 'day':
+            return day - timedelta(days=periods_back)
+        if granularity == 'week':
+            return day - timedelta(days=day.weekday() + 7 * periods_back)
+        month_index = day.year * 12 + day.month - 1 - periods_back
+        return date(month_index // 12, month_index % 12 + 1, 1)
+
+    @staticmethod
+    def get_report_name(start_date: date, end_date: date) -> str:
+        """
+        Returns the report name used in its heading and the email subject
+        """
+        if start_date == end_date:
+            return 'Daily Report'
+        return f'Report {start_date:%d-%m-%Y} to {end_date:%d-%m-%Y}'
+
+    @staticmethod
+    def get_period_label(start_date: date, end_date: date) -> str:
+        """
+        Returns how the report period reads in the report summary
+        """
+        if start_date == end_date == date.today():
+            return 'today'
+        if start_date == end_date:
+            return f'on {start_date:%d-%m-%Y}'
+        return f'between {start_date:%d-%m-%Y} and {end_date:%d-%m-%Y}'
+
 
 class Graph():
 
     load_dotenv()
-    
-    db_host = getenv('DB_HOST')
-    db_port = getenv('DB_PORT')
-    db_user = getenv('DB_USER')
-    db_password = getenv('DB_PASSWORD')
-    db_name = getenv('DB_NAME')
+
+    # created on first use and kept by warm Lambda containers, render worker processes never connect
+    engine = None
 
     @staticmethod
     def create_connection() -> sqlalchemy.engine.Connection:
         """
-        Creates an SQLAlchemy connection for a specified set of user,
-        password, hostname, port and database_name
+        Returns a connection from the report engine's pool
         """
-        engine = create_engine(f'postgresql://{Graph.db_user}:{Graph.db_password}@{Graph.db_host}:{Graph.db_port}/{Graph.db_name}')
-        con = engine.connect()
+        if Graph.engine is None:
+            Graph.engine = Database.create_engine('daily_report')
+        con = Graph.engine.connect()
         return con
 
     @staticmethod
-    def get_number_of_rides(con: sqlalchemy.engine.Connection) -> np.int64:
+    def get_rollup(con: sqlalchemy.engine.Connection, start_date: date, end_date: date) -> pd.DataFrame:
         """
-        Returns the number of rides taken in the last 24 hrs
+        Returns the daily rollup rows between the start and end dates (inclusive): one per day, gender
+        and age bin, with the number of rides, distinct riders and the summed power and heart rate of those rides
         """
-        query = f"""
-        SELECT COUNT(*) AS number_of_rides 
-        FROM yusra_stories_production.rides
-        WHERE start_time > (NOW() - interval '24 hour');
+        query = text("""
+        SELECT day, gender, age_bin, ride_count, distinct_riders, total_power_kilojoules, total_heart_rate_bpm
+        FROM yusra_stories_production.daily_rollup
+        WHERE day BETWEEN :start_date AND :end_date;
+        """)
+        return pd.read_sql_query(query, con, params={'start_date': start_date, 'end_date': end_date})
+
+    @staticmethod
+    def get_riders(con: sqlalchemy.engine.Connection, start_date: date, end_date: date) -> pd.DataFrame:
+        """
+        Returns the number of distinct riders between the start and end dates (inclusive) per gender and
+        age bin (binned as in the daily rollup). A rider counts once however many days they rode. Read from
+        the rides recorded in the rollup, through their (day, user_id) index
+        """
+        query = text("""
+        SELECT COALESCE(users.gender, 'Unknown') AS gender,
+            CASE
+                WHEN users.age IS NULL OR users.age <= 0 THEN 'Unknown'
+                WHEN users.age <= 18 THEN 'Kids (< 18)'
+                WHEN users.age <= 26 THEN 'Young Adults (18-25)'
+                WHEN users.age <= 39 THEN 'Adults (25-40)'
+                WHEN users.age <= 65 THEN 'Middle Age (40-65)'
+                ELSE 'Seniors (65+)'
+            END AS age_bin,
+            COUNT(*) AS number_of_riders
+        FROM (
+            SELECT DISTINCT user_id
+            FROM yusra_stories_production.daily_rollup_rides
+            WHERE day BETWEEN :start_date AND :end_date
+        ) AS riders
+        LEFT JOIN (SELECT DISTINCT ON (user_id) user_id, gender, age FROM yusra_stories_production.users) AS users
+        USING (user_id)
+        GROUP BY 1, 2;
+        """)
+        return pd.read_sql_query(query, con, params={'start_date': start_date, 'end_date': end_date})
+
+    @staticmethod
+    def get_rollup_trend(con: sqlalchemy.engine.Connection, start_date: date, end_date: date, granularity: str) -> pd.DataFrame:
+        """
+        Returns the daily rollup between the start and end dates summed into day, week or month periods:
+        the number of rides and distinct riders, and the average power and heart rate of a ride in each period
+        """
+        query = text("""
+        WITH rides AS (
+            SELECT CAST(date_trunc(:granularity, day) AS DATE) AS period, SUM(ride_count) AS ride_count,
+            SUM(total_power_kilojoules) AS total_power_kilojoules, SUM(total_heart_rate_bpm) AS total_heart_rate_bpm
+            FROM yusra_stories_production.daily_rollup
+            WHERE day BETWEEN :start_date AND :end_date
+            GROUP BY 1
+        ), riders AS (
+            SELECT CAST(date_trunc(:granularity, day) AS DATE) AS period, COUNT(DISTINCT user_id) AS distinct_riders
+            FROM yusra_stories_production.daily_rollup_rides
+            WHERE day BETWEEN :start_date AND :end_date
+            GROUP BY 1
+        )
+        SELECT period, ride_count, COALESCE(distinct_riders, 0) AS distinct_riders,
+        ROUND(total_power_kilojoules / ride_count) AS average_power_kj, ROUND(total_heart_rate_bpm / ride_count) AS average_heart_rate_bpm
+        FROM rides
+        LEFT JOIN riders USING (period)
+        ORDER BY period;
+        """)
+        return pd.read_sql_query(query, con, params={'start_date': start_date, 'end_date': end_date, 'granularity': granularity})
+
+    @staticmethod
+    def get_known_riders(rollup: pd.DataFrame) -> pd.DataFrame:
+        """
+        Returns the rollup (or riders) rows for riders found in the users table
         """
-        number_of_rides = pd.read_sql_query(query, con)
-        return number_of_rides._get_value(0,"number_of_rides")
+        return rollup[rollup['gender'] != 'Unknown']
+
+    @staticmethod
+    def get_number_of_rides(rollup: pd.DataFrame) -> np.int64:
+        """
+        Returns the number of rides taken in the report period
+        """
+        return np.int64(rollup['ride_count'].sum())
         
     @staticmethod
-    def get_unique_riders(con: sqlalchemy.engine.Connection) -> np.int64:
+    def get_unique_riders(riders: pd.DataFrame) -> np.int64:
         """
-        Returns the number of unique riders in the last 24 hrs
+        Returns the number of unique riders in the report period
         """
-        query = f"""
-        WITH riders AS (
-        SELECT DISTINCT (user_id), name
-        FROM yusra_stories_production.users
-        JOIN yusra_stories_production.rides
-        USING (user_id)
-        WHERE start_time > (NOW() - interval '24 hour')
-        )
-        SELECT COUNT(*) AS number_of_riders
-        FROM riders
+        return np.int64(Graph.get_known_riders(riders)['number_of_riders'].sum())
+
+    @staticmethod
+    def has_trend(rollup_trend: pd.DataFrame) -> bool:
+        """
+        Returns whether the report period spans more than one trend period
         """
-        number_of_unique_riders = pd.read_sql_query(query, con)
-        return number_of_unique_riders._get_value(0,"number_of_riders")
+        return rollup_trend.shape[0] > 1
 
     @staticmethod
-    def get_graphs(con: sqlalchemy.engine.Connection) -> list:
+    def get_graphs(rollup: pd.DataFrame, riders: pd.DataFrame, rollup_trend: pd.DataFrame) -> list:
         """
-        Returns a list of plotly graphs
+        Returns a list of plotly graphs, with the trend graphs when the period spans more than one trend period
         """
-        riders_gender_split_fig = Graph.get_rider_gender_split_fig(con)
-        ages_of_riders_fig = Graph.get_age_of_riders_fig(con)
-        riders_average_power_and_heart_rate_fig = Graph.get_average_ride_stats_fig(con)
+        riders_gender_split_fig = Graph.get_rider_gender_split_fig(riders)
+        ages_of_riders_fig = Graph.get_age_of_riders_fig(riders)
+        riders_average_power_and_heart_rate_fig = Graph.get_average_ride_stats_fig(rollup)
         graphs = [riders_gender_split_fig, ages_of_riders_fig, riders_average_power_and_heart_rate_fig]
+        if Graph.has_trend(rollup_trend):
+            graphs += [Graph.get_rides_trend_fig(rollup_trend), Graph.get_average_ride_stats_trend_fig(rollup_trend)]
         return graphs
 
     @staticmethod
-    def get_rider_gender_split_fig(con: sqlalchemy.engine.Connection):
+    def get_rider_gender_split_fig(riders: pd.DataFrame):
         """
-        Given an SQLAlchemy connection
-        Returns a pie chart of the gender split of riders in the last 24 hrs
-        """
-        query = f"""
-        WITH riders AS (
-        SELECT DISTINCT (user_id), name, gender, age
-        FROM yusra_stories_production.users
-        JOIN yusra_stories_production.rides
-        USING (user_id)
-        WHERE start_time > (NOW() - interval '24 hour')
-        )
-        SELECT gender, COUNT(*) AS number_of_riders
-        FROM riders
-        GROUP BY gender;
+        Given the riders of the report period
+        Returns a pie chart of the gender split of riders in the report period
         """
-        riders_gender_split = pd.read_sql_query(query, con)
-        riders_gender_split_fig = px.pie(riders_gender_split, values='number_of_riders', names='gender', title=f'Gender split of riders of the past day', color_discrete_sequence=px.colors.sequential.Greens_r)
+        known_riders = Graph.get_known_riders(riders)
+        riders_gender_split = known_riders.groupby('gender')[['number_of_riders']].sum().reset_index()
+        riders_gender_split_fig = px.pie(riders_gender_split, values='number_of_riders', names='gender', title=f'Gender split of riders', color_discrete_sequence=px.colors.sequential.Greens_r)
         return riders_gender_split_fig
 
     @staticmethod
-    def get_age_of_riders_fig(con: sqlalchemy.engine.Connection) :
+    def get_age_of_riders_fig(riders: pd.DataFrame) :
         """
-        Given an SQLAlchemy connection
-        Returns a pie chart grouping the age of riders in the last 24 hrs
+        Given the riders of the report period
+        Returns a pie chart grouping the age of riders in the report period
         """
-        query = f"""
-            SELECT DISTINCT (user_id), age
-            FROM yusra_stories_production.users
-            JOIN yusra_stories_production.rides
-            USING (user_id)
-            WHERE start_time > (NOW() - interval '24 hour')
-            ORDER BY age ASC;
-        """
-        ages_of_riders = pd.read_sql_query(query, con)
-        groupby_age_df = Graph.group_df_by_age(ages_of_riders)
-        ages_of_riders_fig = px.pie(groupby_age_df, values='user_id', names='age', title=f'Age of riders', color_discrete_sequence=px.colors.sequential.Greens_r)
+        known_riders = riders[riders['age_bin'] != 'Unknown']
+        groupby_age_df = known_riders.groupby('age_bin')[['number_of_riders']].sum().sort_values(by = 'number_of_riders', ascending = False).reset_index()
+        ages_of_riders_fig = px.pie(groupby_age_df, values='number_of_riders', names='age_bin', title=f'Age of riders', color_discrete_sequence=px.colors.sequential.Greens_r)
         return ages_of_riders_fig
 
     @staticmethod
-    def group_df_by_age(df: pd.DataFrame):
+    def get_average_ride_stats_fig(rollup: pd.DataFrame) :
         """
-        Segments age column into age bins and returns a dataframe grouped by age
+        Given the daily rollup
+        Returns a scatter chart of the average power against the average heart rate
+        per gender and age group in the report period
         """
-        age_bins =  pd.cut(df['age'], bins = [0,18,26,39,65,np.inf], labels=["Kids (< 18)","Young Adults (18-25)", "Adults (25-40)", "Middle Age (40-65)", "Seniors (65+)"])
-        groupby_age_df = groupby_age_df = df.groupby([age_bins])[['user_id']].count().sort_values(by = 'user_id', ascending = False).reset_index()
-        return groupby_age_df
+        riders_average_power_and_heart_rate = Graph.get_known_riders(rollup).assign(
+            average_power_kj = lambda df: (df['total_power_kilojoules'] / df['ride_count']).round(),
+            average_heart_rate_bpm = lambda df: (df['total_heart_rate_bpm'] / df['ride_count']).round()
+            )
+        riders_average_power_and_heart_rate_fig = px.scatter(riders_average_power_and_heart_rate, x= 'average_power_kj', y='average_heart_rate_bpm', 
+            color='gender', symbol='age_bin',
+            color_discrete_sequence=px.colors.sequential.Greens_r, 
+            labels=dict(average_power_kj ="Average power (KJ)", average_heart_rate_bpm="Average heart rate (bpm", age_bin="Age"),
+            title = 'Average power vs Average heart rate by gender and age'
+            )
+        return riders_average_power_and_heart_rate_fig
 
     @staticmethod
-    def get_average_ride_stats_fig(con: sqlalchemy.engine.Connection) :
+    def get_rides_trend_fig(rollup_trend: pd.DataFrame):
         """
-        Given an SQLAlchemy connection
-        Returns a bar chart of the average power against the average heart rate
-        per rider in the last 24 hrs
+        Given the rollup trend
+        Returns a line chart of the number of rides and distinct riders in each period
         """
-        query = f"""
-        SELECT user_id, ROUND(AVG(avg_heart_rate_bpm)) AS average_heart_rate_bpm, ROUND(AVG(total_power_kilojoules)) AS average_power_KJ
-        FROM yusra_stories_production.users
-        JOIN yusra_stories_production.rides
-        USING (user_id)
-        WHERE start_time > (NOW() - interval '24 hour')
-        GROUP BY user_id;
+        rides_trend_fig = px.line(rollup_trend, x='period', y=['ride_count', 'distinct_riders'], markers=True,
+            color_discrete_sequence=px.colors.sequential.Greens_r,
+            labels=dict(period="Period", value="Count", variable=""),
+            title = 'Rides and riders over the period'
+            )
+        return rides_trend_fig
+
+    @staticmethod
+    def get_average_ride_stats_trend_fig(rollup_trend: pd.DataFrame):
         """
-        riders_average_power_and_heart_rate = pd.read_sql_query(query, con)
-        riders_average_power_and_heart_rate_fig = px.scatter(riders_average_power_and_heart_rate, x= 'average_power_kj', y='average_heart_rate_bpm', 
-            color_discrete_sequence=px.colors.sequential.Greens_r, 
-            labels=dict(average_power_kj ="Average power (KJ)", average_heart_rate_bpm="Average heart rate (bpm"),
-            title = 'Average power vs Average heart rate for each rider'
+        Given the rollup trend
+        Returns a line chart of the average power and heart rate of a ride in each period
+        """
+        average_ride_stats_trend_fig = px.line(rollup_trend, x='period', y=['average_power_kj', 'average_heart_rate_bpm'], markers=True,
+            color_discrete_sequence=px.colors.sequential.Greens_r,
+            labels=dict(period="Period", value="Average per ride", variable=""),
+            title = 'Average power (KJ) and heart rate (bpm) over the period'
             )
-        return riders_average_power_and_heart_rate_fig
+        return average_ride_stats_trend_fig
 
     @staticmethod
-    def get_graph_names() -> list:
+    def get_graph_names(rollup_trend: pd.DataFrame) -> list:
         """
-        Returns a list of figure names
+        Returns a list of figure names, matching the graphs returned by get_graphs
         """
         graph_names = ['riders_gender_split_fig', 'ages_of_riders_fig', 'riders_average_power_and_heart_rate_fig']
+        if Graph.has_trend(rollup_trend):
+            graph_names += ['rides_trend_fig', 'average_ride_stats_trend_fig']
         return graph_names
 
 
@@ -164,94 +300,127 @@ class Graph():
 
 class Convert():
 
+    render_workers = int(getenv('RENDER_WORKERS', os.cpu_count() or 1))
+    kaleido_warm = False
+
     @staticmethod
-    def output_graphs_to_png(graphs: list, graph_names: list):
+    def render_graphs_to_png(graphs: list, graph_names: list) -> list:
         """
-        Given a list of graphs and graph name
-        Performs parallel itteration to save each graph as a png given its 
-        corresponding graph name
+        Renders each graph to png bytes in this process, with its one kaleido instance started once
+        and kept warm across the graphs and across invocations of the same Lambda container.
+        Logs the render time of each graph and in total
         """
+        start = time.perf_counter()
+        Convert.warm_kaleido()
+        images = []
         for graph, graph_name in zip(graphs, graph_names):
-                Convert.save_graph_as_png(graph, graph_name)
-            
-    
-    @staticmethod       
-    def save_graph_as_png(fig, fig_name: str):
+            image, render_seconds = Convert.render_png(graph.to_json())
+            print(f'Rendered {graph_name} in {render_seconds:.2f}s')
+            images.append(image)
+        print(f'Rendered {len(graphs)} graphs in {time.perf_counter() - start:.2f}s')
+        return images
+
+    @staticmethod
+    def warm_kaleido():
+        """
+        Starts kaleido by rendering an empty figure, so its startup is paid once per process
+        rather than on the first real graph. A no-op once kaleido is running
+        """
+        if Convert.kaleido_warm:
+            return
+        Convert.kaleido_warm = True
+        pio.to_image(go.Figure(), format='png', width=10, height=10)
+
+    @staticmethod
+    def render_png(graph_json: str) -> tuple:
         """
-        Converts a plotly graph input to a png image stored in the temp directory
+        Renders a plotly graph (as JSON) to png bytes, returning the bytes and the render time in seconds
         """
-        fig.write_image(f"/tmp/{fig_name}.png")
+        start = time.perf_counter()
+        image = pio.to_image(pio.from_json(graph_json), format='png')
+        return image, time.perf_counter() - start
 
 
     @staticmethod 
-    def graph_block_template(file_name: str) -> str:
+    def graph_block_template(image: bytes) -> str:
         """
-        Creates an html string for an image insert for a given figure name
+        Creates an html string for an image insert for a given png, embedded as a data URI
         """
+        encoded_image = base64.b64encode(image).decode('ascii')
         graph_block =  (''
                 
-                    f'<center><img style="height: 400px;" src="/tmp/{file_name}.png"></center>'
+                    f'<center><img style="height: 400px;" src="data:image/png;base64,{encoded_image}"></center>'
                     + '<hr>'
             )                   
     
         return graph_block
 
     @staticmethod 
-    def get_report(graph_names: list, number_of_rides : np.int64, number_of_unique_riders: np.int64) -> str:
+    def get_report(graph_images: list, number_of_rides : np.int64, number_of_unique_riders: np.int64, report_name: str='Daily Report', period_label: str='today') -> str:
         """
         Returns a html string of the report layout containing the graph 
-        image inserts for the input list of graph names 
+        image inserts for the input list of png images 
         """
         graphs_layout = ''
-        for graph_name in graph_names:
-            graphs_layout += Convert.graph_block_template(graph_name)
+        for graph_image in graph_images:
+            graphs_layout += Convert.graph_block_template(graph_image)
         report_layout = (
-            '<h1 align="center"> Deloton Exercise Bikes Daily Report</h1>'
+            f'<h1 align="center"> Deloton Exercise Bikes {report_name}</h1>'
             + '<hr>'
-            + f'<h1 align="center"> Summary: {number_of_rides} rides completed by {number_of_unique_riders} riders today </h1>'
+            + f'<h1 align="center"> Summary: {number_of_rides} rides completed by {number_of_unique_riders} riders {period_label} </h1>'
             + '<hr>'
             + graphs_layout  
         )
         return report_layout
 
     @staticmethod 
-    def convert_html_to_pdf(source_html: str, output_filename: str) -> int:
+    def convert_html_to_pdf(source_html: str) -> bytes:
         """
-        Converts the input source html to a pdf file saved as the 
-        string output filename
+        Converts the input source html to a pdf, generated in memory, and returns its bytes
         """
-        result_file = open(output_filename, "w+b")
+        result_buffer = BytesIO()
 
         pisa_status = pisa.CreatePDF(
                 source_html,           
-                dest=result_file)           
+                dest=result_buffer)           
 
-        result_file.close()           
+        if pisa_status.err:
+            print(f'PDF generation reported {pisa_status.err} errors')
 
-        return pisa_status.err
+        return result_buffer.getvalue()
 
 
 
 class Email():
     SENDER = 'trainee.john.andemeskel@sigmalabs.co.uk'
-    RECIPIENT = 'bicycle-ceo@sigmalabs.co.uk'
-    SUBJECT = 'Deloton Exercise Bikes Daily Report'
+    RECIPIENTS = getenv('REPORT_RECIPIENTS', 'bicycle-ceo@sigmalabs.co.uk').split(',')
+    SUBJECT = 'Deloton Exercise Bikes {report_name}'
     BODY_HTML = """<html>
         <br>Good Afternoon,
-        <br>Attached is the Daily report pdf. 
+        <br>Attached is the {report_name} pdf. 
         <br>Best wishes,
         <br>Yusra stories team
         </html>"""
 
-    BODY_TEXT = 'Good Afternoon,\nAttached is the Daily report pdf.\nBest wishes,\nYusra stories team'
-    ATTACHMENT = '/tmp/report.pdf'
+    BODY_TEXT = 'Good Afternoon,\nAttached is the {report_name} pdf.\nBest wishes,\nYusra stories team'
+    ATTACHMENT_NAME = 'report.pdf'
+    RIDER_SUBJECT = 'Your Deloton ride summary'
+    RIDER_BODY_HTML = """<html>
+        <br>Hi {name},
+        <br>Attached is a summary of your recent rides. 
+        <br>Best wishes,
+        <br>Deloton Exercise Bikes
+        </html>"""
+
+    RIDER_BODY_TEXT = 'Hi {name},\nAttached is a summary of your recent rides.\nBest wishes,\nDeloton Exercise Bikes'
+    RIDER_ATTACHMENT_NAME = 'ride_summary.pdf'
     CHARSET = "utf-8"
     REGION_NAME = 'us-east-1'
 
     @staticmethod
     def create_multipart_message(
-            sender: str, recipient: str, subject: str, html: str=None, text: str=None, attachment: str=None)\
-            -> MIMEMultipart:
+            sender: str, recipient: str, subject: str, html: str=None, text: str=None, attachment: bytes=None,
+            attachment_name: str=None) -> MIMEMultipart:
         """
         Creates a MIME multipart message object.
         Emails, both sender and recipients
@@ -270,38 +439,223 @@ class Email():
         msg_body.attach(textpart)
         msg_body.attach(htmlpart)
 
-        att = MIMEApplication(open(attachment, 'rb').read())
+        att = MIMEApplication(attachment)
 
-        att.add_header('Content-Disposition','attachment',filename=os.path.basename(attachment))
+        att.add_header('Content-Disposition','attachment',filename=attachment_name)
 
         msg.attach(msg_body)
         msg.attach(att)
         return msg
 
     @staticmethod
-    def send_mail() -> dict:
+    def get_recipients(event: dict) -> list:
+        """
+        Returns the report recipients from the triggering event (a list or comma separated string),
+        falling back to REPORT_RECIPIENTS
+        """
+        recipients = (event or {}).get('recipients') or Email.RECIPIENTS
+        if isinstance(recipients, str):
+            recipients = recipients.split(',')
+        return [recipient.strip() for recipient in recipients if recipient.strip()]
+
+    @staticmethod
+    def send_mail(report_pdf: bytes, recipients: list, report_name: str) -> dict:
         """
         Send email to recipients. Sends one mail to all recipients.
         The sender needs to be a verified email in SES.
         """
-        msg = Email.create_multipart_message(Email.SENDER, Email.RECIPIENT, Email.SUBJECT, Email.BODY_HTML, Email.BODY_TEXT, Email.ATTACHMENT)
+        msg = Email.create_multipart_message(Email.SENDER, ', '.join(recipients), Email.SUBJECT.format(report_name=report_name),
+            Email.BODY_HTML.format(report_name=report_name), Email.BODY_TEXT.format(report_name=report_name), report_pdf, Email.ATTACHMENT_NAME)
         ses_client = boto3.client('ses', 
         region_name= Email.REGION_NAME)
         return ses_client.send_raw_email(
             Source=Email.SENDER,
-            Destinations=[Email.RECIPIENT],
+            Destinations=recipients,
             RawMessage={'Data': msg.as_string()}
         )
     @staticmethod
-    def send_report():
+    def send_report(report_pdf: bytes, recipients: list=None, report_name: str='Daily Report'):
         """
         Function call to execute send mail function in a try block
-        Sends daily report email to recipient fixed recipient
+        Sends the report pdf to the recipients (default REPORT_RECIPIENTS)
         """
         try:
-            response = Email.send_mail()
+            response = Email.send_mail(report_pdf, recipients or Email.RECIPIENTS, report_name)
         except ClientError as e:
             print(e.response['Error']['Message'])
         else:
             print("Email sent! Message ID:"),
-            print(response['MessageId'])
\ No newline at end of file
+            print(response['MessageId'])
+
+    @staticmethod
+    def send_rider_report(ses_client, report_pdf: bytes, recipient: str, name: str) -> bool:
+        """
+        Sends a rider their ride summary pdf with the given (shared, thread safe) SES client.
+        Returns whether SES accepted the email
+        """
+        msg = Email.create_multipart_message(Email.SENDER, recipient, Email.RIDER_SUBJECT, Email.RIDER_BODY_HTML.format(name=name),
+            Email.RIDER_BODY_TEXT.format(name=name), report_pdf, Email.RIDER_ATTACHMENT_NAME)
+        try:
+            ses_client.send_raw_email(
+                Source=Email.SENDER,
+                Destinations=[recipient],
+                RawMessage={'Data': msg.as_string()}
+            )
+        except ClientError as e:
+            print(f'Ride summary to {recipient} failed: {e.response["Error"]["Message"]}')
+            return False
+        return True
+
+
+class RiderReport():
+
+    send_workers = int(getenv('RIDER_REPORT_SEND_WORKERS', 8))
+    max_pending_sends = int(getenv('RIDER_REPORT_MAX_PENDING', 32))
+    max_pending_builds = int(getenv('RIDER_REPORT_MAX_PENDING_BUILDS', 32))
+
+    @staticmethod
+    def get_rider_rides(con: sqlalchemy.engine.Connection, start_date: date, end_date: date) -> pd.DataFrame:
+        """
+        Returns every ride between the start and end dates (inclusive) of riders with an email address,
+        with the rider's name and email, in a single query ordered by rider then start time
+        """
+        query = text("""
+        SELECT rides.user_id, users.name, users.email_address, rides.ride_id, rides.start_time, rides.total_duration,
+        rides.avg_heart_rate_bpm, rides.max_heart_rate_bpm, rides.total_power_kilojoules
+        FROM yusra_stories_production.rides
+        JOIN (SELECT DISTINCT ON (user_id) user_id, name, email_address FROM yusra_stories_production.users) AS users
+        USING (user_id)
+        WHERE rides.start_time >= :start_date AND rides.start_time < CAST(:end_date AS DATE) + 1
+        AND users.email_address IS NOT NULL
+        ORDER BY rides.user_id, rides.start_time;
+        """)
+        return pd.read_sql_query(query, con, params={'start_date': start_date, 'end_date': end_date})
+
+    @staticmethod
+    def get_riders(rider_rides: pd.DataFrame) -> list:
+        """
+        Splits the bulk rides query into one dict per rider: user_id, name, email_address and their rides
+        """
+        ride_columns = ['ride_id', 'start_time', 'total_duration', 'avg_heart_rate_bpm', 'max_heart_rate_bpm', 'total_power_kilojoules']
+        riders = []
+        for (user_id, name, email_address), rides in rider_rides.groupby(['user_id', 'name', 'email_address'], sort=False):
+            riders.append({'user_id': user_id, 'name': name, 'email_address': email_address, 'rides': rides[ride_columns].reset_index(drop=True)})
+        return riders
+
+    @staticmethod
+    def get_ride_trend_fig(rides: pd.DataFrame):
+        """
+        Given a rider's rides
+        Returns a chart of the average heart rate (line) and power (bars) of each ride
+        """
+        ride_trend_fig = make_subplots(specs=[[{'secondary_y': True}]])
+        ride_trend_fig.add_trace(go.Bar(x=rides['start_time'], y=rides['total_power_kilojoules'], name='Power (KJ)', marker_color=px.colors.sequential.Greens_r[3]), secondary_y=True)
+        ride_trend_fig.add_trace(go.Scatter(x=rides['start_time'], y=rides['avg_heart_rate_bpm'], name='Average heart rate (bpm)', mode='lines+markers', line_color=px.colors.sequential.Greens_r[0]))
+        ride_trend_fig.update_layout(title='Heart rate and power of your rides', width=700, height=350)
+        ride_trend_fig.update_yaxes(title_text='Heart rate (bpm)', secondary_y=False)
+        ride_trend_fig.update_yaxes(title_text='Power (KJ)', secondary_y=True)
+        return ride_trend_fig
+
+    @staticmethod
+    def get_report(rider: dict, ride_trend_image: bytes) -> str:
+        """
+        Returns a html string of a rider's summary: totals, the ride trend chart and a table of their rides
+        """
+        rides = rider['rides']
+        ride_rows = ''
+        for ride in rides.itertuples():
+            ride_rows += (f'<tr><td>{ride.start_time:%d-%m-%Y %H:%M}</td><td>{ride.total_duration}</td>'
+                + f'<td>{ride.avg_heart_rate_bpm}</td><td>{ride.max_heart_rate_bpm}</td><td>{ride.total_power_kilojoules:.1f}</td></tr>')
+        report_layout = (
+            f'<h1 align="center"> Your Deloton ride summary, {rider["name"]}</h1>'
+            + '<hr>'
+            + f'<h2 align="center"> {rides.shape[0]} rides, average heart rate {rides["avg_heart_rate_bpm"].mean():.0f} bpm, '
+            + f'total power {rides["total_power_kilojoules"].sum():.1f} KJ</h2>'
+            + '<hr>'
+            + Convert.graph_block_template(ride_trend_image)
+            + '<table border="1" cellpadding="3"><tr><th>Start</th><th>Duration</th><th>Avg heart rate (bpm)</th>'
+            + '<th>Max heart rate (bpm)</th><th>Power (KJ)</th></tr>'
+            + ride_rows
+            + '</table>'
+        )
+        return report_layout
+
+    @staticmethod
+    def build_report(rider: dict) -> bytes:
+        """
+        Renders a rider's summary to pdf bytes, using this process's warm kaleido instance.
+        Returns None when the summary cannot be built, logging the rider, so one bad rider does not stop the others
+        """
+        try:
+            Convert.warm_kaleido()
+            ride_trend_image, _ = Convert.render_png(RiderReport.get_ride_trend_fig(rider['rides']).to_json())
+            return Convert.convert_html_to_pdf(RiderReport.get_report(rider, ride_trend_image))
+        except Exception as e:
+            print(f'Ride summary for rider {rider["user_id"]} could not be built: {e}')
+            return None
+
+    @staticmethod
+    def generate_reports(riders: list):
+        """
+        Yields (rider, report_pdf) for each rider, in order, as the reports are built by a pool of
+        RENDER_WORKERS processes, report_pdf being None for a rider whose report could not be built.
+        At most RIDER_REPORT_MAX_PENDING_BUILDS riders are handed to the pool ahead of the reports
+        yielded, so memory stays flat for large batches. Builds the reports in this process with a
+        single worker or when a process pool is unavailable, picking up where the pool stopped
+        """
+        workers = min(Convert.render_workers, len(riders))
+        generated = 0
+        if workers > 1:
+            try:
+                with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'), initializer=Convert.warm_kaleido) as pool:
+                    pending = deque()
+                    for rider in riders:
+                        pending.append(pool.submit(RiderReport.build_report, rider))
+                        if len(pending) >= max(RiderReport.max_pending_builds, workers):
+                            yield riders[generated], pending.popleft().result()
+                            generated += 1
+                    while pending:
+                        yield riders[generated], pending.popleft().result()
+                        generated += 1
+            except (OSError, NotImplementedError, BrokenProcessPool) as e:
+                print(f'Process pool unavailable ({e}), building the remaining {len(riders) - generated} reports serially')
+        for rider in riders[generated:]:
+            yield rider, RiderReport.build_report(rider)
+
+    @staticmethod
+    def send_reports(riders: list) -> dict:
+        """
+        Builds and sends every rider their summary, counting a report that cannot be built as failed. Reports are sent by RIDER_REPORT_SEND_WORKERS threads
+        sharing one SES client while the next reports are built, with at most RIDER_REPORT_MAX_PENDING
+        built reports waiting to be sent. Returns the sent and failed counts and reports per minute
+        """
+        start = time.perf_counter()
+        ses_client = boto3.client('ses', region_name=Email.REGION_NAME)
+        pending_sends = threading.BoundedSemaphore(RiderReport.max_pending_sends)
+        results = {'sent': 0, 'failed': 0}
+        results_lock = threading.Lock()
+
+        def send(rider: dict, report_pdf: bytes):
+            try:
+                outcome = 'sent' if Email.send_rider_report(ses_client, report_pdf, rider['email_address'], rider['name']) else 'failed'
+            except Exception as e:
+                print(f'Ride summary to {rider["email_address"]} failed: {e}')
+                outcome = 'failed'
+            finally:
+                pending_sends.release()
+            with results_lock:
+                results[outcome] += 1
+
+        with ThreadPoolExecutor(max_workers=RiderReport.send_workers) as senders:
+            for rider, report_pdf in RiderReport.generate_reports(riders):
+                if report_pdf == None:
+                    with results_lock:
+                        results['failed'] += 1
+                    continue
+                pending_sends.acquire()
+                senders.submit(send, rider, report_pdf)
+
+        elapsed = time.perf_counter() - start
+        results['reports_per_minute'] = round(len(riders) / elapsed * 60, 1) if elapsed > 0 else 0.0
+        print(f'Sent {results["sent"]} ride summaries ({results["failed"]} failed) in {elapsed:.1f}s: {results["reports_per_minute"]} reports/minute')
+        return results
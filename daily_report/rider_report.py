@@ -0,0 +1,13 @@
+from daily_report_helper import Graph, Period, RiderReport
+from shared.database import Database
+
+
+def handler(event, context):
+    start_date, end_date, _ = Period.get_report_period(event)
+    con = Graph.create_connection()
+    rider_rides = RiderReport.get_rider_rides(con, start_date, end_date)
+    con.close()
+    Database.print_stats()
+    riders = RiderReport.get_riders(rider_rides)
+    print(f'{len(riders)} active riders between {start_date} and {end_date}')
+    return RiderReport.send_reports(riders)
@@ -0,0 +1,59 @@
+from datetime import datetime
+
+import pandas as pd
+import pytest
+
+import daily_report_helper
+from daily_report_helper import Convert, RiderReport
+
+
+def rider(user_id: int, start_time=datetime(2022, 10, 13, 10, 7, 41)) -> dict:
+    rides = pd.DataFrame({'ride_id': [user_id], 'start_time': [start_time], 'total_duration': [1800],
+        'avg_heart_rate_bpm': [112], 'max_heart_rate_bpm': [188], 'total_power_kilojoules': [21.3]})
+    return {'user_id': user_id, 'name': f'Rider {user_id}', 'email_address': f'rider{user_id}@example.com', 'rides': rides}
+
+
+class StubSES():
+
+    def __init__(self):
+        self.sent = []
+
+    def send_raw_email(self, Source, Destinations, RawMessage):
+        self.sent.extend(Destinations)
+        return {'MessageId': str(len(self.sent))}
+
+
+@pytest.fixture
+def ses(monkeypatch):
+    client = StubSES()
+    monkeypatch.setattr(daily_report_helper.boto3, 'client', lambda *args, **kwargs: client)
+    return client
+
+
+@pytest.fixture
+def riders() -> list:
+    # the third rider has a ride without a start time, which their summary cannot format
+    return [rider(1), rider(2), rider(3, start_time=None), rider(4), rider(5)]
+
+
+def test_a_rider_whose_report_fails_is_skipped(monkeypatch, riders):
+    monkeypatch.setattr(Convert, 'render_workers', 1)
+    reports = list(RiderReport.generate_reports(riders))
+    assert [rider['user_id'] for rider, _ in reports] == [1, 2, 3, 4, 5]
+    assert [report_pdf is not None for _, report_pdf in reports] == [True, True, False, True, True]
+    assert reports[0][1].startswith(b'%PDF')
+
+
+def test_pool_builds_reports_in_order_with_bounded_submissions(monkeypatch, riders):
+    monkeypatch.setattr(Convert, 'render_workers', 2)
+    monkeypatch.setattr(RiderReport, 'max_pending_builds', 2)
+    reports = list(RiderReport.generate_reports(riders))
+    assert [rider['user_id'] for rider, _ in reports] == [1, 2, 3, 4, 5]
+    assert [report_pdf is not None for _, report_pdf in reports] == [True, True, False, True, True]
+
+
+def test_send_reports_counts_the_failed_report_and_sends_the_others(monkeypatch, ses, riders):
+    monkeypatch.setattr(Convert, 'render_workers', 1)
+    results = RiderReport.send_reports(riders)
+    assert (results['sent'], results['failed']) == (4, 1)
+    assert sorted(ses.sent) == ['rider1@example.com', 'rider2@example.com', 'rider4@example.com', 'rider5@example.com']
@@ -1,6 +1,7 @@
 from hr_alert_helpers import Kafka as k
+from hr_alert_helpers import Metrics
 
 if __name__ == "__main__":
+    Metrics.start_server()
     consumer = k.connect_to_consumer()
     k.stream_hr_kafka_topic(consumer, k.topic_name)
-
@@ -1,14 +1,24 @@
 import json
-import re
-import uuid
+import queue
+import random
+import socket
+import threading
+import time
+from collections import OrderedDict
 from datetime import date
 from os import getenv
 
 import boto3
 import confluent_kafka
+import numpy as np
 import pandas as pd
 from botocore.exceptions import ClientError
 from dotenv import load_dotenv
+from prometheus_client import Counter, Histogram, start_http_server
+from sqlalchemy import text
+
+from shared.database import Database
+from shared.log_parsing import BikeKeys, LogParser
 
 
 class Email():
@@ -19,6 +29,24 @@ class Email():
     body_text = (" Your heart rate was picked up at an abnormal rhythm, please seek medical attention! ")
            
     charset = "UTF-8"
+    endpoint_url = getenv('SES_ENDPOINT_URL')
+    max_attempts = int(getenv('SES_MAX_ATTEMPTS', 5))
+    backoff_seconds = float(getenv('SES_BACKOFF_SECONDS', 0.5))
+    throttling_errors = ('Throttling', 'ThrottlingException', 'TooManyRequestsException')
+
+    client = None
+    client_lock = threading.Lock()
+
+    @staticmethod
+    def get_client():
+        """
+        Returns the SES client shared by every send, creating it on first use.
+        SES_ENDPOINT_URL points it at a local SES stub instead of AWS
+        """
+        with Email.client_lock:
+            if Email.client == None:
+                Email.client = boto3.client('ses', region_name=Email.aws_region, endpoint_url=Email.endpoint_url)
+        return Email.client
 
     @staticmethod
     def build_html_body(age, heart_rate,name):
@@ -49,8 +77,7 @@ class Email():
 
         body_html = Email.build_html_body(age, heart_rate, name)
 
-        client = boto3.client('ses',region_name=Email.aws_region)
-        response = client.send_email(
+        response = Email.get_client().send_email(
                     Destination=
                     {'ToAddresses': [recipient]},
                     Message={
@@ -69,15 +96,85 @@ class Email():
     @staticmethod
     def send_alert(recipient, age, heart_rate,name ):
         """
-        Fires off the email to the rider if abnormal heart rate occurs
+        Fires off the email to the rider if abnormal heart rate occurs,
+        retrying with exponential backoff and jitter while SES is throttling
+        """
+        for attempt in range(1, Email.max_attempts + 1):
+            try:
+                response = Email.create_email(recipient, age, heart_rate,name)
+            except ClientError as e:
+                if e.response['Error']['Code'] in Email.throttling_errors and attempt < Email.max_attempts:
+                    time.sleep(Email.backoff_seconds * 2 ** (attempt - 1) * random.uniform(0.5, 1.5))
+                    continue
+                print(e.response['Error']['Message'])
+                return None
+            else:
+                print("Email sent! Message ID:"),
+                print(response['MessageId'])
+                return response
+
+class AlertDispatcher():
+    """
+    Sends alert emails from a bounded pool of worker threads so SES calls never block the Kafka consumer
+    """
+
+    workers = int(getenv('ALERT_DISPATCH_WORKERS', 4))
+    queue_size = int(getenv('ALERT_DISPATCH_QUEUE_SIZE', 100))
+    submit_timeout_seconds = float(getenv('ALERT_DISPATCH_SUBMIT_TIMEOUT_SECONDS', 0.1))
+
+    def __init__(self, workers: int = None, queue_size: int = None):
+        Email.get_client()
+        self.alerts = queue.Queue(maxsize=queue_size or AlertDispatcher.queue_size)
+        self.dropped = 0
+        self.threads = [threading.Thread(target=self.work, daemon=True) for _ in range(workers or AlertDispatcher.workers)]
+        for thread in self.threads:
+            thread.start()
+
+    def submit(self, recipient, age, heart_rate, name, log_time: float) -> bool:
+        """
+        Queues an alert for sending, returns False if the queue stayed full and the alert was dropped.
+        log_time is the epoch time of the reading that triggered it
         """
         try:
-            response = Email.create_email(recipient, age, heart_rate,name)
-        except ClientError as e:
-            print(e.response['Error']['Message'])
-        else:
-            print("Email sent! Message ID:"),
-            print(response['MessageId'])
+            self.alerts.put((recipient, age, heart_rate, name, log_time, time.perf_counter()), timeout=AlertDispatcher.submit_timeout_seconds)
+            return True
+        except queue.Full:
+            self.dropped += 1
+            print(f'Alert dispatch queue full, dropped alert for {recipient} ({self.dropped} dropped so far)')
+            return False
+
+    def work(self):
+        """
+        Worker thread loop: sends queued alerts until it receives the stop signal (None)
+        """
+        while True:
+            alert = self.alerts.get()
+            try:
+                if alert == None:
+                    return
+                recipient, age, heart_rate, name, log_time, submitted_at = alert
+                if Email.send_alert(recipient, age, heart_rate, name) != None:
+                    Metrics.observe_stage('send', time.perf_counter() - submitted_at)
+                    Metrics.observe_alert_acknowledged(log_time)
+            except Exception as e:
+                print(f'Alert dispatch failed: {e}')
+            finally:
+                self.alerts.task_done()
+
+    def flush(self):
+        """
+        Blocks until every queued alert has been sent
+        """
+        self.alerts.join()
+
+    def close(self):
+        """
+        Sends every queued alert, then stops the worker threads
+        """
+        for _ in self.threads:
+            self.alerts.put(None)
+        for thread in self.threads:
+            thread.join()
 
 class HeartRate():
 
@@ -101,6 +198,132 @@ class HeartRate():
         else:
             return False
 
+    @staticmethod
+    def abnormal_mask(heart_rates: np.ndarray, lower_boundaries: np.ndarray, upper_boundaries: np.ndarray) -> np.ndarray:
+        """
+        Vectorised is_abnormal: compares a batch of heart rates to each reading's rider boundaries
+        """
+        return (heart_rates > upper_boundaries) | ((heart_rates < lower_boundaries) & (heart_rates > 0))
+
+class Metrics():
+    """
+    Prometheus metrics for the alert pipeline, served on METRICS_PORT at /metrics.
+    Stages: kafka_lag (oldest log in a batch, produced to consumed), parse and detect (per consumed batch),
+    send (alert queued to SES acknowledgement)
+    """
+
+    port = int(getenv('METRICS_PORT', 8000))
+    sla_seconds = float(getenv('ALERT_SLA_SECONDS', 15))
+    buckets = (0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 15, 30, 60)
+
+    stage_seconds = Histogram('hr_alert_stage_seconds', 'Seconds spent in each stage of the heart-rate alert pipeline', ['stage'], buckets=buckets)
+    end_to_end_seconds = Histogram('hr_alert_end_to_end_seconds', 'Seconds from the heart-rate log timestamp to SES acknowledging the alert', buckets=buckets)
+    sla_breaches = Counter('hr_alert_sla_breaches', 'Alerts acknowledged by SES later than ALERT_SLA_SECONDS after the reading')
+    abnormal_readings = Counter('hr_alert_abnormal_readings', 'Abnormal heart-rate readings seen')
+    alert_decisions = Counter('hr_alert_decisions', 'Alert decisions for abnormal readings by outcome', ['outcome'])
+
+    @staticmethod
+    def start_server():
+        """
+        Starts the HTTP server exposing the metrics endpoint in a background thread
+        """
+        start_http_server(Metrics.port)
+        print(f'Metrics served on port {Metrics.port}')
+
+    @staticmethod
+    def observe_stage(stage: str, seconds: float):
+        """
+        Records the time spent in one stage of the pipeline
+        """
+        Metrics.stage_seconds.labels(stage).observe(seconds)
+
+    @staticmethod
+    def observe_decisions(counters_before: dict):
+        """
+        Records the abnormal readings and alert decisions AlertPolicy has counted since the given copy of its counters
+        """
+        counters = AlertPolicy.counters
+        if counters['abnormal_readings'] == counters_before['abnormal_readings']:
+            return
+        Metrics.abnormal_readings.inc(counters['abnormal_readings'] - counters_before['abnormal_readings'])
+        for counter, outcome in [('alerts_sent', 'alerted'), ('suppressed_by_window', 'suppressed_by_window'), ('suppressed_by_cooldown', 'suppressed_by_cooldown')]:
+            if counters[counter] != counters_before[counter]:
+                Metrics.alert_decisions.labels(outcome).inc(counters[counter] - counters_before[counter])
+
+    @staticmethod
+    def observe_alert_acknowledged(log_time: float):
+        """
+        Records the end-to-end latency of an alert SES has acknowledged, counting SLA breaches
+        """
+        latency = time.time() - log_time
+        Metrics.end_to_end_seconds.observe(latency)
+        if latency > Metrics.sla_seconds:
+            Metrics.sla_breaches.inc()
+            print(f'Alert SLA breached: acknowledged {latency:.1f}s after the reading')
+
+class AlertPolicy():
+    """
+    Decides when abnormal readings become an alert: at least min_abnormal_readings abnormal
+    readings within window_seconds, and no earlier alert for the rider within cooldown_seconds
+    """
+
+    min_abnormal_readings = int(getenv('ALERT_MIN_ABNORMAL_READINGS', 6))
+    window_seconds = float(getenv('ALERT_WINDOW_SECONDS', 10))
+    cooldown_seconds = float(getenv('ALERT_COOLDOWN_SECONDS', 300))
+    counters_log_seconds = float(getenv('ALERT_COUNTERS_LOG_SECONDS', 60))
+
+    counters = {
+        'abnormal_readings': 0,
+        'alerts_sent': 0,
+        'suppressed_by_window': 0,
+        'suppressed_by_cooldown': 0
+    }
+
+    @staticmethod
+    def new_rider_state() -> dict:
+        """
+        Per-rider detection state: a fixed-size ring buffer holding the times of the
+        last min_abnormal_readings abnormal readings, and the time of the last alert
+        """
+        return {
+            'abnormal_times': [0.0] * AlertPolicy.min_abnormal_readings,
+            'ring_index': 0,
+            'ring_count': 0,
+            'last_alert': None
+        }
+
+    @staticmethod
+    def should_alert(state: dict, reading_time: float) -> bool:
+        """
+        Records an abnormal reading for a rider and returns True if it should fire an alert.
+        The decisions are only counted here, Metrics.observe_decisions exports them once per batch
+        """
+        AlertPolicy.counters['abnormal_readings'] += 1
+        size = AlertPolicy.min_abnormal_readings
+        state['abnormal_times'][state['ring_index']] = reading_time
+        state['ring_index'] = (state['ring_index'] + 1) % size
+        state['ring_count'] = min(state['ring_count'] + 1, size)
+
+        # once full, the next slot to be overwritten holds the oldest of the last N readings
+        oldest_time = state['abnormal_times'][state['ring_index']]
+        if state['ring_count'] < size or reading_time - oldest_time > AlertPolicy.window_seconds:
+            AlertPolicy.counters['suppressed_by_window'] += 1
+            return False
+        if state['last_alert'] != None and reading_time - state['last_alert'] < AlertPolicy.cooldown_seconds:
+            AlertPolicy.counters['suppressed_by_cooldown'] += 1
+            return False
+
+        state['last_alert'] = reading_time
+        AlertPolicy.counters['alerts_sent'] += 1
+        return True
+
+    @staticmethod
+    def print_counters():
+        """
+        Prints the alert and suppression counters since the service started
+        """
+        print(f'Alert counters: {AlertPolicy.counters}')
+
 class Kafka():
 
     load_dotenv()
@@ -108,6 +331,8 @@ class Kafka():
     server = getenv('KAFKA_SERVER')
     username = getenv('KAFKA_USERNAME')
     password = getenv('KAFKA_PASSWORD')
+    batch_size = int(getenv('KAFKA_BATCH_SIZE', 500))
+    group_id = getenv('KAFKA_GROUP_ID', 'deloton-group-yusra-stories-hr-alerts')
 
     @staticmethod
     def connect_to_consumer() -> confluent_kafka.Consumer:
@@ -117,7 +342,7 @@ class Kafka():
 
         c = confluent_kafka.Consumer({
             'bootstrap.servers': Kafka.server,
-            'group.id': f'deloton-group-yusra-stories' +str(uuid.uuid1()),
+            'group.id': Kafka.group_id,
             'security.protocol': 'SASL_SSL',
             'sasl.mechanisms': 'PLAIN',
             'sasl.username': Kafka.username,
@@ -129,95 +354,443 @@ class Kafka():
             'enable.auto.commit': 'false',
             'max.poll.interval.ms': '86400000',
             'topic.metadata.refresh.interval.ms': "-1",
-            "client.id": 'id-002-005',
+            "client.id": f'id-002-005-{socket.gethostname()}',
         })
 
         return c
 
-
+    @staticmethod
+    def commit(c:confluent_kafka.Consumer, asynchronous: bool = True):
+        """
+        Commits the consumed offsets for the group, ignoring the error raised when there is nothing to commit
+        """
+        try:
+            c.commit(asynchronous=asynchronous)
+        except confluent_kafka.KafkaException as e:
+            if e.args[0].code() != confluent_kafka.KafkaError._NO_OFFSET:
+                print(f'Offset commit failed: {e}')
 
     @staticmethod
     def stream_hr_kafka_topic(c:confluent_kafka.Consumer, topic: str) -> list:
         """
-        Constantly streams logs using the provided kafka consumer and topic
+        Constantly streams logs in batches using the provided kafka consumer and topic
         to directly query logs for heart rate alerts
         """
-        c.subscribe([topic])
-        print(f'Kafka consumer subscribed to topic: {topic}. Logs will be cached from beginning of next ride.')
+        sessions = Sessions()
+        profiles = RiderProfiles()
+        profiles.start_loader()
+        dispatcher = AlertDispatcher()
+
+        def on_assign(consumer, partitions):
+            # riders already mid-ride on these partitions are rebuilt from the profile cache on their next log
+            print(f'Assigned partitions: {[p.partition for p in partitions]}')
 
-        age,recipient,name = None, None, None
+        def on_revoke(consumer, partitions):
+            # send what was detected so far and commit it before another replica takes the partitions over
+            dispatcher.flush()
+            Kafka.commit(consumer, asynchronous=False)
+            sessions.drop_partitions({p.partition for p in partitions})
+            print(f'Revoked partitions: {[p.partition for p in partitions]}')
+
+        c.subscribe([topic], on_assign=on_assign, on_revoke=on_revoke, on_lost=on_revoke)
+        print(f'Kafka consumer subscribed to topic: {topic} in group {Kafka.group_id}.')
+
+        counters_printed = time.monotonic()
         try:
             while True:
-                log = c.poll(1.0)
-                if log == None:
-                    pass
-                else: 
-                    value = json.loads(log.value().decode('utf-8'))
-                    value_log = value['log']
-
-                    if ' [SYSTEM] data' in value_log:
-                        dob_log_string = Transformations.get_value_from_user_dict(value_log, 'date_of_birth')
-                        dob_timestamp = pd.Timestamp(dob_log_string, unit='ms')
-                        age = Transformations.get_age(dob_timestamp)
-                        recipient = Transformations.get_value_from_user_dict(value_log,'email_address')
-                        name = Transformations.get_value_from_user_dict(value_log,'name')
-                 
-                    
-                    if age != None:
-                        heart_rate = Transformations.reg_extract_heart_rate(value_log)
-                        if (heart_rate != None) and (HeartRate.is_abnormal(heart_rate, age)):
-                            Email.send_alert(recipient, age, heart_rate, name)
+                logs = c.consume(num_messages=Kafka.batch_size, timeout=1.0)
+                now = time.monotonic()
+                sessions.evict_expired(now)
+                profiles.refresh()
+                if now - counters_printed >= AlertPolicy.counters_log_seconds:
+                    AlertPolicy.print_counters()
+                    Database.print_stats()
+                    counters_printed = now
+                if logs:
+                    Kafka.process_batch(logs, sessions, profiles, dispatcher, now)
+                    Kafka.commit(c)
                     
         except KeyboardInterrupt:
             pass
         finally:
+            dispatcher.close()
+            Kafka.commit(c, asynchronous=False)
             c.close()
+
+    @staticmethod
+    def process_batch(logs: list, sessions, profiles, dispatcher, now: float):
+        """
+        Checks a batch of consumed logs for abnormal heart rates, a batch at a time rather than log by log:
+        the heart rates and the SYSTEM logs and ride markers are found in one pass over the joined logs, the rider
+        of each reading is looked up once per bike for every stretch of the batch between two markers, and the
+        readings are compared to their rider's boundaries with NumPy. Only the markers, which update the sessions
+        in order, and the abnormal readings, which go through the alert policy, are handled one at a time
+        """
+        polled_at = time.time()
+        parse_start = time.perf_counter()
+
+        logs = [log for log in logs if log.error() == None]
+        produced_ms = [produced_ms for timestamp_type, produced_ms in [log.timestamp() for log in logs]
+            if timestamp_type != confluent_kafka.TIMESTAMP_NOT_AVAILABLE]
+        if produced_ms:
+            Metrics.observe_stage('kafka_lag', max(polled_at - min(produced_ms) / 1000, 0))
+
+        value_logs = [value['log'] for value in Transformations.decode_values(logs)]
+        reading_indices, heart_rates = LogParser.find_heart_rates(value_logs)
+        markers = LogParser.find_session_markers(value_logs)
+
+        # readings are grouped by bike and stretch between markers, the bike's rider being the same throughout a group
+        if markers:
+            segments = np.searchsorted(np.array([i for i, _ in markers]), reading_indices).tolist()
+        else:
+            segments = [0] * len(reading_indices)
+        reading_logs = [logs[i] for i in reading_indices.tolist()]
+        session_keys = BikeKeys.get_bike_keys([log.key() for log in reading_logs], [log.partition() for log in reading_logs])
+        groups = {}
+        reading_groups = [groups.setdefault(group, len(groups)) for group in zip(segments, session_keys)]
+        _, group_first_readings = np.unique(reading_groups, return_index=True)
+
+        riders = []
+        applied = 0
+        for (segment, session_key), first_reading in zip(groups, group_first_readings.tolist()):
+            while applied < segment:
+                Kafka.apply_session_marker(logs[markers[applied][0]], value_logs[markers[applied][0]], markers[applied][1], sessions, profiles, now)
+                applied += 1
+            riders.append(Kafka.get_rider(session_key, logs[reading_indices[first_reading]], sessions, profiles, now))
+        for marker_index, kind in markers[applied:]:
+            Kafka.apply_session_marker(logs[marker_index], value_logs[marker_index], kind, sessions, profiles, now)
+
+        detect_start = time.perf_counter()
+        Metrics.observe_stage('parse', detect_start - parse_start)
+        if not riders:
+            return
+
+        reading_groups = np.array(reading_groups, dtype=np.int64)
+        has_rider = np.fromiter((rider != None for rider in riders), dtype=bool, count=len(riders))
+        lower_boundaries = np.fromiter((rider['lower_hr'] if rider != None else 0 for rider in riders), dtype=np.int64, count=len(riders))
+        upper_boundaries = np.fromiter((rider['upper_hr'] if rider != None else 0 for rider in riders), dtype=np.int64, count=len(riders))
+        abnormal = has_rider[reading_groups] & HeartRate.abnormal_mask(heart_rates, lower_boundaries[reading_groups], upper_boundaries[reading_groups])
+
+        abnormal_readings = np.flatnonzero(abnormal)
+        # the log time is only read for abnormal readings, falling back to the poll time
+        log_times = LogParser.get_timestamps([LogParser.get_log_time(value_logs[i]) for i in reading_indices[abnormal_readings].tolist()])
+        log_times[np.isnan(log_times)] = polled_at
+        counters_before = dict(AlertPolicy.counters)
+        for reading, log_time in zip(abnormal_readings.tolist(), log_times.tolist()):
+            rider = riders[reading_groups[reading]]
+            if AlertPolicy.should_alert(rider['alert_state'], log_time):
+                dispatcher.submit(rider['recipient'], rider['age'], int(heart_rates[reading]), rider['name'], log_time)
+        Metrics.observe_decisions(counters_before)
+        Metrics.observe_stage('detect', time.perf_counter() - detect_start)
+
+    @staticmethod
+    def apply_session_marker(log: confluent_kafka.Message, value_log: str, kind: str, sessions, profiles, now: float):
+        """
+        Starts the session of the rider in a SYSTEM log, or ends the session of the bike at the end of its ride.
+        A SYSTEM log without a readable user dictionary is skipped
+        """
+        session_key = BikeKeys.get_bike_key(log.key(), log.partition())
+        if kind == LogParser.SYSTEM:
+            try:
+                user_dict = LogParser.parse(value_log, kind).user
+                if user_dict == None:
+                    print(f'Skipping SYSTEM log without a user: {value_log!r}')
+                    return
+                BikeKeys.check_user(session_key, user_dict)
+                profile = profiles.get_or_add_from_user_dict(user_dict, now)
+            except (ValueError, KeyError, TypeError, AttributeError) as e:
+                print(f'Skipping SYSTEM log with an unreadable user: {e}')
+                return
+            sessions.start(session_key, Sessions.new_rider(profile, log.partition()), now)
+        elif kind == LogParser.MAIN:
+            sessions.end(session_key)
+
+    @staticmethod
+    def get_rider(session_key: str, log: confluent_kafka.Message, sessions, profiles, now: float) -> dict:
+        """
+        Returns the rider on a bike, or None. A consumer started mid-ride falls back to the last rider
+        known on the bike, when the session key is its serial
+        """
+        rider = sessions.get(session_key, now)
+        if rider == None:
+            bike_serial = BikeKeys.get_bike_serial(session_key)
+            profile = profiles.get_by_bike_serial(bike_serial) if bike_serial != None else None
+            if profile != None:
+                rider = sessions.start(session_key, Sessions.new_rider(profile, log.partition()), now)
+        return rider
     
 
-class Transformations():
+class Sessions():
+    """
+    Rider details for every bike currently riding, keyed by the bike's message key (see BikeKeys).
+    Sessions are kept in least recently seen order so expired ones are evicted from the front
+    """
+
+    ttl_seconds = int(getenv('SESSION_TTL_SECONDS', 300))
+    max_sessions = int(getenv('SESSION_MAX_RIDERS', 10000))
+
+    def __init__(self):
+        self.sessions = OrderedDict()
 
     @staticmethod
-    def get_age(dob:date) -> int:
-        """Calculates a users age based on their date of birth, taken leap year into account (value error)"""
-        today = date.today()
-        try: 
-            birthday = dob.replace(year=today.year)
-        except ValueError: 
-            birthday = dob.replace(year=today.year, month=dob.month+1, day=1)
-        if birthday > today:
-            return today.year - dob.year - 1
-        else:
-            return today.year - dob.year
+    def new_rider(profile: dict, partition: int) -> dict:
+        """
+        Session state for a rider: a copy of their cached profile, the partition their bike's
+        logs arrive on, and fresh alert detection state
+        """
+        return {**profile, 'partition': partition, 'alert_state': AlertPolicy.new_rider_state()}
+
+    def start(self, key: str, rider: dict, now: float) -> dict:
+        """
+        Starts (or replaces) the session for a bike once its rider is known
+        """
+        rider['last_seen'] = now
+        self.sessions[key] = rider
+        self.sessions.move_to_end(key)
+        while len(self.sessions) > Sessions.max_sessions:
+            self.sessions.popitem(last=False)
+        return rider
+
+    def get(self, key: str, now: float) -> dict:
+        """
+        Returns the rider on the given bike, or None if no session is open for it
+        """
+        rider = self.sessions.get(key)
+        if rider != None:
+            rider['last_seen'] = now
+            self.sessions.move_to_end(key)
+        return rider
+
+    def end(self, key: str):
+        """
+        Closes the session for a bike at the end of its ride
+        """
+        self.sessions.pop(key, None)
+
+    def drop_partitions(self, partitions: set):
+        """
+        Drops the sessions of bikes on partitions this consumer no longer owns
+        """
+        for key in [key for key, rider in self.sessions.items() if rider['partition'] in partitions]:
+            del self.sessions[key]
+
+    def evict_expired(self, now: float):
+        """
+        Drops the sessions of bikes that have not sent a log within the TTL
+        """
+        while self.sessions:
+            key, rider = next(iter(self.sessions.items()))
+            if now - rider['last_seen'] < Sessions.ttl_seconds:
+                break
+            self.sessions.popitem(last=False)
+
+
+class RiderProfiles():
+    """
+    Cache of rider profiles with age and heart-rate boundaries precomputed, warmed from the production
+    users table so alerts work from the first telemetry line, even when the service starts mid-ride.
+    The database is only queried from a background loader thread, so a slow database never stalls the
+    consumer: it hands its results over a queue and the consumer applies them between batches
+    """
+
+    refresh_seconds = float(getenv('PROFILE_REFRESH_SECONDS', 60))
+    full_reload_seconds = float(getenv('PROFILE_FULL_RELOAD_SECONDS', 3600))
+    startup_wait_seconds = float(getenv('PROFILE_STARTUP_WAIT_SECONDS', 10))
+
+    engine = Database.create_engine('hr_alerts')
+
+    def __init__(self):
+        self.by_user_id = {}
+        self.by_bike_serial = {}
+        self.max_user_id = None
+        self.loaded = queue.Queue()
+        # (time, profile) for the riders seen in SYSTEM logs over the last full_reload_seconds, replayed over each
+        # full reload: a rider is only written to the users table once their ride has ended
+        self.seen = []
+        self.loader = None
 
     @staticmethod
-    def get_user_dict(log:str) -> dict:
+    def build_profile(user_id: int, name: str, recipient: str, bike_serial: str, dob: date) -> dict:
         """
-        Gets the user dictionary from the SYSTEM logs, returns None for other logs
+        Builds a rider profile, working out the age and heart-rate boundaries once
         """
-        search = re.search('(data = )({.*})', log)
-        if search is not None: 
-            user_dict = json.loads(search.group(2))
-            return user_dict
-        else:
-            return None
+        age = LogParser.get_age(dob)
+        lower_hr, upper_hr = HeartRate.heart_rate_boundaries(age)
+        return {
+            'user_id': user_id,
+            'bike_serial': bike_serial,
+            'age': age,
+            'lower_hr': lower_hr,
+            'upper_hr': upper_hr,
+            'recipient': recipient,
+            'name': name
+        }
 
     @staticmethod
-    def get_value_from_user_dict(log:str, value:str) -> pd.Series:
+    def add_to(by_user_id: dict, by_bike_serial: dict, profile: dict):
         """
-        Gets a given value from the SYSTEM logs user dictionaries, returns None for other logs
+        Adds (or replaces) a profile in the given indexes, making its rider the latest one seen on their bike
         """
-        user_dict = Transformations.get_user_dict(log)
-        if user_dict:
-            return user_dict[value]
-        else:
-            return None
+        by_user_id[profile['user_id']] = profile
+        if profile['bike_serial'] != None:
+            by_bike_serial[profile['bike_serial']] = profile
+
+    def add(self, profile: dict):
+        """
+        Adds (or replaces) a profile, and makes its rider the latest one seen on their bike
+        """
+        RiderProfiles.add_to(self.by_user_id, self.by_bike_serial, profile)
+        if self.max_user_id == None or profile['user_id'] > self.max_user_id:
+            self.max_user_id = profile['user_id']
 
     @staticmethod
-    def reg_extract_heart_rate(log: str):
-        '''Parse heart_rate from given log text'''
-        search = re.search('(hrt = )([0-9]*)', log)
-        if search is not None: 
-            heart_rate = search.group(2)
-            return int(heart_rate)
-        else:
-            return None
+    def build_profiles(users_df: pd.DataFrame) -> list:
+        """
+        Builds a profile for every row of a users query result, in order
+        """
+        return [RiderProfiles.build_profile(int(user.user_id), user.name, user.email_address, user.bike_serial, pd.Timestamp(user.date_of_birth).date())
+            for user in users_df.itertuples(index=False)]
+
+    @staticmethod
+    def query_all() -> list:
+        """
+        Queries every rider in the production users table, in order of their latest ride so each bike serial
+        maps to the last rider seen on that bike. The latest ride is read per rider through the rides user_id
+        index instead of aggregating the whole rides table
+        """
+        with RiderProfiles.engine.connect() as con:
+            users_df = pd.read_sql_query(text("""
+                SELECT user_id, name, email_address, bike_serial, date_of_birth
+                FROM yusra_stories_production.users
+                LEFT JOIN LATERAL (
+                    SELECT rides.start_time AS last_ride
+                    FROM yusra_stories_production.rides
+                    WHERE rides.user_id = users.user_id
+                    ORDER BY rides.start_time DESC
+                    LIMIT 1
+                ) AS last_rides ON TRUE
+                ORDER BY last_ride ASC NULLS FIRST
+                """), con)
+        return RiderProfiles.build_profiles(users_df)
+
+    @staticmethod
+    def query_newer(max_user_id: int) -> list:
+        """
+        Queries the riders added to the production users table after the given user_id
+        """
+        with RiderProfiles.engine.connect() as con:
+            users_df = pd.read_sql_query(text("""
+                SELECT user_id, name, email_address, bike_serial, date_of_birth
+                FROM yusra_stories_production.users
+                WHERE user_id > :max_user_id
+                ORDER BY user_id
+                """), con, params={'max_user_id': max_user_id if max_user_id != None else -1})
+        return RiderProfiles.build_profiles(users_df)
+
+    def start_loader(self) -> threading.Thread:
+        """
+        Starts the background loader thread and applies its first full load, waiting up to
+        PROFILE_STARTUP_WAIT_SECONDS for it before the consumer starts
+        """
+        if self.loader == None:
+            self.loader = threading.Thread(target=self.load_forever, name='rider-profile-loader', daemon=True)
+            self.loader.start()
+            try:
+                self.apply(self.loaded.get(timeout=RiderProfiles.startup_wait_seconds))
+            except queue.Empty:
+                print('Rider profile cache not loaded yet, relying on SYSTEM logs until it is')
+        return self.loader
+
+    def load_forever(self):
+        """
+        Loader thread loop: every rider at start-up and every full_reload_seconds, the riders newer than the
+        highest user_id loaded so far every refresh_seconds. A failed query is retried on the next round
+        """
+        reloaded_at = None
+        max_user_id = None
+        while True:
+            queried_at = time.monotonic()
+            try:
+                if reloaded_at == None or queried_at - reloaded_at >= RiderProfiles.full_reload_seconds:
+                    profiles = RiderProfiles.query_all()
+                    self.loaded.put(('reload', profiles, queried_at))
+                    reloaded_at = queried_at
+                else:
+                    profiles = RiderProfiles.query_newer(max_user_id)
+                    if profiles:
+                        self.loaded.put(('add', profiles, queried_at))
+                if profiles:
+                    max_user_id = max(max_user_id if max_user_id != None else -1, max(profile['user_id'] for profile in profiles))
+            except Exception as e:
+                print(f'Rider profile cache could not be loaded, relying on SYSTEM logs: {e}')
+            time.sleep(RiderProfiles.refresh_seconds)
+
+    def refresh(self):
+        """
+        Applies whatever the loader thread has loaded since the last call, without waiting for it
+        """
+        while True:
+            try:
+                self.apply(self.loaded.get_nowait())
+            except queue.Empty:
+                return
+
+    def apply(self, loaded: tuple):
+        """
+        Applies a result of the loader thread. New riders are added to the cache. A full reload is indexed
+        into new dicts, the riders seen in SYSTEM logs recently are replayed over it, and it then replaces the
+        cache in one swap
+        """
+        kind, profiles, queried_at = loaded
+        if kind == 'add':
+            for profile in profiles:
+                self.add(profile)
+            return
+        by_user_id, by_bike_serial = {}, {}
+        for profile in profiles:
+            RiderProfiles.add_to(by_user_id, by_bike_serial, profile)
+        self.seen = [(seen_at, profile) for seen_at, profile in self.seen
+            if seen_at >= queried_at - RiderProfiles.full_reload_seconds]
+        for _, profile in self.seen:
+            RiderProfiles.add_to(by_user_id, by_bike_serial, profile)
+        self.by_user_id, self.by_bike_serial = by_user_id, by_bike_serial
+        self.max_user_id = max(by_user_id) if by_user_id else None
+        print(f'Rider profile cache loaded with {len(by_user_id)} riders')
+
+    def get_or_add_from_user_dict(self, user_dict: dict, now: float=None) -> dict:
+        """
+        Returns the cached profile for the rider in a SYSTEM log, building and caching it on first sight
+        """
+        profile = self.by_user_id.get(user_dict['user_id'])
+        if profile == None or profile['bike_serial'] != user_dict['bike_serial']:
+            dob = LogParser.get_date_of_birth(user_dict['date_of_birth'])
+            profile = RiderProfiles.build_profile(user_dict['user_id'], user_dict['name'], user_dict['email_address'], user_dict['bike_serial'], dob)
+        self.add(profile)
+        self.seen.append((now if now != None else time.monotonic(), profile))
+        return profile
+
+    def get_by_bike_serial(self, bike_serial: str) -> dict:
+        """
+        Returns the profile of the last rider seen on the given bike, or None
+        """
+        return self.by_bike_serial.get(bike_serial)
+
+
+class Transformations():
+
+    @staticmethod
+    def decode_values(logs: list) -> list:
+        """
+        Decodes the JSON values of a batch of messages with a single json.loads over the joined batch,
+        falling back to decoding message by message if any value is malformed
+        """
+        try:
+            return json.loads(b'[' + b','.join(log.value() for log in logs) + b']')
+        except (TypeError, ValueError):
+            values = []
+            for log in logs:
+                try:
+                    values.append(json.loads(log.value()))
+                except (TypeError, ValueError):
+                    values.append({'log': ''})
+            return values
@@ -0,0 +1,125 @@
+import threading
+import time
+
+import pytest
+
+from hr_alert_helpers import AlertDispatcher, Email
+
+
+class SlowSES():
+    """
+    SES client stub that takes latency_seconds to acknowledge each email,
+    or until release() when latency_seconds is None
+    """
+
+    def __init__(self, latency_seconds: float=None):
+        self.latency_seconds = latency_seconds
+        self.released = threading.Event()
+        self.sent = []
+        self.lock = threading.Lock()
+
+    def send_email(self, **email):
+        if self.latency_seconds == None:
+            self.released.wait()
+        else:
+            time.sleep(self.latency_seconds)
+        with self.lock:
+            self.sent.append(email['Destination']['ToAddresses'][0])
+            return {'MessageId': str(len(self.sent))}
+
+    def release(self):
+        self.released.set()
+
+
+@pytest.fixture
+def ses(monkeypatch):
+    clients = []
+
+    def install(latency_seconds: float=None) -> SlowSES:
+        client = SlowSES(latency_seconds)
+        clients.append(client)
+        monkeypatch.setattr(Email, 'client', client)
+        return client
+    yield install
+    for client in clients:
+        client.release()
+
+
+@pytest.fixture
+def dispatchers():
+    started = []
+
+    def start(workers: int, queue_size: int) -> AlertDispatcher:
+        dispatcher = AlertDispatcher(workers=workers, queue_size=queue_size)
+        started.append(dispatcher)
+        return dispatcher
+    yield start
+    # stop any workers a failed test left running, so they cannot send through the next test's stub
+    for dispatcher in started:
+        if any(thread.is_alive() for thread in dispatcher.threads):
+            dispatcher.close()
+
+
+def submit_alerts(dispatcher: AlertDispatcher, count: int) -> list:
+    """
+    Submits count alerts, returning (accepted, seconds blocked) for each
+    """
+    results = []
+    for i in range(count):
+        start = time.perf_counter()
+        accepted = dispatcher.submit(f'rider{i}@example.com', 40, 190, f'Rider {i}', time.time())
+        results.append((accepted, time.perf_counter() - start))
+    return results
+
+
+def test_submit_never_blocks_beyond_its_timeout(ses, dispatchers, monkeypatch):
+    monkeypatch.setattr(AlertDispatcher, 'submit_timeout_seconds', 0.05)
+    client = ses()
+    dispatcher = dispatchers(workers=1, queue_size=2)
+
+    results = submit_alerts(dispatcher, 10)
+
+    assert max(seconds for _, seconds in results) < AlertDispatcher.submit_timeout_seconds + 0.1
+    client.release()
+    dispatcher.close()
+
+
+def test_full_queue_drops_alerts(ses, dispatchers, monkeypatch):
+    monkeypatch.setattr(AlertDispatcher, 'submit_timeout_seconds', 0.05)
+    client = ses()
+    dispatcher = dispatchers(workers=1, queue_size=2)
+
+    results = submit_alerts(dispatcher, 10)
+    accepted = sum(1 for ok, _ in results if ok)
+
+    # SES never answers, so at most one alert is with the worker and two are queued
+    assert accepted <= 3
+    assert dispatcher.dropped == 10 - accepted
+    assert not results[-1][0]
+    client.release()
+    dispatcher.close()
+    assert len(client.sent) == accepted
+
+
+def test_flush_waits_for_every_queued_alert(ses, dispatchers):
+    client = ses(latency_seconds=0.02)
+    dispatcher = dispatchers(workers=2, queue_size=20)
+
+    results = submit_alerts(dispatcher, 10)
+    dispatcher.flush()
+
+    assert all(ok for ok, _ in results)
+    assert sorted(client.sent) == sorted(f'rider{i}@example.com' for i in range(10))
+    assert dispatcher.alerts.empty()
+    dispatcher.close()
+
+
+def test_close_sends_queued_alerts_then_stops_the_workers(ses, dispatchers):
+    client = ses(latency_seconds=0.02)
+    dispatcher = dispatchers(workers=2, queue_size=20)
+
+    submit_alerts(dispatcher, 10)
+    dispatcher.close()
+
+    assert len(client.sent) == 10
+    assert not any(thread.is_alive() for thread in dispatcher.threads)
@@ -0,0 +1,82 @@
+import json
+from datetime import date, datetime, timezone
+
+import confluent_kafka
+import pytest
+
+from hr_alert_helpers import AlertPolicy, Kafka, RiderProfiles, Sessions
+
+
+class CountingDispatcher():
+
+    def __init__(self):
+        self.submitted = []
+
+    def submit(self, recipient, age, heart_rate, name, log_time) -> bool:
+        self.submitted.append((recipient, heart_rate))
+        return True
+
+
+def message(log: str, key: bytes=b'SN0000', partition: int=0) -> confluent_kafka.Message:
+    return confluent_kafka.Message(topic='rides', partition=partition, key=key, value=json.dumps({'log': log}).encode(),
+        timestamp=(confluent_kafka.TIMESTAMP_CREATE_TIME, 1665655662000))
+
+
+def system_log(bike_serial: str='SN0000') -> str:
+    # the rider is 40, so anything above 180 BPM is abnormal
+    date_of_birth = int(datetime(date.today().year - 41, 12, 31, tzinfo=timezone.utc).timestamp() * 1000)
+    user = {'user_id': 3962, 'name': 'Katherine Goodwin', 'gender': 'female', 'address': 'Flat 27,Burke ports,Eastport,SO1 6XB',
+        'date_of_birth': date_of_birth, 'email_address': 'katherine.goodwin@hotmail.com', 'height_cm': 168, 'weight_kg': 68,
+        'account_create_date': 1660521600000, 'bike_serial': bike_serial, 'original_source': 'offline'}
+    return f'2022-10-13 10:07:41.705773 mendoza v9: [SYSTEM] data = {json.dumps(user)}'
+
+
+def telemetry_log(heart_rate: int) -> str:
+    return f'2022-10-13 10:07:42.707362 mendoza v9: [INFO]: Telemetry - hrt = {heart_rate}; rpm = 49; power = 11.6'
+
+
+@pytest.fixture
+def state(monkeypatch):
+    # every abnormal reading is an alert
+    monkeypatch.setattr(AlertPolicy, 'min_abnormal_readings', 1)
+    return Sessions(), RiderProfiles(), CountingDispatcher()
+
+
+def test_abnormal_heart_rate_is_alerted(state):
+    sessions, profiles, dispatcher = state
+    Kafka.process_batch([message(system_log()), message(telemetry_log(120)), message(telemetry_log(200))],
+        sessions, profiles, dispatcher, 1.0)
+    assert dispatcher.submitted == [('katherine.goodwin@hotmail.com', 200)]
+
+
+@pytest.mark.parametrize('log', [
+    '2022-10-13 10:07:41.705773 mendoza v9: [SYSTEM] no user today',
+    '2022-10-13 10:07:41.705773 mendoza v9: [SYSTEM] data = {"user_id": 3962, "name": }',
+    '2022-10-13 10:07:41.705773 mendoza v9: [SYSTEM] data = {"name": "Katherine Goodwin"}',
+])
+def test_system_log_without_a_readable_user_is_skipped(state, log):
+    sessions, profiles, dispatcher = state
+    Kafka.process_batch([message(log), message(telemetry_log(200))], sessions, profiles, dispatcher, 1.0)
+    assert dispatcher.submitted == []
+    assert sessions.get('SN0000', 1.0) == None
+
+
+def test_unreadable_system_log_keeps_the_current_rider(state):
+    sessions, profiles, dispatcher = state
+    Kafka.process_batch([message(system_log()), message('2022-10-13 10:07:41.705773 mendoza v9: [SYSTEM] no user today'),
+        message(telemetry_log(200))], sessions, profiles, dispatcher, 1.0)
+    assert dispatcher.submitted == [('katherine.goodwin@hotmail.com', 200)]
+
+
+def test_rider_is_recovered_by_bike_serial_after_a_restart(state):
+    sessions, profiles, dispatcher = state
+    profiles.get_or_add_from_user_dict(json.loads(system_log('SN0007').split('data = ')[1]))
+    Kafka.process_batch([message(telemetry_log(200), key=b'SN0007')], sessions, profiles, dispatcher, 1.0)
+    assert dispatcher.submitted == [('katherine.goodwin@hotmail.com', 200)]
+
+
+def test_unkeyed_bikes_are_told_apart_by_partition(state):
+    sessions, profiles, dispatcher = state
+    Kafka.process_batch([message(system_log(), key=None, partition=2), message(telemetry_log(200), key=None, partition=3),
+        message(telemetry_log(201), key=None, partition=2)], sessions, profiles, dispatcher, 1.0)
+    assert dispatcher.submitted == [('katherine.goodwin@hotmail.com', 201)]
@@ -5,8 +5,11 @@ import warnings
 warnings.simplefilter(action='ignore', category=FutureWarning)
 warnings.simplefilter(action='ignore', category=SyntaxWarning)
 
+from production_helpers import Partition as partition
+from production_helpers import Rollup as rollup
 from production_helpers import SQLConnection as sql
 from production_helpers import Transform as t
+from shared.database import Database
 
 def handler(event, context):
     production_schema = 'yusra_stories_production'
@@ -16,6 +19,7 @@ def handler(event, context):
     latest_formatted = t.get_joined_formatted_df(latest_logs)
 
     #rides table
+    partition.ensure_rides_table()
     staging_ride_df = t.get_staging_rides_df(latest_formatted)
     latest_ride_df = t.get_final_rides_df(staging_ride_df)
     sql.write_df_to_table(latest_ride_df, production_schema, 'rides', 'append')
@@ -29,4 +33,16 @@ def handler(event, context):
     else:
         sql.write_df_to_table(latest_user_df, production_schema, 'users', 'append')
 
+    #daily rollup table, a first run backfills it from the rides table (the latest ride included)
+    if not rollup.ensure_rollup_table():
+        for latest_ride_id in latest_ride_df['ride_id']:
+            rollup.add_ride_to_rollup(latest_ride_id)
+    Database.print_stats()
 
+
+def retention_handler(event, context):
+    #partition maintenance: migrates an unpartitioned rides table and creates the upcoming monthly partitions,
+    #then drops (or detaches) whole monthly partitions of the rides table older than the retention period
+    partition.ensure_partitioned_rides_table()
+    partition.apply_retention()
+    Database.print_stats()
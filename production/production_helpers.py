@@ -1,4 +1,3 @@
-import json
 import re
 from datetime import date, timedelta
 from os import getenv
@@ -6,7 +5,10 @@ from typing import List, Optional
 
 import pandas as pd
 from dotenv import load_dotenv
-from sqlalchemy import create_engine, text
+from sqlalchemy import text
+
+from shared.database import Database
+from shared.log_parsing import LogParser
 
 
 class SQLConnection():
@@ -19,7 +21,7 @@ class SQLConnection():
     db_name = getenv('DB_NAME')
   
 
-    engine = create_engine(f'postgresql://{db_user}:{db_password}@{db_host}:{db_port}/{db_name}', pool_pre_ping=True)
+    engine = Database.create_engine('production')
 
     @staticmethod
     def create_db_schemas(schema_list):
@@ -131,371 +133,456 @@ class SQLConnection():
         else:
             return False
 
-class Transform():
+class Partition():
+    schema = 'yusra_stories_production'
+    table = 'rides'
+    months_ahead = int(getenv('RIDES_PARTITION_MONTHS_AHEAD', 3))
+    retention_months = int(getenv('RIDES_RETENTION_MONTHS', 24))
+    retention_mode = getenv('RIDES_RETENTION_MODE', 'drop')
+    # set once the rides table is known to exist, so warm Lambda invocations skip the catalog query
+    table_checked = False
 
     @staticmethod
-    def get_joined_formatted_df(logs_df:pd.DataFrame) -> pd.DataFrame:
+    def ensure_rides_table() -> None:
         """ 
-        Adds all the necessary columns to the latest_logs df
+        Creates the partitioned rides table before the first ride is written. Partition maintenance is left
+        to the retention handler: until it runs, rides land in the default partition
         """
-
-        # general columns
-        logs_df = Transform.add_is_new_ride_column(logs_df)
-        logs_df = Transform.add_is_info_column(logs_df)
-        logs_df = Transform.add_is_system_column(logs_df)
-        logs_df = Transform.add_datetime_column(logs_df)
-        # user columns (SYSTEM LOGS)
-        logs_df = Transform.add_user_id_column(logs_df)
-        logs_df = Transform.add_name_column(logs_df)
-        logs_df = Transform.add_gender_column(logs_df)
-        logs_df = Transform.add_date_of_birth_column(logs_df)
-        logs_df['date_of_birth'] = logs_df['date_of_birth'].apply(lambda x: pd.Timestamp(x, unit='ms'))
-        logs_df = Transform.add_age_column(logs_df)
-        logs_df = Transform.add_height_column(logs_df)
-        logs_df = Transform.add_weight_column(logs_df)
-        logs_df = Transform.add_address_column(logs_df) 
-        logs_df = Transform.add_email_address_column(logs_df)
-        logs_df = Transform.add_account_create_date_column(logs_df)
-        logs_df['account_created'] = logs_df['account_created'].apply(lambda x: pd.Timestamp(x, unit='ms'))
-        logs_df = Transform.add_bike_serial_column(logs_df)
-        logs_df = Transform.add_original_source_column(logs_df)
-        # ride columns (INFO LOGS)
-        logs_df = Transform.add_ride_duration_column(logs_df)
-        logs_df = Transform.add_heart_rate_column(logs_df)
-        logs_df = Transform.add_resistance_column(logs_df)
-        logs_df = Transform.add_rpm_column(logs_df)
-        logs_df = Transform.add_power_column(logs_df)
-        return logs_df
+        if Partition.table_checked:
+            return
+        if Partition.table not in SQLConnection.list_production_tables():
+            Partition.create_partitioned_rides_table()
+            Partition.create_upcoming_partitions(Partition.months_ahead)
+        Partition.table_checked = True
 
     @staticmethod
-    def get_users_df(formatted_df:pd.DataFrame) -> pd.DataFrame:
+    def ensure_partitioned_rides_table() -> None:
         """ 
-        Takes in the newly formatted (joined) df for latest logs and returns only those columns relevant for user table
+        Makes sure the production rides table is range partitioned by month on start_time,
+        migrating an existing unpartitioned table, and that partitions exist for the upcoming months
         """
-        system_logs = formatted_df[(formatted_df['is_system']) == True]
-        user_columns = ['user_id', 'name', 'gender', 'date_of_birth', 'age', 'height_cm', 'weight_kg', 'address', 'email_address', 'account_created', 'bike_serial', 'original_source']
-        user_df = system_logs[user_columns]
-        return user_df
+        if Partition.table not in SQLConnection.list_production_tables():
+            Partition.create_partitioned_rides_table()
+        elif not Partition.is_partitioned():
+            Partition.migrate_rides_to_partitioned()
+        Partition.create_upcoming_partitions(Partition.months_ahead)
 
     @staticmethod
-    def get_staging_rides_df(formatted_df):
+    def is_partitioned() -> bool:
         """ 
-        Takes in the formatted df for the latest logs and adds columns which will be used for the rides df
+        Queries the catalog to see if the rides table is already a partitioned table
         """
-        staging_ride_columns =  ['ride_id', 'user_id', 'time', 'duration_secs', 'heart_rate', 'resistance', 'power', 'rpm']
-        staging_rides_df = formatted_df[staging_ride_columns]
-        staging_rides_df = Transform.add_total_duration_column(staging_rides_df)
-        staging_rides_df = Transform.add_total_power_column(staging_rides_df)
-        staging_rides_df = Transform.add_max_heart_rate_column(staging_rides_df)
-        staging_rides_df = Transform.add_min_heart_rate_column(staging_rides_df)
-        staging_rides_df = Transform.add_avg_heart_rate_column(staging_rides_df)
-        staging_rides_df = Transform.add_avg_resistance_column(staging_rides_df)
-        staging_rides_df = Transform.add_avg_rpm_column(staging_rides_df)
-        staging_rides_df = Transform.add_start_time_column(staging_rides_df)
-        staging_rides_df = Transform.add_end_time_column(staging_rides_df)
-        return staging_rides_df
+        query_df = SQLConnection.read_query(f"""
+                SELECT c.relname
+                FROM pg_partitioned_table p
+                JOIN pg_class c ON c.oid = p.partrelid
+                JOIN pg_namespace n ON n.oid = c.relnamespace
+                WHERE n.nspname = '{Partition.schema}' AND c.relname = '{Partition.table}'
+                """)
+        return query_df.shape[0] >= 1
 
     @staticmethod
-    def get_final_rides_df(staging_rides_df:pd.DataFrame) -> pd.DataFrame:
+    def create_partitioned_rides_table(con=None) -> None:
         """ 
-        Takes in the staging rides df for the latest ride and returns only those columns relevant for final rides table
-        """
-        final_ride_columns = ['ride_id', 'user_id', 'start_time', 'end_time', 'total_duration', 'max_heart_rate_bpm', 'min_heart_rate_bpm', 'avg_heart_rate_bpm', 'avg_resistance', 'avg_rpm', 'total_power_kilojoules']
-        rides_df = staging_rides_df[final_ride_columns]
-        rides_df = rides_df.drop_duplicates()
-        rides_df = rides_df.dropna()
-        print(f'RIDE INFO GATHERED for ride_id: {staging_rides_df["ride_id"][0]}')
-        return rides_df
-
-    @staticmethod
-    def get_age(dob:date) -> int:
-        """
-        Calculates a person's age based on their date of birth
-        """
-        today = date.today()
-        try: 
-            birthday = dob.replace(year=today.year)
-        except ValueError: # raised when birth date is February 29 and the current year is not a leap year
-            birthday = dob.replace(year=today.year, month=dob.month+1, day=1)
-        if birthday > today:
-            return today.year - dob.year - 1
+        Creates the rides table partitioned by month on start_time, with a default partition
+        for rides falling outside the created ranges
+        """
+        statements = [
+            f"""CREATE TABLE IF NOT EXISTS {Partition.schema}.{Partition.table} (
+                ride_id BIGINT,
+                user_id BIGINT,
+                start_time TIMESTAMP NOT NULL,
+                end_time TIMESTAMP,
+                total_duration TEXT,
+                max_heart_rate_bpm BIGINT,
+                min_heart_rate_bpm BIGINT,
+                avg_heart_rate_bpm BIGINT,
+                avg_resistance BIGINT,
+                avg_rpm BIGINT,
+                total_power_kilojoules DOUBLE PRECISION
+            ) PARTITION BY RANGE (start_time)""",
+            f'CREATE INDEX IF NOT EXISTS rides_start_time_idx ON {Partition.schema}.{Partition.table} (start_time)',
+            f'CREATE INDEX IF NOT EXISTS rides_ride_id_idx ON {Partition.schema}.{Partition.table} (ride_id)',
+            f'CREATE INDEX IF NOT EXISTS rides_user_id_idx ON {Partition.schema}.{Partition.table} (user_id)',
+            f'CREATE TABLE IF NOT EXISTS {Partition.schema}.{Partition.table}_default PARTITION OF {Partition.schema}.{Partition.table} DEFAULT'
+        ]
+        if con is None:
+            with SQLConnection.engine.begin() as con:
+                for statement in statements:
+                    con.execute(text(statement))
         else:
-            return today.year - dob.year
+            for statement in statements:
+                con.execute(text(statement))
+        print(f'PARTITIONED TABLE {Partition.table} created in {Partition.schema}')
 
     @staticmethod
-    def reg_extract_log_datetime(log: str):
-        '''Parse log datetime from given log text'''
-        search = re.search('[0-9]{4}-[0-9]{2}-[0-9]{2} [0-9]{2}:[0-9]{2}:[0-9]{2}\.[0-9]{6}', log)
-        if search is not None: 
-            datetime = search.group(0)
-            return datetime
-        else:
-            return None
-
-    @staticmethod
-    def reg_extract_heart_rate(log: str):
-        '''Parse heart_rate from given log text'''
-        search = re.search('(hrt = )([0-9]*)', log)
-        if search is not None: 
-            heart_rate = search.group(2)
-            return int(heart_rate)
-        else:
-            return None
-
-    @staticmethod
-    def reg_extract_ride_duration(log: str):
-        '''Parse ride_duration from given log text'''
-        search = re.search('(duration = )([0-9]*)', log)
-        if search is not None: 
-            ride_duration = search.group(2)
-            return int(ride_duration)
-        else:
-            return None
-
-    @staticmethod
-    def reg_extract_resistance(log: str):
-        '''Parse resistance from given log text'''
-        search = re.search('(resistance = )([0-9]*)', log)
-        if search is not None: 
-            resistance = search.group(2)
-            return int(resistance)
-        else:
-            return None
-
-    @staticmethod
-    def reg_extract_rpm(log: str):
-        '''Parse rpm from given log text'''
-        search = re.search('(rpm = )([0-9]*)', log)
-        if search is not None: 
-            rpm = search.group(2)
-            return int(rpm)
-        else:
-            return None
-
-    @staticmethod
-    def reg_extract_power(log: str):
-        '''Parse power from given log text'''
-        search = re.search('(power = )([0-9]*.[0-9]{8})', log)
-        if search is not None: 
-            power = search.group(2)
-            return float(power)
-        else:
-            return None
-
-    @staticmethod
-    def add_is_new_ride_column(df:pd.DataFrame) -> pd.DataFrame:
+    def migrate_rides_to_partitioned() -> None:
         """ 
-        To indicate if a log marks the beginning of a new ride
-        """
-        df['is_new_ride'] = df['log'].str.contains('new ride')
-        return df
-
-    @staticmethod
-    def add_is_info_column(df:pd.DataFrame) -> pd.DataFrame:
+        Swaps an existing unpartitioned rides table for a partitioned one in a single transaction,
+        creating a partition for every month already holding rides before copying them across
+        """
+        heap_table = f'{Partition.table}_unpartitioned'
+        with SQLConnection.engine.begin() as con:
+            con.execute(text(f'ALTER TABLE {Partition.schema}.{Partition.table} RENAME TO {heap_table}'))
+            Partition.create_partitioned_rides_table(con)
+            first, last = con.execute(text(f'SELECT MIN(start_time), MAX(start_time) FROM {Partition.schema}.{heap_table}')).fetchone()
+            if first is not None:
+                for month_start in Partition.get_month_starts(first.date(), last.date()):
+                    Partition.create_partition(month_start, con)
+            con.execute(text(f"""
+                INSERT INTO {Partition.schema}.{Partition.table} (ride_id, user_id, start_time, end_time, total_duration, max_heart_rate_bpm,
+                    min_heart_rate_bpm, avg_heart_rate_bpm, avg_resistance, avg_rpm, total_power_kilojoules)
+                SELECT ride_id, user_id, start_time, end_time, total_duration, max_heart_rate_bpm,
+                    min_heart_rate_bpm, avg_heart_rate_bpm, avg_resistance, avg_rpm, total_power_kilojoules
+                FROM {Partition.schema}.{heap_table}
+                """))
+            con.execute(text(f'DROP TABLE {Partition.schema}.{heap_table}'))
+        print(f'{Partition.table} MIGRATED to a partitioned table in {Partition.schema}')
+
+    @staticmethod
+    def get_month_start(day:date, months_offset:int=0) -> date:
         """ 
-        To indicate if a log is an INFO log 
+        Returns the first day of the month the given day falls in, shifted by a number of months
         """
-        df['is_info'] = df.log.str.contains('INFO')
-        return df
+        month_index = day.year * 12 + day.month - 1 + months_offset
+        return date(month_index // 12, month_index % 12 + 1, 1)
 
     @staticmethod
-    def add_is_system_column(df:pd.DataFrame) -> pd.DataFrame:
+    def get_month_starts(first:date, last:date) -> list:
         """ 
-        To indicate if a log is a SYSTEM log 
+        Returns the first day of every month from the month of first to the month of last inclusive
         """
-        df['is_system'] = df.log.str.contains('SYSTEM')
-        return df
+        month_starts = []
+        month_start = Partition.get_month_start(first)
+        while month_start <= last:
+            month_starts.append(month_start)
+            month_start = Partition.get_month_start(month_start, 1)
+        return month_starts
 
     @staticmethod
-    def add_datetime_column(df:pd.DataFrame) -> pd.DataFrame:
+    def get_partition_name(month_start:date) -> str:
         """ 
-        Holds the datetime of when the log was published
-        """
-        df['time'] = df['log'].apply(Transform.reg_extract_log_datetime)
-        df['time'] = pd.to_datetime(df['time'])
-        return df
-
-    @staticmethod
-    def add_age_column(user_df:pd.DataFrame) -> pd.DataFrame:
+        Name of the partition holding the rides for the given month e.g. rides_2022_10
         """
-        Adds the age of each user
-        """
-        user_df['age'] = user_df['date_of_birth'].apply(Transform.get_age)
-        return user_df
-
-    @staticmethod
-    def heart_rate_zeros_to_nans(hr):
-        if hr is 0:
-            return pd.NA
-        else:
-            return hr
+        return f'{Partition.table}_{month_start.year}_{month_start.month:02d}'
 
     @staticmethod
-    def add_heart_rate_column(df:pd.DataFrame) -> pd.DataFrame:
+    def partition_exists(partition_name:str, con) -> bool:
         """ 
-        Shows heart rate stat for the relevant INFO logs
+        Checks the catalog for a table with the given name in the production schema
         """
-        df['heart_rate'] = df.log.apply(Transform.reg_extract_heart_rate)
-        df['heart_rate'] = df['heart_rate'].astype('Int64')
-        df['heart_rate'] = df['heart_rate'].apply(Transform.heart_rate_zeros_to_nans)
-        return df
+        return con.execute(text('SELECT to_regclass(:name)'), {'name': f'{Partition.schema}.{partition_name}'}).scalar() is not None
 
     @staticmethod
-    def add_ride_duration_column(df:pd.DataFrame) -> pd.DataFrame:
+    def create_partition(month_start:date, con=None) -> None:
         """ 
-        Shows ride duration stat for the relevant INFO logs
-        """
-        df['duration_secs'] = df['log'].apply(Transform.reg_extract_ride_duration)
-        return df
-
-    @staticmethod
-    def add_resistance_column(df:pd.DataFrame) -> pd.DataFrame:
+        Creates the partition for a month if it does not already exist. Postgres refuses to add a range
+        the default partition already holds rows for, so the partition is created detached, that month's
+        rides are moved into it from the default partition and it is then attached
+        """
+        if con is None:
+            with SQLConnection.engine.begin() as con:
+                Partition.create_partition(month_start, con)
+            return
+
+        partition_name = Partition.get_partition_name(month_start)
+        if Partition.partition_exists(partition_name, con):
+            return
+        default_partition = f'{Partition.schema}.{Partition.table}_default'
+        month_range = {'month_start': month_start, 'next_month_start': Partition.get_month_start(month_start, 1)}
+        # stops rides being written to the default partition between the move and the attach
+        con.execute(text(f'LOCK TABLE {default_partition} IN ACCESS EXCLUSIVE MODE'))
+        con.execute(text(f"""
+            CREATE TABLE {Partition.schema}.{partition_name}
+            (LIKE {Partition.schema}.{Partition.table} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)
+            """))
+        moved = con.execute(text(f"""
+            WITH moved AS (
+                DELETE FROM {default_partition}
+                WHERE start_time >= :month_start AND start_time < :next_month_start
+                RETURNING *
+            )
+            INSERT INTO {Partition.schema}.{partition_name} SELECT * FROM moved
+            """), month_range).rowcount
+        con.execute(text(f"""
+            ALTER TABLE {Partition.schema}.{Partition.table}
+            ATTACH PARTITION {Partition.schema}.{partition_name}
+            FOR VALUES FROM ('{month_range['month_start']}') TO ('{month_range['next_month_start']}')
+            """))
+        if moved:
+            print(f'{moved} ROWS MOVED from {Partition.table}_default to {partition_name}')
+
+    @staticmethod
+    def create_upcoming_partitions(months_ahead:int) -> None:
         """ 
-        Shows resistance setting for the relevant INFO logs
+        Creates the partitions for the current month and the given number of months ahead
         """
-        df['resistance'] = df['log'].apply(Transform.reg_extract_resistance)
-        return df
+        this_month = Partition.get_month_start(date.today())
+        with SQLConnection.engine.begin() as con:
+            for months_offset in range(months_ahead + 1):
+                Partition.create_partition(Partition.get_month_start(this_month, months_offset), con)
 
     @staticmethod
-    def add_rpm_column(df:pd.DataFrame) -> pd.DataFrame:
+    def list_partitions() -> list:
         """ 
-        Shows rotations per minute for the relevant INFO logs
+        Returns the names of the monthly partitions attached to the rides table
         """
-        df['rpm'] = df['log'].apply(Transform.reg_extract_rpm)
-        return df
+        partitions_info = SQLConnection.read_query(f"""
+                SELECT child.relname AS partition_name
+                FROM pg_inherits
+                JOIN pg_class parent ON parent.oid = pg_inherits.inhparent
+                JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+                JOIN pg_namespace n ON n.oid = parent.relnamespace
+                WHERE n.nspname = '{Partition.schema}' AND parent.relname = '{Partition.table}'
+                """)
+        return [name for name in partitions_info.partition_name if re.fullmatch(f'{Partition.table}_[0-9]{{4}}_[0-9]{{2}}', name)]
 
     @staticmethod
-    def add_power_column(df:pd.DataFrame) -> pd.DataFrame:
+    def remove_partitions_before(cutoff:date, detach_only:bool=False) -> list:
         """ 
-        Shows power stat for the relevant INFO logs
-        """
-        df['power'] = df['log'].apply(Transform.reg_extract_power)
-        return df
-
-    @staticmethod
-    def get_user_dict(log:str) -> dict:
-        """
-        Gets the user dictionary from the SYSTEM logs, returns None for other logs
-        """
-        search = re.search('(data = )({.*})', log)
-        if search is not None: 
-            user_dict = json.loads(search.group(2))
-            return user_dict
-        else:
-            return None
-
-    @staticmethod
-    def get_value_from_user_dict(log:str, value:str) -> pd.Series:
-        """
-        Gets a given value from the SYSTEM logs user dictionaries, returns None for other logs
-        """
-        user_dict = Transform.get_user_dict(log)
-        if user_dict:
-            return user_dict[value]
-        else:
-            return None
-
-    @staticmethod
-    def add_user_id_column(df:pd.DataFrame) -> pd.DataFrame:
+        Detaches every monthly partition that ends on or before the cutoff month and, unless detach_only,
+        drops it. Detached partitions stay in the schema as standalone tables for archiving
+        """
+        cutoff_month = Partition.get_month_start(cutoff)
+        removed = []
+        with SQLConnection.engine.begin() as con:
+            for partition_name in Partition.list_partitions():
+                year, month = partition_name.split('_')[-2:]
+                if date(int(year), int(month), 1) < cutoff_month:
+                    con.execute(text(f'ALTER TABLE {Partition.schema}.{Partition.table} DETACH PARTITION {Partition.schema}.{partition_name}'))
+                    if not detach_only:
+                        con.execute(text(f'DROP TABLE {Partition.schema}.{partition_name}'))
+                    removed.append(partition_name)
+        action = 'DETACHED' if detach_only else 'DROPPED'
+        print(f'{len(removed)} PARTITIONS {action} from {Partition.schema}.{Partition.table}: {removed}')
+        return removed
+
+    @staticmethod
+    def apply_retention() -> list:
         """ 
-        Shows user id for the relevant SYSTEM logs
-        """
-        df['user_id'] = df['log'].apply(Transform.get_value_from_user_dict, args=['user_id'])
-        df['user_id'] = df['user_id'].astype('Int64')
-        return df
-
-    @staticmethod
-    def add_name_column(df:pd.DataFrame) -> pd.DataFrame:
+        Removes the partitions older than the configured retention period, keeping whole months
+        """
+        cutoff = Partition.get_month_start(date.today(), -Partition.retention_months)
+        detach_only = Partition.retention_mode == 'detach'
+        if not detach_only:
+            # back-dated rides older than the retention period never get a monthly partition
+            with SQLConnection.engine.begin() as con:
+                deleted = con.execute(text(f'DELETE FROM {Partition.schema}.{Partition.table}_default WHERE start_time < :cutoff'),
+                    {'cutoff': cutoff}).rowcount
+            print(f'{deleted} ROWS older than {cutoff} DELETED from {Partition.table}_default')
+        return Partition.remove_partitions_before(cutoff, detach_only=detach_only)
+
+class Rollup():
+    schema = 'yusra_stories_production'
+    table = 'daily_rollup'
+    # one row per ride counted in the rollup, so a ride is never added twice
+    rides_table = 'daily_rollup_rides'
+
+    # age groups shown on the daily report and dashboard, rides with no matching user fall under Unknown
+    age_bin_case = """
+        CASE
+            WHEN users.age IS NULL OR users.age <= 0 THEN 'Unknown'
+            WHEN users.age <= 18 THEN 'Kids (< 18)'
+            WHEN users.age <= 26 THEN 'Young Adults (18-25)'
+            WHEN users.age <= 39 THEN 'Adults (25-40)'
+            WHEN users.age <= 65 THEN 'Middle Age (40-65)'
+            ELSE 'Seniors (65+)'
+        END"""
+
+    @staticmethod
+    def ensure_rollup_table() -> bool:
         """ 
-        Shows name for the relevant SYSTEM logs
+        Creates the daily rollup tables if they do not exist yet, backfilling them from the rides already in production.
+        Returns whether they were rebuilt
         """
-        df['name'] = df['log'].apply(Transform.get_value_from_user_dict, args=['name'])
-        return df
-
-    @staticmethod
-    def add_gender_column(df:pd.DataFrame) -> pd.DataFrame:
+        production_tables = SQLConnection.list_production_tables()
+        if Rollup.table in production_tables and Rollup.rides_table in production_tables:
+            return False
+        with SQLConnection.engine.begin() as con:
+            con.execute(text(f"""
+                CREATE TABLE IF NOT EXISTS {Rollup.schema}.{Rollup.table} (
+                    day DATE NOT NULL,
+                    gender TEXT NOT NULL,
+                    age_bin TEXT NOT NULL,
+                    ride_count BIGINT NOT NULL,
+                    distinct_riders BIGINT NOT NULL,
+                    total_power_kilojoules DOUBLE PRECISION NOT NULL,
+                    total_heart_rate_bpm BIGINT NOT NULL,
+                    PRIMARY KEY (day, gender, age_bin)
+                )"""))
+            con.execute(text(f"""
+                CREATE TABLE IF NOT EXISTS {Rollup.schema}.{Rollup.rides_table} (
+                    ride_id BIGINT PRIMARY KEY,
+                    user_id BIGINT,
+                    day DATE NOT NULL
+                )"""))
+            con.execute(text(f'CREATE INDEX IF NOT EXISTS {Rollup.rides_table}_day_user_idx ON {Rollup.schema}.{Rollup.rides_table} (day, user_id)'))
+        print(f'TABLES {Rollup.table} and {Rollup.rides_table} created in {Rollup.schema}')
+        Rollup.rebuild_rollup()
+        return True
+
+    @staticmethod
+    def rebuild_rollup() -> None:
         """ 
-        Shows gender for the relevant SYSTEM logs
-        """
-        df['gender'] = df['log'].apply(Transform.get_value_from_user_dict, args=['gender'])
-        return df
-
-    @staticmethod
-    def add_address_column(df:pd.DataFrame) -> pd.DataFrame:
+        Recomputes the whole rollup table from the rides and users tables
+        """
+        with SQLConnection.engine.begin() as con:
+            con.execute(text(f'TRUNCATE {Rollup.schema}.{Rollup.table}, {Rollup.schema}.{Rollup.rides_table}'))
+            con.execute(text(f"""
+                INSERT INTO {Rollup.schema}.{Rollup.rides_table}
+                SELECT DISTINCT ON (ride_id) ride_id, user_id, CAST(start_time AS DATE)
+                FROM {Rollup.schema}.rides
+                WHERE ride_id IS NOT NULL
+                """))
+            con.execute(text(f"""
+                INSERT INTO {Rollup.schema}.{Rollup.table}
+                SELECT CAST(rides.start_time AS DATE), COALESCE(users.gender, 'Unknown'), {Rollup.age_bin_case},
+                    COUNT(*), COUNT(DISTINCT rides.user_id),
+                    COALESCE(SUM(rides.total_power_kilojoules), 0), COALESCE(SUM(rides.avg_heart_rate_bpm), 0)
+                FROM {Rollup.schema}.rides
+                LEFT JOIN (SELECT DISTINCT ON (user_id) user_id, gender, age FROM {Rollup.schema}.users) AS users
+                USING (user_id)
+                GROUP BY 1, 2, 3
+                """))
+        print(f'{Rollup.table} REBUILT from {Rollup.schema}.rides')
+
+    @staticmethod
+    def add_ride_to_rollup(ride_id:int) -> bool:
         """ 
-        Shows address for the relevant SYSTEM logs
-        """
-        df['address'] = df['log'].apply(Transform.get_value_from_user_dict, args=['address'])
-        return df
+        Adds a newly written ride to its day, gender and age bin in the rollup table. The ride is first recorded
+        in the rollup rides table, in the same transaction, and skipped if it is already there, so a retried run
+        does not count it twice. The rider only counts towards distinct_riders if it is their first ride of the day.
+        Returns whether the ride was added
+        """
+        with SQLConnection.engine.begin() as con:
+            recorded = con.execute(text(f"""
+                INSERT INTO {Rollup.schema}.{Rollup.rides_table}
+                SELECT ride_id, user_id, CAST(start_time AS DATE)
+                FROM {Rollup.schema}.rides
+                WHERE ride_id = :ride_id
+                LIMIT 1
+                ON CONFLICT (ride_id) DO NOTHING
+                """), {'ride_id': int(ride_id)}).rowcount
+            if not recorded:
+                print(f'ride_id: {ride_id} ALREADY IN {Rollup.table.upper()}')
+                return False
+            con.execute(text(f"""
+                INSERT INTO {Rollup.schema}.{Rollup.table}
+                SELECT CAST(rides.start_time AS DATE), COALESCE(users.gender, 'Unknown'), {Rollup.age_bin_case},
+                    1,
+                    CASE WHEN EXISTS (
+                        SELECT 1 FROM {Rollup.schema}.{Rollup.rides_table} AS earlier
+                        WHERE earlier.day = CAST(rides.start_time AS DATE) AND earlier.user_id = rides.user_id
+                        AND earlier.ride_id <> rides.ride_id
+                    ) THEN 0 ELSE 1 END,
+                    COALESCE(rides.total_power_kilojoules, 0), COALESCE(rides.avg_heart_rate_bpm, 0)
+                FROM (SELECT * FROM {Rollup.schema}.rides WHERE ride_id = :ride_id LIMIT 1) AS rides
+                LEFT JOIN (SELECT DISTINCT ON (user_id) user_id, gender, age FROM {Rollup.schema}.users) AS users
+                USING (user_id)
+                ON CONFLICT (day, gender, age_bin) DO UPDATE SET
+                    ride_count = {Rollup.table}.ride_count + EXCLUDED.ride_count,
+                    distinct_riders = {Rollup.table}.distinct_riders + EXCLUDED.distinct_riders,
+                    total_power_kilojoules = {Rollup.table}.total_power_kilojoules + EXCLUDED.total_power_kilojoules,
+                    total_heart_rate_bpm = {Rollup.table}.total_heart_rate_bpm + EXCLUDED.total_heart_rate_bpm
+                """), {'ride_id': int(ride_id)})
+        print(f'ride_id: {ride_id} ADDED TO {Rollup.table.upper()} in {Rollup.schema}')
+        return True
 
-    @staticmethod
-    def add_date_of_birth_column(df:pd.DataFrame) -> pd.DataFrame:
-        """ 
-        Shows date of birth for the relevant SYSTEM logs
-        """
-        df['date_of_birth'] = df['log'].apply(Transform.get_value_from_user_dict, args=['date_of_birth'])
-        return df
+class Transform():
+
+    # SYSTEM log user dictionary fields kept for the users table
+    user_fields = ['user_id', 'name', 'gender', 'date_of_birth', 'height_cm', 'weight_kg', 'address', 'email_address', 'account_create_date', 'bike_serial', 'original_source']
+    # parsed fields stored under a different column name
+    parsed_column_names = {'duration': 'duration_secs', 'account_create_date': 'account_created'}
 
     @staticmethod
-    def add_email_address_column(df:pd.DataFrame) -> pd.DataFrame:
+    def get_joined_formatted_df(logs_df:pd.DataFrame) -> pd.DataFrame:
         """ 
-        Shows email address for the relevant SYSTEM logs
+        Adds all the necessary columns to the latest_logs df, parsing each log once
         """
-        df['email_address'] = df['log'].apply(Transform.get_value_from_user_dict, args=['email_address'])
-        return df
+
+        logs_df = Transform.add_parsed_columns(logs_df)
+        # general columns
+        logs_df['time'] = pd.to_datetime(logs_df['time'])
+        # user columns (SYSTEM LOGS)
+        logs_df['user_id'] = logs_df['user_id'].astype('Int64')
+        logs_df['date_of_birth'] = logs_df['date_of_birth'].apply(lambda x: pd.Timestamp(x, unit='ms'))
+        logs_df = Transform.add_age_column(logs_df)
+        logs_df['account_created'] = logs_df['account_created'].apply(lambda x: pd.Timestamp(x, unit='ms'))
+        # ride columns (INFO LOGS)
+        logs_df['heart_rate'] = logs_df['heart_rate'].astype('Int64')
+        logs_df['heart_rate'] = logs_df['heart_rate'].apply(Transform.heart_rate_zeros_to_nans)
+        return logs_df
 
     @staticmethod
-    def add_height_column(df:pd.DataFrame) -> pd.DataFrame:
+    def get_users_df(formatted_df:pd.DataFrame) -> pd.DataFrame:
         """ 
-        Shows height for the relevant SYSTEM logs
+        Takes in the newly formatted (joined) df for latest logs and returns only those columns relevant for user table
         """
-        df['height_cm'] = df['log'].apply(Transform.get_value_from_user_dict, args=['height_cm'])
-        return df
+        system_logs = formatted_df[(formatted_df['is_system']) == True]
+        user_columns = ['user_id', 'name', 'gender', 'date_of_birth', 'age', 'height_cm', 'weight_kg', 'address', 'email_address', 'account_created', 'bike_serial', 'original_source']
+        user_df = system_logs[user_columns]
+        return user_df
 
     @staticmethod
-    def add_weight_column(df:pd.DataFrame) -> pd.DataFrame:
+    def get_staging_rides_df(formatted_df):
         """ 
-        Shows weight for the relevant SYSTEM logs
+        Takes in the formatted df for the latest logs and adds columns which will be used for the rides df
         """
-        df['weight_kg'] = df['log'].apply(Transform.get_value_from_user_dict, args=['weight_kg'])
-        return df
+        staging_ride_columns =  ['ride_id', 'user_id', 'time', 'duration_secs', 'heart_rate', 'resistance', 'power', 'rpm']
+        staging_rides_df = formatted_df[staging_ride_columns]
+        staging_rides_df = Transform.add_total_duration_column(staging_rides_df)
+        staging_rides_df = Transform.add_total_power_column(staging_rides_df)
+        staging_rides_df = Transform.add_max_heart_rate_column(staging_rides_df)
+        staging_rides_df = Transform.add_min_heart_rate_column(staging_rides_df)
+        staging_rides_df = Transform.add_avg_heart_rate_column(staging_rides_df)
+        staging_rides_df = Transform.add_avg_resistance_column(staging_rides_df)
+        staging_rides_df = Transform.add_avg_rpm_column(staging_rides_df)
+        staging_rides_df = Transform.add_start_time_column(staging_rides_df)
+        staging_rides_df = Transform.add_end_time_column(staging_rides_df)
+        return staging_rides_df
 
     @staticmethod
-    def add_account_create_date_column(df:pd.DataFrame) -> pd.DataFrame:
+    def get_final_rides_df(staging_rides_df:pd.DataFrame) -> pd.DataFrame:
         """ 
-        Shows account create date for the relevant SYSTEM logs
+        Takes in the staging rides df for the latest ride and returns only those columns relevant for final rides table
         """
-        df['account_created'] = df['log'].apply(Transform.get_value_from_user_dict, args=['account_create_date'])
-        return df
+        final_ride_columns = ['ride_id', 'user_id', 'start_time', 'end_time', 'total_duration', 'max_heart_rate_bpm', 'min_heart_rate_bpm', 'avg_heart_rate_bpm', 'avg_resistance', 'avg_rpm', 'total_power_kilojoules']
+        rides_df = staging_rides_df[final_ride_columns]
+        rides_df = rides_df.drop_duplicates()
+        rides_df = rides_df.dropna()
+        print(f'RIDE INFO GATHERED for ride_id: {staging_rides_df["ride_id"][0]}')
+        return rides_df
 
     @staticmethod
-    def add_bike_serial_column(df:pd.DataFrame) -> pd.DataFrame:
+    def add_parsed_columns(df:pd.DataFrame) -> pd.DataFrame:
         """ 
-        Shows bike serial number for the relevant SYSTEM logs
-        """
-        df['bike_serial'] = df['log'].apply(Transform.get_value_from_user_dict, args=['bike_serial'])
+        Parses every log once, adding whether it is a new ride, INFO or SYSTEM log, when it was published,
+        the user details for the SYSTEM logs and the ride stats for the INFO logs
+        """
+        columns = LogParser.to_columns(LogParser.parse_many(df['log']), Transform.user_fields)
+        kinds = columns.pop('kind')
+        df['is_new_ride'] = [kind == LogParser.NEW_RIDE for kind in kinds]
+        df['is_info'] = [kind in (LogParser.RIDE, LogParser.TELEMETRY) for kind in kinds]
+        df['is_system'] = [kind == LogParser.SYSTEM for kind in kinds]
+        for column, values in columns.items():
+            df[Transform.parsed_column_names.get(column, column)] = values
         return df
 
     @staticmethod
-    def add_original_source_column(df:pd.DataFrame) -> pd.DataFrame:
-        """ 
-        Shows original source for the relevant SYSTEM logs
+    def add_age_column(user_df:pd.DataFrame) -> pd.DataFrame:
         """
-        df['original_source'] = df['log'].apply(Transform.get_value_from_user_dict, args=['original_source'])
-        return df
+        Adds the age of each user
+        """
+        user_df['age'] = user_df['date_of_birth'].apply(LogParser.get_age)
+        return user_df
 
     @staticmethod
-    def get_age(dob:date) -> int:
-        """Calculates a users age based on their date of birth"""
-        today = date.today()
-        try: 
-            birthday = dob.replace(year=today.year)
-        except ValueError: # raised when birth date is February 29 and the current year is not a leap year
-            birthday = dob.replace(year=today.year, month=dob.month+1, day=1)
-        if birthday > today:
-            return today.year - dob.year - 1
+    def heart_rate_zeros_to_nans(hr):
+        if hr is 0:
+            return pd.NA
         else:
-            return today.year - dob.year
+            return hr
 
     @staticmethod
     def add_total_duration_column(staging_rides_df:pd.DataFrame) -> pd.DataFrame:
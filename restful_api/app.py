@@ -3,12 +3,17 @@ from app_helpers import Functionality as F
 from flask import Flask, json, request
 from flask_sqlalchemy import SQLAlchemy
 
+from shared.database import Database
+
 app = Flask(__name__)
 
-app.config['SQLALCHEMY_DATABASE_URI'] = f'postgresql://{F.db_user}:{F.db_password}@{F.db_host}:{F.db_port}/{F.db_name}'
+app.config['SQLALCHEMY_DATABASE_URI'] = Database.get_url()
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = Database.get_engine_options('restful_api')
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 
 db = SQLAlchemy(app)
+with app.app_context():
+    Database.add_timing_hooks(db.engine, 'restful_api')
 
 @app.route('/', methods=['GET'])
 def index() -> str:
@@ -41,7 +46,7 @@ def ride_id(id:int) -> json:
 
     if (request.method == 'DELETE'):
 
-        return F.delete_by_id(id)
+        return F.delete_by_id(id, db)
 
 @app.route('/rider/<user_id>', methods=['GET'])
 def get_rider_info(user_id:int) -> json:
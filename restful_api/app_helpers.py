@@ -25,13 +25,9 @@ class Functionality():
         """
         current_date = Utilities.get_current_date()
         todays_rides_result = db.session.execute(f"""
-        WITH rides AS (  
-        SELECT *, CAST(start_time AS DATE) AS start_date
-        FROM yusra_stories_production.rides
-        )
         SELECT * 
-        FROM rides
-        WHERE start_date = '{current_date}'
+        FROM yusra_stories_production.rides
+        WHERE start_time >= DATE '{current_date}' AND start_time < DATE '{current_date}' + 1
         ORDER BY ride_id;
         """)
         todays_rides_list = Format.format_rides_as_list(todays_rides_result)
@@ -41,18 +37,17 @@ class Functionality():
     @staticmethod
     def get_rides_at_specific_date(date:str, db) -> json:
         """
-        For a given date string input, 
-        Returns a JSON object of the corresponding rides 
+        For a given date string input (DD-MM-YYYY), 
+        Returns a JSON object of the corresponding rides, or a 400 for a date that does not parse
         """
-        formatted_date = Format.format_date(date)
+        try:
+            formatted_date = Format.format_date(date)
+        except ValueError:
+            return Format.invalid_date_message, 400
         rides_at_specified_date_result = db.session.execute(f"""
-        WITH rides AS (  
-        SELECT *, CAST(start_time AS DATE) AS start_date
-        FROM yusra_stories_production.rides
-        )
         SELECT * 
-        FROM rides
-        WHERE start_date = '{formatted_date}'
+        FROM yusra_stories_production.rides
+        WHERE start_time >= DATE '{formatted_date}' AND start_time < DATE '{formatted_date}' + 1
         ORDER BY ride_id;
         """)
         rides_at_specified_date_list = Format.format_rides_as_list(rides_at_specified_date_result)
@@ -115,6 +110,9 @@ class Functionality():
 
 class Format():
 
+    date_format = '%d-%m-%Y'
+    invalid_date_message = 'Invalid date, expected DD-MM-YYYY'
+
     @staticmethod
     def format_rides_as_list(rides) -> list:
         """
@@ -169,13 +167,10 @@ class Format():
     @staticmethod
     def format_date (searched_date:str) -> str:
         """
-        Formats searched date parameter
+        Formats searched date parameter (DD-MM-YYYY, zero padding optional) as YYYY-MM-DD.
+        Raises ValueError for a date that does not parse
         """
-        date_list = searched_date.split('-')
-        day = date_list[0]
-        month = date_list[1]
-        year = date_list[2]
-        formatted_date = year +'-'+ month +'-' + day
+        formatted_date = datetime.strptime(searched_date, Format.date_format).strftime('%Y-%m-%d')
         return formatted_date
 
 
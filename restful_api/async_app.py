@@ -0,0 +1,67 @@
+
+from async_app_helpers import AsyncFunctionality as AF
+from async_app_helpers import Pool
+from quart import Quart, json, request
+
+app = Quart(__name__)
+
+
+@app.before_serving
+async def create_pool():
+    app.pool = await Pool.create_pool()
+
+@app.after_serving
+async def close_pool():
+    await app.pool.close()
+
+@app.route('/', methods=['GET'])
+async def index() -> str:
+    return "Welcome to the Deloton Exercise Bikes API!"
+
+
+@app.route('/daily', methods=['GET'])
+async def get_rides() -> json:
+    """
+    Returns a JSON object of all rides occurring on the date specified
+    with the query parameter. If no date is searched, returns a JSON
+    object of all rides on the current date
+    """
+    searched_date = request.args.get('date')
+    if searched_date == None:
+
+        return await AF.get_todays_rides(app.pool)
+    else:
+
+        return await AF.get_rides_at_specific_date(searched_date, app.pool)
+
+@app.route('/ride/<id>', methods=['GET','DELETE'])
+async def ride_id(id:int) -> json:
+    """
+    For a given ID string input, returns a different JSON object
+    based on the chosen request method
+    """
+    if (request.method == 'GET'):
+        return await AF.get_ride_by_id(id, app.pool)
+
+    if (request.method == 'DELETE'):
+
+        return await AF.delete_by_id(id, app.pool)
+
+@app.route('/rider/<user_id>', methods=['GET'])
+async def get_rider_info(user_id:int) -> json:
+    """
+    Returns a JSON object containing rider information (e.g. name, gender, age,
+    avg. heart rate, number of rides) for a rider with a specific ID string input
+    """
+    return await AF.get_rider_info_by_id(user_id, app.pool)
+
+@app.route('/rider/<user_id>/rides', methods=['GET'])
+async def get_all_rides_for_given_user(user_id:int) -> json:
+    """
+    Returns a JSON object containing all rides for a rider with
+    a specific ID string input
+    """
+    return await AF.get_all_rides_for_rider(user_id, app.pool)
+
+if __name__ == "__main__":
+    app.run(host="0.0.0.0", port=5000)
@@ -0,0 +1,120 @@
+from datetime import date
+from types import SimpleNamespace
+
+import asyncpg
+from quart import jsonify
+
+from app_helpers import Format
+from app_helpers import Utilities
+from shared.database import Database
+
+
+class Pool():
+
+    min_size = 1
+    max_size = 20
+
+    @staticmethod
+    async def create_pool() -> asyncpg.Pool:
+        """
+        Creates the asyncpg connection pool shared by every request
+        """
+        pool = await asyncpg.create_pool(
+            Database.get_url(),
+            min_size=Pool.min_size,
+            max_size=Pool.max_size,
+            server_settings=Database.get_server_settings('async_api')
+            )
+        return pool
+
+
+class AsyncFunctionality():
+
+    @staticmethod
+    async def get_todays_rides(pool: asyncpg.Pool):
+        """
+        Returns a JSON object of all rides on the current date
+        """
+        current_date = Utilities.get_current_date()
+        return await AsyncFunctionality.get_rides_on_date(date.fromisoformat(current_date), pool)
+
+    @staticmethod
+    async def get_rides_at_specific_date(searched_date: str, pool: asyncpg.Pool):
+        """
+        For a given date string input (DD-MM-YYYY),
+        Returns a JSON object of the corresponding rides, or a 400 for a date that does not parse
+        """
+        try:
+            formatted_date = Format.format_date(searched_date)
+        except ValueError:
+            return Format.invalid_date_message, 400
+        return await AsyncFunctionality.get_rides_on_date(date.fromisoformat(formatted_date), pool)
+
+    @staticmethod
+    async def get_rides_on_date(ride_date: date, pool: asyncpg.Pool):
+        """
+        Returns a JSON object of all rides starting on the given date
+        """
+        rides_on_date_result = await pool.fetch("""
+        SELECT *
+        FROM yusra_stories_production.rides
+        WHERE start_time >= $1::date AND start_time < $1::date + 1
+        ORDER BY ride_id;
+        """, ride_date)
+        rides_on_date_list = Format.format_rides_as_list(AsyncFunctionality.records_to_rows(rides_on_date_result))
+        return jsonify(rides_on_date_list)
+
+    @staticmethod
+    async def get_ride_by_id(id: int, pool: asyncpg.Pool):
+        """
+        Returns a json object of a ride for a given ride_id
+        """
+        ride_by_id_result = await pool.fetch('SELECT * FROM yusra_stories_production.rides WHERE ride_id = $1;', int(id))
+        ride_by_id_list = Format.format_rides_as_list(AsyncFunctionality.records_to_rows(ride_by_id_result))
+        return jsonify(ride_by_id_list)
+
+    @staticmethod
+    async def delete_by_id(id: int, pool: asyncpg.Pool):
+        """
+        Deletes a ride with a specific ID
+        """
+        await pool.execute('DELETE FROM yusra_stories_production.rides WHERE ride_id = $1;', int(id))
+        return 'Ride Deleted!', 200
+
+    @staticmethod
+    async def get_rider_info_by_id(user_id: int, pool: asyncpg.Pool):
+        """
+        Returns a json object of rider information (name, gender, age ect) and
+        aggregate ride info (avg. heart rate, number of rides) for a given user_id
+        """
+        rider_info_result = await pool.fetch("""
+        WITH aggregate_rides AS (
+            SELECT "user_id", COUNT("ride_id") AS "number_of_rides" , ROUND(AVG("avg_heart_rate_bpm")) AS "avg_heart_rate_bpm"
+            FROM yusra_stories_production.rides
+            WHERE "user_id" = $1
+            GROUP BY "user_id"
+        )
+        SELECT  "user_id", "name", "gender", "age", "height_cm", "weight_kg",
+        "address", "email_address", "number_of_rides", "avg_heart_rate_bpm"
+        FROM yusra_stories_production.users
+        JOIN aggregate_rides
+        USING ("user_id");
+        """, int(user_id))
+        rider_info_list = Format.format_rider_info_as_list(AsyncFunctionality.records_to_rows(rider_info_result))
+        return jsonify(rider_info_list)
+
+    @staticmethod
+    async def get_all_rides_for_rider(user_id: int, pool: asyncpg.Pool):
+        """
+        Returns a json object of all the rides for a given user_id
+        """
+        rides_for_rider_results = await pool.fetch('SELECT * FROM yusra_stories_production.rides WHERE "user_id" = $1;', int(user_id))
+        rides_for_rider_list = Format.format_rides_as_list(AsyncFunctionality.records_to_rows(rides_for_rider_results))
+        return jsonify(rides_for_rider_list)
+
+    @staticmethod
+    def records_to_rows(records: list) -> list:
+        """
+        Wraps asyncpg records so the attribute access used by Format works on them
+        """
+        return [SimpleNamespace(**record) for record in records]
@@ -0,0 +1,154 @@
+import asyncio
+from datetime import datetime
+from decimal import Decimal
+from types import SimpleNamespace
+
+import pytest
+
+import app as flask_api
+import async_app as quart_api
+
+RIDES = [
+    {'ride_id': 1, 'user_id': 3962, 'start_time': datetime(2022, 10, 13, 10, 7, 41), 'end_time': datetime(2022, 10, 13, 10, 37, 41),
+        'total_duration': 1800, 'max_heart_rate_bpm': 188, 'min_heart_rate_bpm': 0, 'avg_heart_rate_bpm': 112.5,
+        'avg_resistance': 30.0, 'avg_rpm': 49.2, 'total_power_kilojoules': 21.3},
+    {'ride_id': 2, 'user_id': 3962, 'start_time': datetime(2022, 10, 13, 11, 0, 0), 'end_time': None,
+        'total_duration': None, 'max_heart_rate_bpm': None, 'min_heart_rate_bpm': None, 'avg_heart_rate_bpm': None,
+        'avg_resistance': None, 'avg_rpm': None, 'total_power_kilojoules': None},
+]
+RIDER_INFO = [
+    {'user_id': 3962, 'name': 'Katherine Goodwin', 'gender': 'female', 'age': 59, 'height_cm': 168, 'weight_kg': 68,
+        'address': 'Flat 27,Burke ports,Eastport,SO1 6XB', 'email_address': 'katherine.goodwin@hotmail.com',
+        'number_of_rides': 2, 'avg_heart_rate_bpm': Decimal('113')},
+]
+
+
+def rows_for(sql: str) -> list:
+    """
+    The rows the database would return for a query: rider info joins the users table, everything else reads rides
+    """
+    return RIDER_INFO if 'yusra_stories_production.users' in sql else RIDES
+
+
+class StubSession():
+    """
+    Flask-SQLAlchemy session stub, returning rows read by attribute like a SQLAlchemy result
+    """
+
+    def __init__(self, rows: list=None):
+        self.rows = rows
+        self.statements = []
+        self.commits = 0
+
+    def execute(self, sql):
+        self.statements.append(str(sql))
+        rows = rows_for(str(sql)) if self.rows == None else self.rows
+        return [SimpleNamespace(**row) for row in rows]
+
+    def commit(self):
+        self.commits += 1
+
+
+class StubPool():
+    """
+    asyncpg pool stub, returning rows as mappings like asyncpg records
+    """
+
+    def __init__(self, rows: list=None):
+        self.rows = rows
+        self.statements = []
+
+    async def fetch(self, sql: str, *args) -> list:
+        self.statements.append((sql, args))
+        return [dict(row) for row in (rows_for(sql) if self.rows == None else self.rows)]
+
+    async def execute(self, sql: str, *args) -> str:
+        self.statements.append((sql, args))
+        return 'DELETE 1'
+
+
+@pytest.fixture
+def clients(monkeypatch):
+    """
+    Returns a function that requests a path from both APIs, the Flask one with a stubbed session and the Quart
+    one with a stubbed pool, both returning the given rows (by default the rows the query would return)
+    """
+    stubs = {}
+
+    def request(method: str, path: str, rows: list=None) -> tuple:
+        session, pool = StubSession(rows), StubPool(rows)
+        monkeypatch.setattr(flask_api, 'db', SimpleNamespace(session=session))
+        monkeypatch.setattr(quart_api.app, 'pool', pool, raising=False)
+        stubs.update(session=session, pool=pool)
+
+        flask_response = flask_api.app.test_client().open(path, method=method)
+
+        async def quart_request():
+            response = await quart_api.app.test_client().open(path, method=method)
+            return response.status_code, await response.get_data()
+        quart_status, quart_body = asyncio.run(quart_request())
+        return (flask_response.status_code, flask_response.get_data()), (quart_status, quart_body)
+
+    request.stubs = stubs
+    return request
+
+
+@pytest.mark.parametrize('method, path', [
+    ('GET', '/'),
+    ('GET', '/daily'),
+    ('GET', '/daily?date=13-10-2022'),
+    ('GET', '/daily?date=1-8-2022'),
+    ('GET', '/ride/1'),
+    ('DELETE', '/ride/1'),
+    ('GET', '/rider/3962'),
+    ('GET', '/rider/3962/rides'),
+])
+def test_endpoints_return_the_same_body_and_status(clients, method, path):
+    flask_response, quart_response = clients(method, path)
+    assert flask_response == quart_response
+    assert flask_response[0] == 200
+
+
+@pytest.mark.parametrize('path', ['/daily?date=13-10-2022', '/ride/404', '/rider/404', '/rider/404/rides'])
+def test_empty_results_return_the_same_body_and_status(clients, path):
+    flask_response, quart_response = clients('GET', path, rows=[])
+    assert flask_response == quart_response == (200, b'[]\n')
+
+
+@pytest.mark.parametrize('path', ['/daily?date=2022-08-01', '/daily?date=32-10-2022', '/daily?date=13-10', '/daily?date=today'])
+def test_invalid_dates_return_the_same_400(clients, path):
+    flask_response, quart_response = clients('GET', path)
+    assert flask_response == quart_response == (400, b'Invalid date, expected DD-MM-YYYY')
+    assert clients.stubs['session'].statements == [] and clients.stubs['pool'].statements == []
+
+
+@pytest.mark.parametrize('method, path', [
+    ('GET', '/unknown'),
+    ('POST', '/ride/1'),
+    ('PUT', '/rider/3962'),
+])
+def test_unrouted_requests_return_the_same_status(clients, method, path):
+    flask_response, quart_response = clients(method, path)
+    assert flask_response[0] == quart_response[0]
+    assert flask_response[0] in (404, 405)
+
+
+def test_both_apis_query_the_same_rides(clients):
+    clients('GET', '/daily?date=13-10-2022')
+    flask_sql = clients.stubs['session'].statements[0]
+    quart_sql, quart_args = clients.stubs['pool'].statements[0]
+    assert "DATE '2022-10-13'" in flask_sql
+    assert str(quart_args[0]) == '2022-10-13'
+    assert ' '.join(flask_sql.replace("DATE '2022-10-13'", '$1::date').split()) == ' '.join(quart_sql.split())
+
+
+def test_both_apis_read_dates_without_zero_padding(clients):
+    clients('GET', '/daily?date=1-8-2022')
+    assert "DATE '2022-08-01'" in clients.stubs['session'].statements[0]
+    assert str(clients.stubs['pool'].statements[0][1][0]) == '2022-08-01'
+
+
+def test_delete_commits_the_flask_session(clients):
+    clients('DELETE', '/ride/1')
+    assert clients.stubs['session'].commits == 1
+    assert clients.stubs['pool'].statements == [('DELETE FROM yusra_stories_production.rides WHERE ride_id = $1;', (1,))]
@@ -0,0 +1,132 @@
+import threading
+import time
+from os import getenv
+
+import sqlalchemy
+from dotenv import load_dotenv
+from sqlalchemy import event
+
+
+class Database():
+    """
+    Builds the SQLAlchemy engine of every service from the DB_* environment variables, with the same
+    pool settings and statement timeout, tagged with the service as its application_name. Every query
+    is timed: queries slower than DB_SLOW_QUERY_MS are logged, and query counts are kept per service
+    """
+    load_dotenv()
+    db_host = getenv('DB_HOST')
+    db_port = getenv('DB_PORT')
+    db_user = getenv('DB_USER')
+    db_password = getenv('DB_PASSWORD')
+    db_name = getenv('DB_NAME')
+    pool_size = int(getenv('DB_POOL_SIZE', 5))
+    max_overflow = int(getenv('DB_MAX_OVERFLOW', 10))
+    pool_recycle_seconds = int(getenv('DB_POOL_RECYCLE_SECONDS', 1800))
+    # 0 leaves statements without a timeout
+    statement_timeout_ms = int(getenv('DB_STATEMENT_TIMEOUT_MS', 0))
+    slow_query_ms = float(getenv('DB_SLOW_QUERY_MS', 1000))
+
+    stats_lock = threading.Lock()
+    stats = {}
+
+    @staticmethod
+    def get_url() -> str:
+        """
+        Returns the connection URL of the database
+        """
+        return f'postgresql://{Database.db_user}:{Database.db_password}@{Database.db_host}:{Database.db_port}/{Database.db_name}'
+
+    @staticmethod
+    def get_engine_options(service: str) -> dict:
+        """
+        Returns the create_engine options shared by every service
+        """
+        connect_args = {'application_name': service}
+        if Database.statement_timeout_ms > 0:
+            connect_args['options'] = f'-c statement_timeout={Database.statement_timeout_ms}'
+        return {
+            'pool_pre_ping': True,
+            'pool_size': Database.pool_size,
+            'max_overflow': Database.max_overflow,
+            'pool_recycle': Database.pool_recycle_seconds,
+            'connect_args': connect_args
+        }
+
+    @staticmethod
+    def get_server_settings(service: str) -> dict:
+        """
+        Returns the application_name and statement timeout as server settings, for asyncpg pools
+        """
+        server_settings = {'application_name': service}
+        if Database.statement_timeout_ms > 0:
+            server_settings['statement_timeout'] = str(Database.statement_timeout_ms)
+        return server_settings
+
+    @staticmethod
+    def create_engine(service: str, **engine_options) -> sqlalchemy.engine.Engine:
+        """
+        Creates the engine of a service, with the shared options overridden by any given ones
+        """
+        options = Database.get_engine_options(service)
+        options.update(engine_options)
+        engine = sqlalchemy.create_engine(Database.get_url(), **options)
+        Database.add_timing_hooks(engine, service)
+        return engine
+
+    @staticmethod
+    def add_timing_hooks(engine: sqlalchemy.engine.Engine, service: str) -> None:
+        """
+        Times every query run through an engine, counting it against the service
+        """
+        with Database.stats_lock:
+            Database.stats.setdefault(service, {'queries': 0, 'failed_queries': 0, 'slow_queries': 0, 'query_seconds': 0.0})
+
+        def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+        def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            Database.record_query(service, statement, time.perf_counter() - conn.info['query_start'].pop())
+
+        def handle_error(exception_context):
+            query_start = exception_context.connection.info.get('query_start') if exception_context.connection is not None else None
+            if query_start:
+                Database.record_query(service, exception_context.statement, time.perf_counter() - query_start.pop(), failed=True)
+
+        event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+        event.listen(engine, 'after_cursor_execute', after_cursor_execute)
+        event.listen(engine, 'handle_error', handle_error)
+
+    @staticmethod
+    def record_query(service: str, statement: str, seconds: float, failed: bool=False) -> None:
+        """
+        Counts a query against its service, logging it when it is slower than DB_SLOW_QUERY_MS
+        """
+        slow = seconds * 1000 >= Database.slow_query_ms
+        with Database.stats_lock:
+            stats = Database.stats[service]
+            stats['queries'] += 1
+            stats['query_seconds'] += seconds
+            if failed:
+                stats['failed_queries'] += 1
+            if slow:
+                stats['slow_queries'] += 1
+        if slow:
+            print(f'Slow query ({service}, {seconds * 1000:.0f} ms{", failed" if failed else ""}): {" ".join(str(statement).split())[:500]}')
+
+    @staticmethod
+    def get_stats(service: str) -> dict:
+        """
+        Returns a copy of the query counts of a service
+        """
+        with Database.stats_lock:
+            return dict(Database.stats.get(service, {}))
+
+    @staticmethod
+    def print_stats() -> None:
+        """
+        Prints the query counts of every service in this process
+        """
+        with Database.stats_lock:
+            for service, stats in Database.stats.items():
+                print(f'Query counts ({service}): {stats["queries"]} queries, {stats["failed_queries"]} failed, '
+                    f'{stats["slow_queries"]} slower than {Database.slow_query_ms:.0f} ms, {stats["query_seconds"]:.2f}s in total')
@@ -0,0 +1,281 @@
+import json
+import re
+from datetime import date, datetime, timedelta, timezone
+from os import getenv
+from typing import Iterable, List, NamedTuple, Optional
+
+import numpy as np
+
+
+class LogRecord(NamedTuple):
+    """
+    A parsed bike log line. Only the fields carried by its kind are set, the others are None
+    """
+    kind: str
+    time: Optional[str] = None
+    user: Optional[dict] = None
+    duration: Optional[int] = None
+    resistance: Optional[int] = None
+    heart_rate: Optional[int] = None
+    rpm: Optional[int] = None
+    power: Optional[float] = None
+
+
+class LogParser():
+    """
+    Classifies bike log lines once and extracts their fields with precompiled patterns.
+    Shared by every service that reads the bike logs
+    """
+    # log kinds
+    SYSTEM = 'system'            # [SYSTEM] data = {user dictionary}
+    RIDE = 'ride'                # [INFO]: Ride - duration = ...; resistance = ...
+    TELEMETRY = 'telemetry'      # [INFO]: Telemetry - hrt = ...; rpm = ...; power = ...
+    NEW_RIDE = 'new_ride'        # --------- beginning of a new ride
+    MAIN = 'main'                # --------- beginning of main
+    OTHER = 'other'
+
+    time_pattern = re.compile('[0-9]{4}-[0-9]{2}-[0-9]{2} [0-9]{2}:[0-9]{2}:[0-9]{2}\\.[0-9]{6}')
+    user_pattern = re.compile('data = ({.*})')
+    duration_pattern = re.compile('duration = ([0-9]+)')
+    resistance_pattern = re.compile('resistance = ([0-9]+)')
+    heart_rate_pattern = re.compile('hrt = ([0-9]+)')
+    rpm_pattern = re.compile('rpm = ([0-9]+)')
+    power_pattern = re.compile('power = ([0-9]+(?:\\.[0-9]+)?)')
+    # whole well-formed INFO lines, read with a single match
+    telemetry_line_pattern = re.compile(f'({time_pattern.pattern})[^\\[]*\\[INFO\\]: Telemetry - hrt = ([0-9]+); rpm = ([0-9]+); power = ([0-9]+(?:\\.[0-9]+)?)')
+    ride_line_pattern = re.compile(f'({time_pattern.pattern})[^\\[]*\\[INFO\\]: Ride - duration = ([0-9]+)[^;]*; resistance = ([0-9]+)')
+
+    @staticmethod
+    def classify(log: str) -> str:
+        """
+        Returns the kind of a log line
+        """
+        # most frequent kinds first: bikes send a telemetry and a ride log every half second
+        if '[INFO]: Telemetry' in log:
+            return LogParser.TELEMETRY
+        if '[INFO]: Ride' in log:
+            return LogParser.RIDE
+        if '[SYSTEM]' in log:
+            return LogParser.SYSTEM
+        if 'beginning of a new ride' in log:
+            return LogParser.NEW_RIDE
+        if 'beginning of main' in log:
+            return LogParser.MAIN
+        return LogParser.OTHER
+
+    @staticmethod
+    def parse(log: str, kind: str=None) -> LogRecord:
+        """
+        Parses a log line into a LogRecord, skipping the classification when its kind is given.
+        Raises ValueError for a SYSTEM log with a malformed user dictionary
+        """
+        if kind is None:
+            kind = LogParser.classify(log)
+        if kind == LogParser.TELEMETRY:
+            search = LogParser.telemetry_line_pattern.match(log)
+            if search is not None:
+                log_time, heart_rate, rpm, power = search.groups()
+                return LogRecord(kind, log_time, None, None, None, int(heart_rate), int(rpm), float(power))
+            power = LogParser.power_pattern.search(log)
+            return LogRecord(kind, LogParser.get_log_time(log), None, None, None,
+                LogParser.extract_int(LogParser.heart_rate_pattern, log),
+                LogParser.extract_int(LogParser.rpm_pattern, log),
+                float(power.group(1)) if power is not None else None)
+        if kind == LogParser.RIDE:
+            search = LogParser.ride_line_pattern.match(log)
+            if search is not None:
+                log_time, duration, resistance = search.groups()
+                return LogRecord(kind, log_time, None, int(duration), int(resistance))
+            return LogRecord(kind, LogParser.get_log_time(log), None,
+                LogParser.extract_int(LogParser.duration_pattern, log),
+                LogParser.extract_int(LogParser.resistance_pattern, log))
+        if kind == LogParser.SYSTEM:
+            search = LogParser.user_pattern.search(log)
+            return LogRecord(kind, LogParser.get_log_time(log), json.loads(search.group(1)) if search is not None else None)
+        return LogRecord(kind, LogParser.get_log_time(log))
+
+    @staticmethod
+    def parse_many(logs: Iterable[str]) -> List[LogRecord]:
+        """
+        Parses a batch of log lines, in order
+        """
+        parse = LogParser.parse
+        return [parse(log) for log in logs]
+
+    @staticmethod
+    def find_heart_rates(logs: List[str]) -> tuple:
+        """
+        Finds the telemetry lines of a batch and their heart rates, searching all of them in one pass over the
+        joined lines instead of line by line. Returns the indices of the lines carrying a heart rate and the
+        heart rates, as arrays
+        """
+        telemetry_indices = [i for i, log in enumerate(logs) if '[INFO]: Telemetry' in log]
+        heart_rates = LogParser.heart_rate_pattern.findall('\n'.join([logs[i] for i in telemetry_indices]))
+        if len(heart_rates) != len(telemetry_indices):
+            # a telemetry line without a heart rate (or with two): match them one by one
+            searches = [(i, LogParser.heart_rate_pattern.search(logs[i])) for i in telemetry_indices]
+            telemetry_indices = [i for i, search in searches if search is not None]
+            heart_rates = [search.group(1) for _, search in searches if search is not None]
+        return np.array(telemetry_indices, dtype=np.int64), np.fromiter(map(int, heart_rates), dtype=np.int64, count=len(heart_rates))
+
+    @staticmethod
+    def find_session_markers(logs: List[str]) -> List[tuple]:
+        """
+        Returns (index, kind) for the SYSTEM and MAIN logs of a batch, which start and end rider sessions.
+        Batches without any are ruled out with a single search of the joined lines
+        """
+        joined = '\n'.join(logs)
+        if '[SYSTEM]' not in joined and 'beginning of main' not in joined:
+            return []
+        markers = []
+        for i, log in enumerate(logs):
+            if '[SYSTEM]' in log or 'beginning of main' in log:
+                kind = LogParser.classify(log)
+                if kind == LogParser.SYSTEM or kind == LogParser.MAIN:
+                    markers.append((i, kind))
+        return markers
+
+    @staticmethod
+    def to_columns(records: List[LogRecord], user_fields: Iterable[str]=()) -> dict:
+        """
+        Turns a batch of records into columns (lists keyed by field name) for building a DataFrame,
+        with a column for each of the given user dictionary fields (None where a record has no user)
+        """
+        columns = {field: [getattr(record, field) for record in records] for field in LogRecord._fields if field != 'user'}
+        for field in user_fields:
+            columns[field] = [record.user.get(field) if record.user else None for record in records]
+        return columns
+
+    @staticmethod
+    def get_log_time(log: str) -> Optional[str]:
+        """
+        Returns the time a log was published, or None when it has none
+        """
+        search = LogParser.time_pattern.search(log)
+        return search.group(0) if search is not None else None
+
+    @staticmethod
+    def extract_int(pattern: re.Pattern, log: str) -> Optional[int]:
+        """
+        Returns the integer captured by a precompiled pattern, or None when the log does not match it
+        """
+        search = pattern.search(log)
+        return int(search.group(1)) if search is not None else None
+
+    @staticmethod
+    def get_timestamp(log_time: str) -> Optional[float]:
+        """
+        Converts a log time to epoch seconds, the bikes log in UTC
+        """
+        if log_time is None:
+            return None
+        return datetime.strptime(log_time, '%Y-%m-%d %H:%M:%S.%f').replace(tzinfo=timezone.utc).timestamp()
+
+    @staticmethod
+    def get_timestamps(log_times: List[Optional[str]]) -> np.ndarray:
+        """
+        get_timestamp for a list of log times in one NumPy conversion, NaN where a log has no time
+        """
+        times = np.array(log_times, dtype='datetime64[us]')
+        timestamps = times.astype(np.int64) / 1e6
+        timestamps[np.isnat(times)] = np.nan
+        return timestamps
+
+    @staticmethod
+    def get_date_of_birth(date_of_birth_ms: int) -> date:
+        """
+        Converts a user dictionary date_of_birth (epoch milliseconds, negative before 1970) to a date
+        """
+        return (datetime(1970, 1, 1) + timedelta(milliseconds=date_of_birth_ms)).date()
+
+    @staticmethod
+    def get_age(dob: date) -> int:
+        """
+        Calculates a person's age based on their date of birth
+        """
+        today = date.today()
+        try:
+            birthday = dob.replace(year=today.year)
+        except ValueError: # raised when birth date is February 29 and the current year is not a leap year
+            birthday = dob.replace(year=today.year, month=dob.month+1, day=1)
+        if birthday > today:
+            return today.year - dob.year - 1
+        else:
+            return today.year - dob.year
+
+
+class BikeKeys():
+    """
+    Tells the bikes apart by the key of their Kafka messages. Shared by every service that follows a bike
+    through the stream.
+    This assumes the bikes key their messages by bike serial, which is what lets a consumer started mid-ride
+    find the last rider seen on a bike. A message with no key, or with a key that does not look like a bike
+    serial (BIKE_SERIAL_PATTERN), falls back to its topic partition. That only tells bikes apart when each has
+    a partition to itself, and the rider of such a bike cannot be recovered mid-ride
+    """
+    bike_serial_pattern = re.compile(getenv('BIKE_SERIAL_PATTERN', '[A-Za-z0-9]{4,32}'))
+    partition_key_prefix = 'partition-'
+    warning_printed = False
+
+    @staticmethod
+    def get_bike_key(key, partition: int) -> str:
+        """
+        Returns the key identifying the bike a message came from, given the message key and partition
+        """
+        bike_serial = BikeKeys.get_bike_serial_key(key)
+        if bike_serial is not None:
+            return bike_serial
+        BikeKeys.warn(f'Kafka message key {key!r} is not a bike serial, bikes are told apart by partition '
+            'and riders already mid-ride on restart are not recovered')
+        return f'{BikeKeys.partition_key_prefix}{partition}'
+
+    @staticmethod
+    def get_bike_keys(keys: List, partitions: List[int]) -> List[str]:
+        """
+        get_bike_key for a batch of messages, checking each distinct message key once
+        """
+        bike_serials = {key: BikeKeys.get_bike_serial_key(key) for key in set(keys)}
+        if None in bike_serials.values():
+            return [bike_serials[key] or BikeKeys.get_bike_key(key, partition) for key, partition in zip(keys, partitions)]
+        return [bike_serials[key] for key in keys]
+
+    @staticmethod
+    def get_bike_serial_key(key) -> Optional[str]:
+        """
+        Returns a message key as text if it looks like a bike serial, otherwise None
+        """
+        if key is None:
+            return None
+        try:
+            key = key.decode('utf-8') if isinstance(key, bytes) else str(key)
+        except UnicodeDecodeError:
+            return None
+        return key if BikeKeys.bike_serial_pattern.fullmatch(key) else None
+
+    @staticmethod
+    def get_bike_serial(bike_key: str) -> Optional[str]:
+        """
+        Returns the bike serial a bike key is, or None for a bike told apart by partition
+        """
+        if bike_key.startswith(BikeKeys.partition_key_prefix):
+            return None
+        return bike_key
+
+    @staticmethod
+    def check_user(bike_key: str, user: dict) -> None:
+        """
+        Warns if a SYSTEM log shows the message keys are not the bike serials they are assumed to be
+        """
+        bike_serial = BikeKeys.get_bike_serial(bike_key)
+        if bike_serial is not None and bike_serial != user.get('bike_serial'):
+            BikeKeys.warn(f'Kafka message key {bike_serial!r} does not match the bike serial {user.get("bike_serial")!r} '
+                'of its SYSTEM log, riders already mid-ride on restart may not be recovered')
+
+    @staticmethod
+    def warn(message: str) -> None:
+        """
+        Prints a warning about the message keys, once per process
+        """
+        if not BikeKeys.warning_printed:
+            print(message)
+            BikeKeys.warning_printed = True
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# the shared package is imported from the repository root, as the services do
+sys.path[:0] = [os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))]
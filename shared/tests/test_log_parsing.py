@@ -0,0 +1,147 @@
+import math
+
+import numpy as np
+import pytest
+
+from shared.log_parsing import BikeKeys, LogParser, LogRecord
+
+# the start, middle and end of a ride as the bikes publish it
+SYSTEM_LOG = ('2022-10-13 10:07:41.705773 mendoza v9: [SYSTEM] data = {"user_id": 3962, "name": "Katherine Goodwin", '
+    '"gender": "female", "address": "Flat 27,Burke ports,Eastport,SO1 6XB", "date_of_birth": -208310400000, '
+    '"email_address": "katherine.goodwin@hotmail.com", "height_cm": 168, "weight_kg": 68, '
+    '"account_create_date": 1660521600000, "bike_serial": "SN0000", "original_source": "offline"}')
+RIDE_LOGS = [
+    '--------- beginning of a new ride',
+    SYSTEM_LOG,
+    '2022-10-13 10:07:42.207362 mendoza v9: [INFO]: Ride - duration = 1.0; resistance = 30',
+    '2022-10-13 10:07:42.707362 mendoza v9: [INFO]: Telemetry - hrt = 0; rpm = 0; power = 0.0',
+    '2022-10-13 10:07:43.207362 mendoza v9: [INFO]: Ride - duration = 2.0; resistance = 30',
+    '2022-10-13 10:07:43.707362 mendoza v9: [INFO]: Telemetry - hrt = 97; rpm = 49; power = 11.639964517',
+    '2022-10-13 10:07:44.207362 mendoza v9: [INFO]: Ride - duration = 3.0; resistance = 30',
+    '2022-10-13 10:07:44.707362 mendoza v9: [INFO]: Telemetry - hrt = 188; rpm = 51; power = 12.52',
+    '--------- beginning of main',
+]
+
+GOLDEN_RECORDS = [
+    LogRecord(LogParser.NEW_RIDE),
+    LogRecord(LogParser.SYSTEM, '2022-10-13 10:07:41.705773', {
+        'user_id': 3962, 'name': 'Katherine Goodwin', 'gender': 'female', 'address': 'Flat 27,Burke ports,Eastport,SO1 6XB',
+        'date_of_birth': -208310400000, 'email_address': 'katherine.goodwin@hotmail.com', 'height_cm': 168, 'weight_kg': 68,
+        'account_create_date': 1660521600000, 'bike_serial': 'SN0000', 'original_source': 'offline'}),
+    LogRecord(LogParser.RIDE, '2022-10-13 10:07:42.207362', None, 1, 30),
+    LogRecord(LogParser.TELEMETRY, '2022-10-13 10:07:42.707362', None, None, None, 0, 0, 0.0),
+    LogRecord(LogParser.RIDE, '2022-10-13 10:07:43.207362', None, 2, 30),
+    LogRecord(LogParser.TELEMETRY, '2022-10-13 10:07:43.707362', None, None, None, 97, 49, 11.639964517),
+    LogRecord(LogParser.RIDE, '2022-10-13 10:07:44.207362', None, 3, 30),
+    LogRecord(LogParser.TELEMETRY, '2022-10-13 10:07:44.707362', None, None, None, 188, 51, 12.52),
+    LogRecord(LogParser.MAIN),
+]
+
+
+def test_parse_matches_the_golden_records():
+    assert [LogParser.parse(log) for log in RIDE_LOGS] == GOLDEN_RECORDS
+    assert LogParser.parse_many(RIDE_LOGS) == GOLDEN_RECORDS
+
+
+def test_parse_with_a_known_kind_matches_parse():
+    assert [LogParser.parse(log, LogParser.classify(log)) for log in RIDE_LOGS] == GOLDEN_RECORDS
+
+
+@pytest.mark.parametrize('log, expected', [
+    # fields out of the usual order or missing are read one by one
+    ('2022-10-13 10:07:44.707362 mendoza v9: [INFO]: Telemetry - rpm = 51; hrt = 120',
+        LogRecord(LogParser.TELEMETRY, '2022-10-13 10:07:44.707362', None, None, None, 120, 51, None)),
+    ('[INFO]: Telemetry - hrt = 75; rpm = 40; power = 3',
+        LogRecord(LogParser.TELEMETRY, None, None, None, None, 75, 40, 3.0)),
+    ('2022-10-13 10:07:44.207362 mendoza v9: [INFO]: Ride - resistance = 30',
+        LogRecord(LogParser.RIDE, '2022-10-13 10:07:44.207362', None, None, 30)),
+    ('2022-10-13 10:07:41.705773 mendoza v9: [SYSTEM] no user today',
+        LogRecord(LogParser.SYSTEM, '2022-10-13 10:07:41.705773')),
+    ('2022-10-13 10:07:41.705773 mendoza v9: [WARN]: battery low',
+        LogRecord(LogParser.OTHER, '2022-10-13 10:07:41.705773')),
+])
+def test_parse_irregular_lines(log, expected):
+    assert LogParser.parse(log) == expected
+
+
+def test_parse_raises_value_error_for_a_malformed_user():
+    with pytest.raises(ValueError):
+        LogParser.parse('2022-10-13 10:07:41.705773 mendoza v9: [SYSTEM] data = {"user_id": 3962, "name": }')
+
+
+def test_find_heart_rates_matches_parse():
+    indices, heart_rates = LogParser.find_heart_rates(RIDE_LOGS)
+    assert indices.tolist() == [3, 5, 7]
+    assert heart_rates.tolist() == [0, 97, 188]
+
+
+def test_find_heart_rates_skips_telemetry_without_a_heart_rate():
+    logs = RIDE_LOGS + ['2022-10-13 10:07:45.207362 mendoza v9: [INFO]: Telemetry - rpm = 51; power = 12.52',
+        '2022-10-13 10:07:45.707362 mendoza v9: [INFO]: Telemetry - hrt = 190; rpm = 52; power = 12.9']
+    indices, heart_rates = LogParser.find_heart_rates(logs)
+    assert indices.tolist() == [3, 5, 7, 10]
+    assert heart_rates.tolist() == [0, 97, 188, 190]
+
+
+def test_find_heart_rates_of_an_empty_batch():
+    indices, heart_rates = LogParser.find_heart_rates([])
+    assert indices.dtype == np.int64 and heart_rates.dtype == np.int64
+    assert len(indices) == 0 and len(heart_rates) == 0
+
+
+def test_find_session_markers():
+    assert LogParser.find_session_markers(RIDE_LOGS) == [(1, LogParser.SYSTEM), (8, LogParser.MAIN)]
+    assert LogParser.find_session_markers(RIDE_LOGS[2:8]) == []
+
+
+def test_get_timestamps_matches_get_timestamp():
+    log_times = [record.time for record in GOLDEN_RECORDS]
+    timestamps = LogParser.get_timestamps(log_times)
+    for log_time, timestamp in zip(log_times, timestamps.tolist()):
+        if log_time is None:
+            assert math.isnan(timestamp)
+        else:
+            assert timestamp == pytest.approx(LogParser.get_timestamp(log_time), abs=1e-6)
+    assert LogParser.get_timestamp('2022-10-13 10:07:41.705773') == pytest.approx(1665655661.705773)
+
+
+def test_to_columns():
+    columns = LogParser.to_columns(GOLDEN_RECORDS[:4], ['user_id', 'bike_serial'])
+    assert columns == {
+        'kind': [LogParser.NEW_RIDE, LogParser.SYSTEM, LogParser.RIDE, LogParser.TELEMETRY],
+        'time': [None, '2022-10-13 10:07:41.705773', '2022-10-13 10:07:42.207362', '2022-10-13 10:07:42.707362'],
+        'duration': [None, None, 1, None],
+        'resistance': [None, None, 30, None],
+        'heart_rate': [None, None, None, 0],
+        'rpm': [None, None, None, 0],
+        'power': [None, None, None, 0.0],
+        'user_id': [None, 3962, None, None],
+        'bike_serial': [None, 'SN0000', None, None],
+    }
+
+
+def test_get_date_of_birth_before_1970():
+    assert str(LogParser.get_date_of_birth(-208310400000)) == '1963-05-27'
+
+
+@pytest.mark.parametrize('key, partition, expected', [
+    (b'SN0000', 3, 'SN0000'),
+    ('SN0000', 3, 'SN0000'),
+    (None, 3, 'partition-3'),
+    (b'not a serial!', 4, 'partition-4'),
+    (b'\xff\xfe', 5, 'partition-5'),
+])
+def test_get_bike_key(key, partition, expected):
+    assert BikeKeys.get_bike_key(key, partition) == expected
+
+
+def test_get_bike_keys_matches_get_bike_key():
+    keys = [b'SN0000', None, b'SN0001', b'SN0000', b'not a serial!']
+    partitions = [0, 1, 2, 0, 4]
+    assert BikeKeys.get_bike_keys(keys, partitions) == [BikeKeys.get_bike_key(key, partition) for key, partition in zip(keys, partitions)]
+    assert BikeKeys.get_bike_keys(keys[:1], partitions[:1]) == ['SN0000']
+
+
+def test_get_bike_serial():
+    assert BikeKeys.get_bike_serial('SN0000') == 'SN0000'
+    assert BikeKeys.get_bike_serial('partition-3') is None
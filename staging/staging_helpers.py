@@ -6,9 +6,12 @@ from typing import List, Optional
 import confluent_kafka
 import pandas as pd
 from dotenv import load_dotenv
-from sqlalchemy import create_engine, text
+from sqlalchemy import text
 
 import boto3
+
+from shared.database import Database
+
 load_dotenv()
 
 class SQLConnection():
@@ -19,7 +22,7 @@ class SQLConnection():
     db_password = getenv('DB_PASSWORD')
     db_name = getenv('DB_NAME')
 
-    engine = create_engine(f'postgresql://{db_user}:{db_password}@{db_host}:{db_port}/{db_name}', pool_pre_ping=True)
+    engine = Database.create_engine('staging')
 
     @staticmethod
     def create_db_schemas(schema_list):
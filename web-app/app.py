@@ -1,8 +1,21 @@
 import dash
 import dash_bootstrap_components as dbc
 from dash import Dash, html, dcc
+from flask import Response, stream_with_context
+
+from dashboard_helper import LiveState
 
 app = Dash(__name__, use_pages=True, external_stylesheets=[dbc.themes.MINTY])
+server = app.server
+
+
+@server.route('/live/stream')
+def live_stream() -> Response:
+    """
+    Pushes the live ride changes to the current ride page as server-sent events
+    """
+    return Response(stream_with_context(LiveState.stream_changes()), mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
 
 SIDEBAR_STYLE = {
     "position": "fixed",
@@ -51,6 +64,6 @@ app.layout = html.Div([
 ])
 
 if __name__ == "__main__":
-    app.run_server(host="0.0.0.0", debug=True, port=8080)
+    app.run_server(host="0.0.0.0", port=8080)
 
 
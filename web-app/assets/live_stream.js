@@ -0,0 +1,182 @@
+// Renders the current ride grid from the /live/stream server-sent events.
+// Each bike's cards are built once, after which only the fields that changed are written.
+// Sparklines keep the last sparkline_seconds of readings, receiving only the appended readings.
+(function () {
+    const riders = {};
+    const readings = {};
+    const cards = {};
+    const sparklines = [['hrt', 'Heart rate (BPM)'], ['rpm', 'RPM'], ['power', 'Power']];
+    let sparklineSeconds = 300;
+    let grid = null;
+
+    function buildCard() {
+        const col = document.createElement('div');
+        col.className = 'col-lg-6';
+        col.innerHTML = `
+            <div class="card-group">
+                <div class="card"><div class="card-body">
+                    <h4 style="text-align: center; font-weight: bold">Current rider information</h4>
+                    <hr>
+                    <p style="font-weight: bold">Bike: <span data-field="bike"></span></p>
+                    <p style="font-weight: bold">Name: <span data-field="name"></span></p>
+                    <p style="font-weight: bold">Gender: <span data-field="gender"></span></p>
+                    <p style="font-weight: bold">Age: <span data-field="age"></span></p>
+                    <p style="font-weight: bold">Ride duration (Seconds): <span data-field="ride"></span></p>
+                </div></div>
+                <div class="card" data-status-card><div class="card-body">
+                    <h4 style="text-align: center; font-weight: bold">Heart rate screening</h4>
+                    <hr>
+                    <p style="font-weight: bold" data-field="hrt_status"></p>
+                    <p style="font-weight: bold">Heart rate (BPM): <span data-field="telemetry"></span></p>
+                    <p style="font-weight: bold">Your healthy heart rate is considered to be between <span data-field="upper_boundary"></span> and <span data-field="lower_boundary"></span></p>
+                    ${sparklines.map(([field, label]) => `
+                    <div style="font-weight: bold">${label} <span data-latest="${field}"></span></div>
+                    <svg viewBox="0 0 300 40" preserveAspectRatio="none" style="width: 100%; height: 40px">
+                        <polyline data-sparkline="${field}" fill="none" stroke="currentColor" stroke-width="1.5"></polyline>
+                    </svg>`).join('')}
+                </div></div>
+            </div>`;
+        return col;
+    }
+
+    function applyFields(col, fields) {
+        for (const [field, value] of Object.entries(fields)) {
+            if (field === 'status') {
+                const statusCard = col.querySelector('[data-status-card]');
+                statusCard.classList.remove('bg-danger', 'bg-success');
+                statusCard.classList.add('bg-' + value);
+                continue;
+            }
+            const element = col.querySelector(`[data-field="${field}"]`);
+            if (element) {
+                element.textContent = value === null ? 'None' : value;
+            }
+        }
+    }
+
+    function appendReadings(bikeKey, appended) {
+        let bikeReadings = readings[bikeKey];
+        if (!bikeReadings || appended.reset) {
+            bikeReadings = readings[bikeKey] = {t: [], hrt: [], rpm: [], power: []};
+        }
+        for (const field in bikeReadings) {
+            bikeReadings[field].push(...appended[field]);
+        }
+        // drop readings older than the sparkline window
+        const cutoff = bikeReadings.t[bikeReadings.t.length - 1] - sparklineSeconds;
+        let expired = 0;
+        while (expired < bikeReadings.t.length && bikeReadings.t[expired] < cutoff) {
+            expired++;
+        }
+        for (const field in bikeReadings) {
+            bikeReadings[field].splice(0, expired);
+        }
+    }
+
+    function drawSparklines(col, bikeReadings) {
+        if (!bikeReadings || !bikeReadings.t.length) {
+            return;
+        }
+        const t = bikeReadings.t;
+        const tEnd = t[t.length - 1];
+        for (const [field] of sparklines) {
+            const values = bikeReadings[field];
+            const low = Math.min(...values);
+            const range = (Math.max(...values) - low) || 1;
+            const points = values.map((value, i) =>
+                `${(300 * (1 - (tEnd - t[i]) / sparklineSeconds)).toFixed(1)},${(38 - 36 * (value - low) / range).toFixed(1)}`);
+            col.querySelector(`[data-sparkline="${field}"]`).setAttribute('points', points.join(' '));
+            col.querySelector(`[data-latest="${field}"]`).textContent = values[values.length - 1];
+        }
+    }
+
+    function render(changed, removed, appended) {
+        const container = document.getElementById('current_ride');
+        if (!container) {
+            grid = null;
+            return;
+        }
+        if (container !== grid) {
+            // the page was (re)mounted, so build every rider's cards from their latest fields
+            grid = container;
+            for (const bikeKey in cards) {
+                delete cards[bikeKey];
+            }
+            grid.replaceChildren();
+            changed = riders;
+            removed = [];
+            appended = readings;
+        }
+        for (const bikeKey of removed) {
+            if (cards[bikeKey]) {
+                cards[bikeKey].remove();
+                delete cards[bikeKey];
+            }
+        }
+        for (const [bikeKey, fields] of Object.entries(changed)) {
+            if (!cards[bikeKey]) {
+                cards[bikeKey] = buildCard();
+                grid.appendChild(cards[bikeKey]);
+            }
+            applyFields(cards[bikeKey], fields);
+        }
+        for (const bikeKey in appended) {
+            if (cards[bikeKey]) {
+                drawSparklines(cards[bikeKey], readings[bikeKey]);
+            }
+        }
+        let empty = document.getElementById('no_active_rides');
+        if (!empty) {
+            empty = document.createElement('p');
+            empty.id = 'no_active_rides';
+            empty.style.fontWeight = 'bold';
+            empty.textContent = 'No active rides';
+            grid.prepend(empty);
+        }
+        empty.style.display = Object.keys(cards).length ? 'none' : '';
+    }
+
+    // Dash serves every asset on every page, so the stream is only held open while the current ride page is mounted
+    let source = null;
+
+    function connect() {
+        source = new EventSource('/live/stream');
+        source.onopen = function () {
+            // a (re)connected stream starts with the full state of every active rider
+            for (const bikeKey in riders) {
+                delete riders[bikeKey];
+                delete readings[bikeKey];
+            }
+            render({}, Object.keys(cards), {});
+        };
+        source.onmessage = function (event) {
+            const update = JSON.parse(event.data);
+            sparklineSeconds = update.sparkline_seconds;
+            for (const bikeKey of update.removed) {
+                delete riders[bikeKey];
+                delete readings[bikeKey];
+            }
+            for (const [bikeKey, fields] of Object.entries(update.changed)) {
+                riders[bikeKey] = Object.assign(riders[bikeKey] || {}, fields);
+            }
+            for (const [bikeKey, appended] of Object.entries(update.appended)) {
+                appendReadings(bikeKey, appended);
+            }
+            render(update.changed, update.removed, update.appended);
+        };
+    }
+
+    // the grid is only mounted once Dash renders the page, so check for it between events too
+    setInterval(function () {
+        const container = document.getElementById('current_ride');
+        if (container && !source) {
+            connect();
+        } else if (!container && source) {
+            source.close();
+            source = null;
+        }
+        if (container !== grid) {
+            render({}, [], {});
+        }
+    }, 500);
+})();
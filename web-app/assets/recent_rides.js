@@ -0,0 +1,70 @@
+// Static styling of the Recent Rides charts. The server only caches and sends the chart data,
+// as a JSON string per data version, and these clientside callbacks turn it into the figures.
+(function () {
+    const greens = ['rgb(0,68,27)', 'rgb(0,109,44)', 'rgb(35,139,69)', 'rgb(65,171,93)', 'rgb(116,196,118)',
+        'rgb(161,217,155)', 'rgb(199,233,192)', 'rgb(229,245,224)', 'rgb(247,252,245)'];
+    // the parts of plotly.py's default template the charts rely on
+    const axis = {gridcolor: 'white', linecolor: 'white', zerolinecolor: 'white', automargin: true};
+    const baseLayout = {
+        font: {color: '#2a3f5f'},
+        paper_bgcolor: 'white',
+        plot_bgcolor: '#E5ECF6',
+        hoverlabel: {align: 'left'},
+        title: {x: 0.05},
+        legend: {tracegroupgap: 0},
+        piecolorway: greens,
+    };
+    let parsedJson = null;
+    let parsed = null;
+
+    function parse(figuresJson) {
+        if (figuresJson !== parsedJson) {
+            parsed = JSON.parse(figuresJson);
+            parsedJson = figuresJson;
+        }
+        return parsed;
+    }
+
+    function rideFrequencyFigure(figuresJson) {
+        if (!figuresJson) {
+            return window.dash_clientside.no_update;
+        }
+        const data = parse(figuresJson).ride_frequency;
+        return {
+            data: [{
+                type: 'pie', labels: data.gender, values: data.ride_count, showlegend: true,
+                hovertemplate: 'gender=%{label}<br>ride_count=%{value}<extra></extra>',
+            }],
+            layout: Object.assign({}, baseLayout, {
+                title: {x: 0.05, text: 'Ride frequency by gender over the last 12 hours'},
+                legend: {tracegroupgap: 0, title: {text: 'User Gender'}},
+            }),
+        };
+    }
+
+    function ageDistributionFigure(figuresJson) {
+        if (!figuresJson) {
+            return window.dash_clientside.no_update;
+        }
+        const data = parse(figuresJson).age_distribution;
+        return {
+            data: [{
+                type: 'bar', x: data.age, y: data.ride_count, marker: {color: greens[0]}, showlegend: false,
+                hovertemplate: 'Rider age=%{x}<br>Number of rides=%{y}<extra></extra>',
+            }],
+            layout: Object.assign({}, baseLayout, {
+                title: {x: 0.05, text: ' Age distribution of Deloton rider over the last 12 hours '},
+                barmode: 'group',
+                xaxis: Object.assign({title: {text: 'Rider age'}}, axis),
+                yaxis: Object.assign({title: {text: 'Number of rides'}}, axis),
+            }),
+        };
+    }
+
+    window.dash_clientside = Object.assign({}, window.dash_clientside, {
+        recent_rides: {
+            ride_frequency_figure: rideFrequencyFigure,
+            age_distribution_figure: ageDistributionFigure,
+        },
+    });
+})();
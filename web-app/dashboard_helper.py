@@ -1,16 +1,20 @@
+import os
 from os import getenv
 from typing import List, Optional
 
 import confluent_kafka
-from datetime import date
 import json
-import pandas as pd
 import numpy as np
-import re
+import pandas as pd
+import threading
+import time
 import uuid
+from collections import OrderedDict
 
 from dotenv import load_dotenv
-from sqlalchemy import create_engine
+
+from shared.database import Database
+from shared.log_parsing import BikeKeys, LogParser
 
 
 
@@ -46,160 +50,490 @@ class Kafka_helpers():
         })
 
         return c
-    
-    @staticmethod   
-    def get_user_dict(log:str) -> dict:
+
+
+class TelemetryRing():
+    """
+    Fixed-size ring buffer of a bike's recent readings (time, heart rate, rpm and power),
+    preallocated so appending is O(1) with no allocation. Private to the ingest side:
+    the readings appended since the last publish are copied to the shared bike store
+    """
+    fields = ['t', 'hrt', 'rpm', 'power']
+
+    def __init__(self, size: int, started: int):
+        self.values = np.zeros((len(TelemetryRing.fields), size), dtype=np.float64)
+        self.size = size
+        self.count = 0
+        # readings already copied to the shared bike store
+        self.published = 0
+        self.started = started
+
+    def append(self, t: float, hrt: int, rpm: int, power: float) -> None:
         """
-        Gets the user dictionary from the SYSTEM logs, returns None for other logs
+        Writes a reading over the oldest one
         """
-        search = re.search('(data = )({.*})', log)
-        if search is not None: 
-            user_dict = json.loads(search.group(2))
-            return user_dict
-        else:
-            return None
-    
-    @staticmethod   
-    def get_value_from_user_dict(log:str, value:str) -> pd.Series:
+        i = self.count % self.size
+        values = self.values
+        values[0, i] = t
+        values[1, i] = hrt
+        values[2, i] = rpm
+        values[3, i] = power
+        self.count += 1
+
+    def since(self, count: int) -> np.ndarray:
         """
-        Gets a given value from the SYSTEM logs user dictionaries, returns None for other logs
+        Returns a copy of the readings appended after the first count, oldest first,
+        limited to those still in the buffer
         """
-        user_dict = Kafka_helpers.get_user_dict(log)
-        if user_dict:
-            return user_dict[value]
-        else:
-            return None
-    
-    @staticmethod   
-    def reg_extract_heart_rate(log: str):
-        '''Parse heart_rate from given log text'''
-        search = re.search('(hrt = )([0-9]*)', log)
-        if search is not None: 
-            heart_rate = search.group(2)
-            return int(heart_rate)
-        else:
-            return None
-    
+        return TelemetryRing.take(self.values, self.count, count)
+
     @staticmethod
-    def get_age(dob:date) -> int:
+    def take(values: np.ndarray, ring_count: int, count: int) -> np.ndarray:
         """
-        Calculates a person's age based on their date of birth
+        Returns a copy of the readings of a ring buffer holding ring_count readings in total
+        that were appended after the first count, oldest first
+        """
+        size = values.shape[1]
+        count = max(count, ring_count - size)
+        return np.take(values, np.arange(count, ring_count) % size, axis=1)
+
+
+class LiveState():
+    """
+    Latest state of every active bike, kept up to date from Kafka by the ingest process (or a
+    background thread of a single dashboard process) and published to the shared bike store.
+    Bikes that send nothing for LIVE_BIKE_IDLE_SECONDS are dropped
+    """
+    lock = threading.Lock()
+    bikes = OrderedDict()
+    rings = {}
+    version = 0
+    published_version = 0
+    reader = None
+    ingest_in_process = getenv('LIVE_INGEST_IN_PROCESS', 'true').lower() == 'true'
+    consume_batch_size = int(getenv('LIVE_CONSUME_BATCH_SIZE', 500))
+    idle_seconds = float(getenv('LIVE_BIKE_IDLE_SECONDS', 60))
+    push_interval_seconds = float(getenv('LIVE_PUSH_INTERVAL_SECONDS', 0.5))
+    # bikes send a reading every half second
+    sparkline_seconds = float(getenv('LIVE_SPARKLINE_SECONDS', 300))
+    sparkline_points = int(sparkline_seconds * 2)
+    keep_alive_seconds = 15
+
+    @staticmethod
+    def start_reader() -> threading.Thread:
         """
-        today = date.today()
-        try: 
-            birthday = dob.replace(year=today.year)
-        except ValueError: # raised when birth date is February 29 and the current year is not a leap year
-            birthday = dob.replace(year=today.year, month=dob.month+1, day=1)
-        if birthday > today:
-            return today.year - dob.year - 1
+        Starts the background reader thread, once per process
+        """
+        with LiveState.lock:
+            if LiveState.reader is None:
+                LiveState.reader = threading.Thread(target=LiveState.read_forever, name='live-kafka-reader', daemon=True)
+                LiveState.reader.start()
+        return LiveState.reader
+
+    @staticmethod
+    def read_forever() -> None:
+        """
+        Drains the topic continuously, applying every log to the state of the bike it came from
+        and publishing the changed bikes to the shared bike store after each batch
+        """
+        SharedBikeStore.create(LiveState.sparkline_points)
+        consumer = Kafka_helpers.connect_to_kafka_consumer()
+        consumer.subscribe([Kafka_helpers.KAFKA_TOPIC_NAME])
+        try:
+            while True:
+                for message in consumer.consume(num_messages=LiveState.consume_batch_size, timeout=1.0):
+                    if message.error():
+                        print(f'Kafka error: {message.error()}')
+                        continue
+                    try:
+                        log = json.loads(message.value().decode('utf-8'))['log']
+                        LiveState.apply_log(BikeKeys.get_bike_key(message.key(), message.partition()), log, time.monotonic())
+                    except (ValueError, KeyError, TypeError) as e:
+                        print(f'Skipping unreadable log: {e}')
+                LiveState.evict_idle(time.monotonic())
+                LiveState.publish()
+        finally:
+            consumer.close()
+
+    @staticmethod
+    def apply_log(bike_key: str, log: str, now: float) -> None:
+        """
+        Parses a log and updates the fields it carries in its bike's state and telemetry ring buffer.
+        The start of a new ride clears the previous rider and their readings from the bike
+        """
+        record = LogParser.parse(log)
+        bike = LiveState.bikes.get(bike_key)
+        if bike is None or record.kind == LogParser.MAIN:
+            bike = {'bike': bike_key}
+            LiveState.bikes[bike_key] = bike
+            SharedBikeStore.assign_slot(bike_key)
+            LiveState.rings[bike_key] = TelemetryRing(LiveState.sparkline_points, LiveState.version)
         else:
-            return today.year - dob.year
-
-    @staticmethod   
-    def reg_extract_ride_duration(log: str) -> int:
-        '''Parse ride duration '''
-        search = re.search('(duration = )([0-9]*)', log)
-        if search is not None: 
-            ride_duration = search.group(2)
-            return int(ride_duration)
+            LiveState.bikes.move_to_end(bike_key)
+        if record.kind == LogParser.RIDE and record.duration != None:
+            bike['ride'] = record.duration
+        elif record.kind == LogParser.TELEMETRY and record.heart_rate != None:
+            bike['telemetry'] = record.heart_rate
+            LiveState.rings[bike_key].append(now, record.heart_rate, record.rpm or 0, record.power or 0.0)
+        elif record.kind == LogParser.SYSTEM and record.user:
+            bike['name'] = record.user['name']
+            bike['gender'] = record.user['gender']
+            bike['age'] = LogParser.get_age(LogParser.get_date_of_birth(record.user['date_of_birth']))
+        LiveState.version += 1
+        bike['version'] = LiveState.version
+        bike['last_seen'] = now
+
+    @staticmethod
+    def evict_idle(now: float) -> None:
+        """
+        Drops the bikes that have not sent a log within LIVE_BIKE_IDLE_SECONDS
+        """
+        while LiveState.bikes:
+            bike = next(iter(LiveState.bikes.values()))
+            if now - bike['last_seen'] < LiveState.idle_seconds:
+                break
+            bike_key, _ = LiveState.bikes.popitem(last=False)
+            del LiveState.rings[bike_key]
+            LiveState.version += 1
+            SharedBikeStore.free_slot(bike_key, LiveState.version)
+
+    @staticmethod
+    def publish() -> None:
+        """
+        Writes the bikes changed since the last publish to the shared bike store
+        """
+        if LiveState.version == LiveState.published_version:
+            return
+        for bike_key, bike in LiveState.bikes.items():
+            if bike['version'] > LiveState.published_version:
+                SharedBikeStore.write_bike(bike_key, bike, LiveState.rings[bike_key])
+        SharedBikeStore.set_version(LiveState.version)
+        LiveState.published_version = LiveState.version
+
+    @staticmethod
+    def get_rider_view(bike: dict) -> dict:
+        """
+        Returns the fields shown on a bike's cards, including its heart rate screening
+        """
+        upper_boundary = 220 - (bike.get('age') or 0)
+        lower_boundary = 40
+        if bike['telemetry'] > upper_boundary or (bike['telemetry'] < lower_boundary and bike['telemetry'] > 0):
+            hrt_status = 'WARNING HEART RATE AT ABNORMAL LEVEL'
+            status = 'danger'
         else:
-            return None
-    
-    @staticmethod   
-    def parse_name_log(log: str) -> str:
-        '''Parse user name from given log text'''
-        if ' [SYSTEM] data' in log:
-            return Kafka_helpers.get_value_from_user_dict(log,"name")
-
-    @staticmethod   
-    def parse_age_log(log:str) -> int:
-        '''Parse user age from given log text'''
-        if ' [SYSTEM] data' in log:
-            dob_log_string = Kafka_helpers.get_value_from_user_dict(log, 'date_of_birth')
-            dob_timestamp = pd.Timestamp(dob_log_string, unit='ms')
-            return Kafka_helpers.get_age(dob_timestamp)
-
-    @staticmethod   
-    def parse_gender_log(log:str) -> str:
-        '''Parse user gender from given log text'''
-        if ' [SYSTEM] data' in log:
-            return Kafka_helpers.get_value_from_user_dict(log,"gender")   
-    
+            hrt_status = 'Heart rate status: Okay'
+            status = 'success'
+        return {'bike': bike['bike'], 'name': bike.get('name'), 'gender': bike.get('gender'), 'age': bike.get('age'),
+            'ride': bike.get('ride'), 'telemetry': bike['telemetry'], 'hrt_status': hrt_status, 'status': status,
+            'upper_boundary': upper_boundary, 'lower_boundary': lower_boundary}
 
-    @staticmethod  
-    def parse_ride_log(log:str) -> int:
-        '''Parse user ride duration from given log text'''
-        if  '[INFO]: Ride' in log:
-            return Kafka_helpers.reg_extract_ride_duration(log)
-
-    @staticmethod  
-    def parse_telemetry_log(log):
-        if  '[INFO]: Telemetry' in log:
-            return Kafka_helpers.reg_extract_heart_rate(log)
-
-    @staticmethod  
-    def parse_new_ride(log):
-        if  '--------- beginning of main' in log:
-            return True
-    
-    @staticmethod  
-    def parse_new_log(log):
-        if  '--------- beginning of a new ride' in log:
-            return True
-    
     @staticmethod
-    def parse_logs(log):
-        ride_log = Kafka_helpers.parse_ride_log(log)
-        telemetry_log = Kafka_helpers.parse_telemetry_log(log)
-        name_log = Kafka_helpers.parse_name_log(log)
-        gender_log = Kafka_helpers.parse_gender_log(log)
-        age_log = Kafka_helpers.parse_age_log(log)
-        return ride_log, telemetry_log, name_log, gender_log,age_log
+    def stream_changes():
+        """
+        Server-sent events for one dashboard, read from the shared bike store: the full state of the active
+        riders first, then at most every LIVE_PUSH_INTERVAL_SECONDS only the fields that changed, the telemetry
+        readings appended since the last push (reset when a bike starts a new ride) and the bikes that went idle.
+        When the ingest process restarts with a new store, the full state is sent again and the bikes it no longer
+        has are removed. Sends a comment when nothing changes so proxies keep the connection open
+        """
+        sent = {}
+        sent_readings = {}
+        version = -1
+        generation = None
+        while True:
+            version, store_generation, changed_bikes, active_bikes, readings = SharedBikeStore.wait_for_change(
+                version, generation, LiveState.keep_alive_seconds, sent_readings)
+            stale = []
+            if store_generation != generation:
+                # a new store numbers its versions from 0 again, so nothing sent from the old one still holds
+                stale = list(sent)
+                sent.clear()
+                sent_readings.clear()
+                generation = store_generation
+            appended = {}
+            for bike_key, (started, count, bike_readings) in readings.items():
+                appended[bike_key] = {field: values.tolist() for field, values in zip(TelemetryRing.fields, bike_readings.round(1))}
+                appended[bike_key]['reset'] = sent_readings.get(bike_key, (None, 0))[0] != started
+                sent_readings[bike_key] = (started, count)
+            changes = {}
+            for bike_key, bike in changed_bikes.items():
+                if 'telemetry' not in bike:
+                    continue
+                view = LiveState.get_rider_view(bike)
+                previous_view = sent.get(bike_key, {})
+                changed_fields = {field: value for field, value in view.items() if previous_view.get(field) != value}
+                if changed_fields:
+                    changes[bike_key] = changed_fields
+                    sent[bike_key] = view
+            removed = [bike_key for bike_key in sent if bike_key not in active_bikes]
+            for bike_key in removed:
+                del sent[bike_key]
+            removed += [bike_key for bike_key in stale if bike_key not in sent]
+            for bike_key in [bike_key for bike_key in sent_readings if bike_key not in active_bikes]:
+                del sent_readings[bike_key]
+
+            if changes or removed or appended:
+                yield f'data: {json.dumps({"changed": changes, "removed": removed, "appended": appended, "sparkline_seconds": LiveState.sparkline_seconds})}\n\n'
+            else:
+                yield ': keep-alive\n\n'
+            time.sleep(LiveState.push_interval_seconds)
+
+
+class SharedBikeStore():
+    """
+    Latest state of every active bike in a memory-mapped file: a fixed-layout record per bike, including
+    its telemetry ring buffer. Written only by the ingest process (or thread), read by any number of dashboard
+    workers without their own Kafka consumers. A sequence number, odd while a record is being written,
+    lets readers detect and retry torn reads. Each store gets a random generation in its header, so readers
+    can tell when the ingest process has replaced it with a new one
+    """
+    path = getenv('LIVE_STORE_PATH', '/dev/shm/deloton_live_state')
+    max_bikes = int(getenv('LIVE_STORE_MAX_BIKES', 256))
+    header_dtype = np.dtype([('version', '<u8'), ('max_bikes', '<u8'), ('points', '<u8'), ('generation', '<u8')])
+    header = None
+    records = None
+    inode = None
+    # bike key to record, kept by the writer only
+    slots = {}
+    free_slots = []
 
-class transform_data():
-    
     @staticmethod
-    def get_ride_frequency(df):
+    def get_record_dtype(points: int) -> np.dtype:
         """
-        Transform df - find the number of rides over genders for the last 12 hour window
+        Returns the layout of one bike's record, with a ring buffer of the given number of readings
         """
+        return np.dtype([
+            ('seq', '<u8'), ('version', '<u8'), ('active', '<u1'),
+            ('bike', 'S32'), ('name', 'S64'), ('gender', 'S16'),
+            ('age', '<i4'), ('ride', '<i8'), ('telemetry', '<i4'),
+            ('ring_started', '<u8'), ('ring_count', '<u8'),
+            ('readings', '<f8', (len(TelemetryRing.fields), points))
+        ])
+
+    @staticmethod
+    def map(store: np.memmap) -> None:
+        """
+        Splits a mapped store file into its header and records
+        """
+        SharedBikeStore.header = store[:SharedBikeStore.header_dtype.itemsize].view(SharedBikeStore.header_dtype)
+        points = int(SharedBikeStore.header['points'][0])
+        SharedBikeStore.records = store[SharedBikeStore.header_dtype.itemsize:].view(SharedBikeStore.get_record_dtype(points))
+
+    @staticmethod
+    def create(points: int) -> None:
+        """
+        Creates an empty store for the ingest process, atomically replacing any previous one
+        """
+        record_dtype = SharedBikeStore.get_record_dtype(points)
+        size = SharedBikeStore.header_dtype.itemsize + record_dtype.itemsize * SharedBikeStore.max_bikes
+        new_path = f'{SharedBikeStore.path}.{os.getpid()}'
+        store = np.memmap(new_path, dtype=np.uint8, mode='w+', shape=(size,))
+        header = store[:SharedBikeStore.header_dtype.itemsize].view(SharedBikeStore.header_dtype)
+        header['max_bikes'] = SharedBikeStore.max_bikes
+        header['points'] = points
+        header['generation'] = uuid.uuid4().int >> 64
+        SharedBikeStore.map(store)
+        store.flush()
+        os.replace(new_path, SharedBikeStore.path)
+        SharedBikeStore.inode = os.stat(SharedBikeStore.path).st_ino
+        SharedBikeStore.slots = {}
+        SharedBikeStore.free_slots = list(range(SharedBikeStore.max_bikes - 1, -1, -1))
+        print(f'Live bike store created at {SharedBikeStore.path} ({size} bytes)')
+
+    @staticmethod
+    def attach() -> bool:
+        """
+        Maps the store read-only, mapping it again when the ingest process has replaced it.
+        Returns whether a store is available
+        """
+        try:
+            inode = os.stat(SharedBikeStore.path).st_ino
+        except FileNotFoundError:
+            return False
+        if inode != SharedBikeStore.inode:
+            SharedBikeStore.map(np.memmap(SharedBikeStore.path, dtype=np.uint8, mode='r'))
+            SharedBikeStore.inode = inode
+        return True
+
+    @staticmethod
+    def assign_slot(bike_key: str) -> Optional[int]:
+        """
+        Returns the record of a bike, assigning a free one to a new bike. None when the store is full
+        """
+        slot = SharedBikeStore.slots.get(bike_key)
+        if slot is None:
+            if not SharedBikeStore.free_slots:
+                print(f'Live bike store full, {bike_key} is not shown')
+                return None
+            slot = SharedBikeStore.free_slots.pop()
+            SharedBikeStore.slots[bike_key] = slot
+        return slot
+
+    @staticmethod
+    def encode(value, length: int) -> bytes:
+        """
+        Encodes a text field to fit its fixed-length column
+        """
+        return str(value).encode('utf-8')[:length].decode('utf-8', 'ignore').encode('utf-8') if value != None else b''
+
+    @staticmethod
+    def write_bike(bike_key: str, bike: dict, ring: TelemetryRing) -> None:
+        """
+        Writes a bike's latest state to its record, copying the readings appended to its ring buffer
+        since the last write. Everything readers see changes between the two sequence number bumps
+        """
+        slot = SharedBikeStore.slots.get(bike_key)
+        if slot is None:
+            return
+        records = SharedBikeStore.records
+        records['seq'][slot] += 1
+        records['version'][slot] = bike['version']
+        records['active'][slot] = 1
+        records['bike'][slot] = SharedBikeStore.encode(bike_key, 32)
+        records['name'][slot] = SharedBikeStore.encode(bike.get('name'), 64)
+        records['gender'][slot] = SharedBikeStore.encode(bike.get('gender'), 16)
+        records['age'][slot] = bike.get('age') if bike.get('age') != None else -1
+        records['ride'][slot] = bike.get('ride') if bike.get('ride') != None else -1
+        records['telemetry'][slot] = bike.get('telemetry') if bike.get('telemetry') != None else -1
+        published = max(ring.published, ring.count - ring.size)
+        if ring.count > published:
+            columns = np.arange(published, ring.count) % ring.size
+            records['readings'][slot][:, columns] = ring.values[:, columns]
+        ring.published = ring.count
+        records['ring_started'][slot] = ring.started
+        records['ring_count'][slot] = ring.count
+        records['seq'][slot] += 1
+
+    @staticmethod
+    def free_slot(bike_key: str, version: int) -> None:
+        """
+        Marks an evicted bike's record inactive and frees it for the next new bike
+        """
+        slot = SharedBikeStore.slots.pop(bike_key, None)
+        if slot is None:
+            return
+        records = SharedBikeStore.records
+        records['seq'][slot] += 1
+        records['active'][slot] = 0
+        records['version'][slot] = version
+        records['seq'][slot] += 1
+        SharedBikeStore.free_slots.append(slot)
+
+    @staticmethod
+    def set_version(version: int) -> None:
+        """
+        Publishes the version of the latest change, which readers poll
+        """
+        SharedBikeStore.header['version'] = version
+
+    @staticmethod
+    def read_bike(slot: int, sent_readings: dict) -> Optional[tuple]:
+        """
+        Reads a record into a bike dict, with the readings appended since those in sent_readings
+        as (ring started, ring count, readings) or None. Retries torn reads; None if the record keeps changing
+        """
+        records = SharedBikeStore.records
+        for _ in range(100):
+            seq = int(records['seq'][slot])
+            if seq % 2 == 1:
+                time.sleep(0)
+                continue
+            bike_key = records['bike'][slot].decode('utf-8')
+            bike = {'bike': bike_key, 'version': int(records['version'][slot])}
+            if records['name'][slot]:
+                bike['name'] = records['name'][slot].decode('utf-8')
+                bike['gender'] = records['gender'][slot].decode('utf-8')
+            for field in ['age', 'ride', 'telemetry']:
+                if records[field][slot] >= 0:
+                    bike[field] = int(records[field][slot])
+            started = int(records['ring_started'][slot])
+            count = int(records['ring_count'][slot])
+            sent_started, sent_count = sent_readings.get(bike_key, (None, 0))
+            readings = None
+            if sent_started != started:
+                sent_count = 0
+            if count > sent_count:
+                readings = (started, count, TelemetryRing.take(records['readings'][slot], count, sent_count))
+            if int(records['seq'][slot]) == seq:
+                return bike, readings
+        return None
 
-        df = df.loc[:,['gender']]
-        df = pd.DataFrame(df.groupby(['gender'])['gender'].count())
-        df = df.rename(columns={"gender":"ride_count"})
-        df = df.reset_index()
-        return df
-    
     @staticmethod
-    def get_age_bins(df: pd.DataFrame):
+    def wait_for_change(version: int, generation: int, timeout: float, sent_readings: dict) -> tuple:
         """
-        Segments customer age column into age bins
+        Polls the store every LIVE_PUSH_INTERVAL_SECONDS until it moves past the given version or the timeout passes.
+        Returns the current version and generation, the bikes changed since the given version, the keys of all active
+        bikes and, for each changed bike, the readings appended since those in sent_readings ((ring started, count) per
+        bike) as (ring started, ring count, readings). A store of another generation is read in full
         """
-        return pd.cut(df['age'], bins = [0,18,26,39,65,np.inf], labels=["Kids (< 18)","Young Adults (18-25)", "Adults (25-40)", "Middle Age (40-65)", "Seniors (65+)"])
+        deadline = time.monotonic() + timeout
+        while (not SharedBikeStore.attach() or (int(SharedBikeStore.header['generation'][0]) == generation
+                and int(SharedBikeStore.header['version'][0]) == version)):
+            if time.monotonic() >= deadline:
+                if SharedBikeStore.records is None:
+                    return version, generation, {}, set(), {}
+                break
+            time.sleep(LiveState.push_interval_seconds)
+
+        records = SharedBikeStore.records
+        current_version = int(SharedBikeStore.header['version'][0])
+        current_generation = int(SharedBikeStore.header['generation'][0])
+        if current_generation != generation:
+            version = -1
+            sent_readings = {}
+        active = records['active'] == 1
+        active_bikes = {bike_key.decode('utf-8') for bike_key in records['bike'][active]}
+        changed_bikes = {}
+        readings = {}
+        for slot in np.nonzero(active & (records['version'] > version))[0]:
+            result = SharedBikeStore.read_bike(int(slot), sent_readings)
+            if result is None:
+                continue
+            bike, bike_readings = result
+            changed_bikes[bike['bike']] = bike
+            if bike_readings is not None:
+                readings[bike['bike']] = bike_readings
+        return current_version, current_generation, changed_bikes, active_bikes, readings
+
+class transform_data():
+
+    age_bin_labels = ["Kids (< 18)","Young Adults (18-25)", "Adults (25-40)", "Middle Age (40-65)", "Seniors (65+)"]
     
+    @staticmethod
+    def get_ride_frequency(aggregates_df):
+        """
+        Transform SQL aggregates - the number of rides over genders for the window
+        """
+
+        df = aggregates_df[(aggregates_df['grouped_by'] == 'gender') & (aggregates_df['gender'] != 'Unknown')]
+        df = df.loc[:,['gender', 'ride_count']]
+        df = df.reset_index(drop=True)
+        return df
 
     @staticmethod
-    def get_age_frequency(df, age_bins):
+    def get_age_frequency(aggregates_df):
         """
-        Transform df - find the number of rides over ages for the last 12 hour window
+        Transform SQL aggregates - the number of rides over age bins for the window, in age order
         """
-        df = df.loc[:,['age']]
-        df = pd.DataFrame(df.groupby([age_bins])[['age']].count())
-        df = df.rename(columns={"age":"ride_count"})
+        df = aggregates_df[aggregates_df['grouped_by'] == 'age_bin'].set_index('age_bin')[['ride_count']]
+        df = df.reindex(transform_data.age_bin_labels, fill_value=0)
+        df = df.rename_axis('age')
         df = df.reset_index()
         return df
 
+    @staticmethod
+    def get_totals(aggregates_df) -> pd.Series:
+        """
+        Transform SQL aggregates - the ride count and total and average power over the whole window
+        """
+        return aggregates_df[aggregates_df['grouped_by'] == 'total'].iloc[0]
+
 class SQLConnection():
     load_dotenv()
-    db_host = getenv('DB_HOST')
-    db_port = getenv('DB_PORT')
-    db_user = getenv('DB_USER')
-    db_password = getenv('DB_PASSWORD')
-    db_name = getenv('DB_NAME')
     group_user = getenv('GROUP_USER')
     group_user_pass = getenv('GROUP_USER_PASS')
 
-    engine = create_engine(f'postgresql://{db_user}:{db_password}@{db_host}:{db_port}/{db_name}')
+    engine = Database.create_engine('dashboard')
 
     @staticmethod
     def read_query(query:str) -> Optional[List[str]]:
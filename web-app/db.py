@@ -1,26 +1,120 @@
+import json
+import threading
+import time
+from datetime import date
+from os import getenv
+
 import pandas  as pd
-import plotly.express as px
 from dashboard_helper import transform_data as td,SQLConnection as sql
-import datetime
-now = datetime.datetime.now()
 
 
-recent_rides_df = pd.DataFrame(sql.read_query("""
-SELECT ride_id, start_time,total_duration, gender, age, total_power_kilojoules FROM yusra_stories_production.rides 
-JOIN yusra_stories_production.users 
-ON rides.user_id = users.user_id 
-WHERE rides.start_time > (NOW() - INTERVAL '72 hour') 
-""")).set_index('ride_id').sort_index()
+class RecentRides():
+    """
+    Recent Rides page chart data and totals, keyed by data version (latest ride id and day) and rebuilt by a background thread whenever a new ride
+    has been added to the daily rollup (or the day rolls over) since the last refresh
+    """
+    lock = threading.Lock()
+    refresh_seconds = float(getenv('RECENT_RIDES_REFRESH_SECONDS', 30))
+    cache = None
+    watermark = None
+    refresher = None
+
+    @staticmethod
+    def start_refresher() -> threading.Thread:
+        """
+        Starts the background refresher thread, once per process
+        """
+        with RecentRides.lock:
+            if RecentRides.refresher is None:
+                RecentRides.refresher = threading.Thread(target=RecentRides.refresh_forever, name='recent-rides-refresher', daemon=True)
+                RecentRides.refresher.start()
+        return RecentRides.refresher
+
+    @staticmethod
+    def refresh_forever() -> None:
+        """
+        Checks for new rides every RECENT_RIDES_REFRESH_SECONDS, keeping the last good cache if a refresh fails
+        """
+        while True:
+            try:
+                RecentRides.refresh()
+            except Exception as e:
+                print(f'Recent rides refresh failed: {e}')
+            time.sleep(RecentRides.refresh_seconds)
+
+    @staticmethod
+    def get_watermark() -> tuple:
+        """
+        Returns the latest ride id counted in the daily rollup and today's date: the cache is stale once either moves.
+        The ride id is read from the rollup's own rides table, which is written in the same transaction as the rollup
+        rows, so the watermark never gets ahead of the aggregates
+        """
+        latest_ride = sql.read_query("""
+        SELECT MAX(ride_id) AS latest_ride_id FROM yusra_stories_production.daily_rollup_rides
+        """)
+        return latest_ride['latest_ride_id'][0], date.today()
+
+    @staticmethod
+    def refresh() -> bool:
+        """
+        Rebuilds the cache if new rides have landed since the last refresh. Returns whether it was rebuilt
+        """
+        watermark = RecentRides.get_watermark()
+        if watermark == RecentRides.watermark:
+            return False
+
+        cache = RecentRides.build(RecentRides.get_recent_aggregates(), f'{watermark[0]}-{watermark[1].isoformat()}')
+        with RecentRides.lock:
+            RecentRides.cache = cache
+            RecentRides.watermark = watermark
+        print(f'Recent rides refreshed up to ride_id {watermark[0]}')
+        return True
+
+    @staticmethod
+    def get_recent_aggregates() -> pd.DataFrame:
+        """
+        Aggregates the last three days of the daily rollup in Postgres, in one query: rides and power
+        by gender, by age bin and in total (told apart by grouped_by), so only a few rows are transferred
+        """
+        return pd.DataFrame(sql.read_query("""
+        SELECT CASE GROUPING(gender, age_bin) WHEN 1 THEN 'gender' WHEN 2 THEN 'age_bin' ELSE 'total' END AS grouped_by,
+        gender, age_bin, CAST(COALESCE(SUM(ride_count), 0) AS BIGINT) AS ride_count,
+        CAST(ROUND(CAST(COALESCE(SUM(total_power_kilojoules), 0) AS NUMERIC), 2) AS DOUBLE PRECISION) AS total_power_kilojoules,
+        CAST(ROUND(CAST(COALESCE(SUM(total_power_kilojoules) / NULLIF(SUM(ride_count), 0), 0) AS NUMERIC), 2) AS DOUBLE PRECISION) AS avg_power_kilojoules
+        FROM yusra_stories_production.daily_rollup
+        WHERE day >= CURRENT_DATE - 2
+        GROUP BY GROUPING SETS ((gender), (age_bin), ())
+        """))
 
-ride_frequency_df = td.get_ride_frequency(recent_rides_df)
-age_bins = td.get_age_bins(recent_rides_df)
-age_frequency_df = td.get_age_frequency(recent_rides_df, age_bins)
+    @staticmethod
+    def build(recent_aggregates_df: pd.DataFrame, version: str) -> dict:
+        """
+        Builds the Recent Rides chart data and power totals from the recent SQL aggregates.
+        The chart data is serialized to JSON once per data version; the figures are styled
+        in the browser by the clientside callbacks in assets/recent_rides.js
+        """
+        ride_frequency_df = td.get_ride_frequency(recent_aggregates_df)
+        age_frequency_df = td.get_age_frequency(recent_aggregates_df)
+        totals = td.get_totals(recent_aggregates_df)
 
-ride_frequency = px.pie(ride_frequency_df , values='ride_count', names='gender', color_discrete_sequence=px.colors.sequential.Greens_r)
-ride_frequency.update_layout( title = 'Ride frequency by gender over the last 12 hours', legend_title_text='User Gender')
-age_distribution = px.bar(age_frequency_df,  x="age", y="ride_count", barmode="group", labels={'ride_count': 'Number of rides', 'age':'Rider age'}, title = ' Age distribution of Deloton rider over the last 12 hours ',color_discrete_sequence=px.colors.sequential.Greens_r)
+        figures_json = json.dumps({
+            'version': version,
+            'ride_frequency': {'gender': ride_frequency_df['gender'].tolist(), 'ride_count': ride_frequency_df['ride_count'].tolist()},
+            'age_distribution': {'age': age_frequency_df['age'].tolist(), 'ride_count': age_frequency_df['ride_count'].tolist()}
+        })
 
-total_power_output = recent_rides_df['total_power_kilojoules'].sum().round(2)
-avg_power_output = recent_rides_df['total_power_kilojoules'].mean().round(2)
+        total_power_output = float(totals['total_power_kilojoules'])
+        avg_power_output = float(totals['avg_power_kilojoules'])
 
+        return {'version': version, 'figures_json': figures_json,
+            'total_power_output': total_power_output, 'avg_power_output': avg_power_output}
 
+    @staticmethod
+    def get_cache() -> dict:
+        """
+        Returns the cached chart data and totals, building them on the spot before the first refresh
+        """
+        if RecentRides.cache is None:
+            RecentRides.refresh()
+        with RecentRides.lock:
+            return RecentRides.cache
@@ -0,0 +1,6 @@
+from dashboard_helper import LiveState
+
+
+if __name__ == "__main__":
+    # single Kafka consumer feeding the shared bike store read by every dashboard worker
+    LiveState.read_forever()
@@ -1,26 +1,42 @@
 import dash_bootstrap_components as dbc
-import datetime
-from dash import dcc, html, register_page
+from dash import ClientsideFunction, Input, Output, clientside_callback, dcc, html, register_page
 
-from db import ride_frequency, age_distribution, total_power_output ,avg_power_output 
+from db import RecentRides
 
-now = datetime.datetime.now().hour
+RecentRides.start_refresher()
 
 register_page(__name__)
 
-recent_ride_stats = dbc.Card(
-    dbc.CardBody(
-        [
-            html.H4(children='Recent ride', style = {'text-align':'center'}),
-            html.Hr(),
-            html.P(children=f'Total power output (kJ): {total_power_output}', style = {'font-weight': 'bold', 'text-align':'center'}),
-            html.P(children=f'Average power output (kJ): {avg_power_output}', style = {'font-weight': 'bold', 'text-align':'center'}),
-            dcc.Graph(id='graph-output-1',figure=ride_frequency, style = {'font-weight': 'bold'}),
-            dcc.Graph(id='graph-output-2',figure=age_distribution, style = {'font-weight': 'bold'})
-        ]
-    ))
-
-layout = html.Div(children = [recent_ride_stats])
-
-
 
+def layout(**kwargs):
+    """
+    Builds the page from the cached recent rides chart data on every visit
+    """
+    recent_rides = RecentRides.get_cache()
+
+    recent_ride_stats = dbc.Card(
+        dbc.CardBody(
+            [
+                html.H4(children='Recent ride', style = {'text-align':'center'}),
+                html.Hr(),
+                html.P(children=f'Total power output (kJ): {recent_rides["total_power_output"]}', style = {'font-weight': 'bold', 'text-align':'center'}),
+                html.P(children=f'Average power output (kJ): {recent_rides["avg_power_output"]}', style = {'font-weight': 'bold', 'text-align':'center'}),
+                dcc.Store(id='recent-rides-figures', data=recent_rides['figures_json']),
+                dcc.Graph(id='graph-output-1', style = {'font-weight': 'bold'}),
+                dcc.Graph(id='graph-output-2', style = {'font-weight': 'bold'})
+            ]
+        ))
+
+    return html.Div(children = [recent_ride_stats])
+
+
+# the figures are styled in the browser, see assets/recent_rides.js
+clientside_callback(
+    ClientsideFunction(namespace='recent_rides', function_name='ride_frequency_figure'),
+    Output('graph-output-1', 'figure'),
+    Input('recent-rides-figures', 'data'))
+
+clientside_callback(
+    ClientsideFunction(namespace='recent_rides', function_name='age_distribution_figure'),
+    Output('graph-output-2', 'figure'),
+    Input('recent-rides-figures', 'data'))
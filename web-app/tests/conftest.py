@@ -0,0 +1,10 @@
+import os
+import sys
+
+# the service runs from its own directory with the repository root on the path for shared
+service_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [service_dir, os.path.dirname(service_dir)]
+
+# the database engine is created on import but never connected to in these tests
+for name, value in {'DB_HOST': 'localhost', 'DB_PORT': '5432', 'DB_USER': 'test', 'DB_PASSWORD': 'test', 'DB_NAME': 'test'}.items():
+    os.environ.setdefault(name, value)
@@ -0,0 +1,81 @@
+import json
+import multiprocessing
+
+import pytest
+
+from dashboard_helper import LiveState, SharedBikeStore
+
+SYSTEM_LOG = ('2022-10-13 10:07:41.705773 mendoza v9: [SYSTEM] data = {"user_id": 3962, "name": "Katherine Goodwin", '
+    '"gender": "female", "date_of_birth": -208310400000, "bike_serial": "SN0000"}')
+
+
+def telemetry_log(heart_rate: int) -> str:
+    return f'2022-10-13 10:07:42.707362 mendoza v9: [INFO]: Telemetry - hrt = {heart_rate}; rpm = 49; power = 11.6'
+
+
+def ingest(bike_keys: list, heart_rates: list):
+    """
+    A fresh ingest process: creates a new store and publishes a ride on each bike
+    """
+    SharedBikeStore.create(LiveState.sparkline_points)
+    for bike_key in bike_keys:
+        LiveState.apply_log(bike_key, SYSTEM_LOG, 1.0)
+        for i, heart_rate in enumerate(heart_rates):
+            LiveState.apply_log(bike_key, telemetry_log(heart_rate), 2.0 + i)
+    LiveState.publish()
+
+
+def start_ingest(bike_keys: list, heart_rates: list):
+    process = multiprocessing.get_context('fork').Process(target=ingest, args=(bike_keys, heart_rates))
+    process.start()
+    process.join()
+    assert process.exitcode == 0
+
+
+def next_update(stream) -> dict:
+    event = next(stream)
+    assert event.startswith('data: '), event
+    return json.loads(event[len('data: '):])
+
+
+@pytest.fixture
+def stream(monkeypatch, tmp_path):
+    monkeypatch.setattr(SharedBikeStore, 'path', str(tmp_path / 'live_state'))
+    monkeypatch.setattr(LiveState, 'push_interval_seconds', 0.01)
+    monkeypatch.setattr(LiveState, 'keep_alive_seconds', 0.5)
+    start_ingest(['SN0001'], [120, 121])
+    stream = LiveState.stream_changes()
+    yield stream
+    stream.close()
+
+
+def test_stream_starts_with_the_full_state(stream):
+    update = next_update(stream)
+    assert list(update['changed']) == ['SN0001']
+    assert update['changed']['SN0001']['telemetry'] == 121
+    assert update['appended']['SN0001']['hrt'] == [120, 121]
+    assert update['removed'] == []
+    assert next(stream) == ': keep-alive\n\n'
+
+
+def test_stream_sends_the_new_store_after_an_ingest_restart(stream):
+    next_update(stream)
+    # the new store numbers its versions from 0 again, below the version the stream has seen
+    start_ingest(['SN0002'], [130])
+    update = next_update(stream)
+    assert list(update['changed']) == ['SN0002']
+    assert update['changed']['SN0002']['name'] == 'Katherine Goodwin'
+    assert update['appended']['SN0002'] == {'t': [2.0], 'hrt': [130.0], 'rpm': [49.0], 'power': [11.6], 'reset': True}
+    assert update['removed'] == ['SN0001']
+
+
+def test_stream_resends_bikes_still_riding_after_an_ingest_restart(stream):
+    next_update(stream)
+    # same bike and same number of changes, so the new store ends on the version the stream has seen
+    start_ingest(['SN0001'], [140, 141])
+    update = next_update(stream)
+    assert update['changed']['SN0001']['telemetry'] == 141
+    assert update['changed']['SN0001']['bike'] == 'SN0001'
+    assert update['appended']['SN0001']['hrt'] == [140, 141]
+    assert update['appended']['SN0001']['reset'] is True
+    assert update['removed'] == []